@@ -0,0 +1,218 @@
+"""
+Правила оповещений и их инкрементальная проверка.
+Правила проиндексированы по метрике: новое значение проверяется только правилами своей метрики,
+поэтому стоимость такта не зависит от общего числа правил.
+Для пороговых правил хранится состояние (хост, метрика): оповещение отправляется только
+при переходе в тревогу и обратно, с гистерезисом (порог снятия clear).
+События журналов (event:тип) оповещают один раз за dedup_seconds для одного ключа.
+"""
+import os
+import json
+import time
+import operator
+import threading
+import logging
+from typing import NamedTuple
+from dataclasses import dataclass
+from collections import defaultdict
+
+from message_chunks import split_chunks
+
+logger = logging.getLogger(__name__)
+
+OPERATORS = {'>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le}
+
+EVENT_PREFIX = 'event:'
+
+
+@dataclass(slots=True)
+class Rule:
+    """
+    metric - имя метрики ('mem'), шаблон с '*' на конце ('disk:*') или тип события ('event:journal_crit');
+    op, threshold - условие тревоги; clear - порог снятия тревоги (по умолчанию равен threshold);
+    hosts - имена хостов, к которым применяется правило (пусто - ко всем).
+    """
+    name: str
+    metric: str
+    op: str = '>'
+    threshold: float = 0.0
+    clear: float = None
+    hosts: frozenset = frozenset()
+
+    def fires(self, value):
+        return OPERATORS[self.op](value, self.threshold)
+
+    def clears(self, value):
+        return not OPERATORS[self.op](value, self.threshold if self.clear is None else self.clear)
+
+
+class Alert(NamedTuple):
+    host: str
+    rule: str
+    status: str  # firing, resolved или event
+    text: str
+
+
+DEFAULT_RULES = [
+        Rule('disk-full', 'disk:*', '>=', 90, 85),
+        Rule('memory-high', 'mem', '>=', 95, 90),
+        Rule('cpu-high', 'cpu', '>=', 95, 80),
+        Rule('journal-crit', 'event:journal_crit'),
+        Rule('repl-disconnection', 'event:repl_disconnection'),
+        Rule('ssh-unknown-ip', 'event:ssh_unknown_ip'),
+        ]
+
+
+def load_rules(spec):
+    """
+    Правила из JSON-файла или JSON-строки (ALERT_RULES):
+    [{"name": "disk-full", "metric": "disk:*", "op": ">=", "threshold": 90, "clear": 85, "hosts": ["db1"]}]
+    Без spec - DEFAULT_RULES.
+    """
+    if not spec:
+        return list(DEFAULT_RULES)
+    if os.path.exists(spec):
+        with open(spec) as f:
+            spec = f.read()
+    rules = []
+    for entry in json.loads(spec):
+        entry['hosts'] = frozenset(entry.get('hosts', ()))
+        if entry.get('op', '>') not in OPERATORS:
+            raise ValueError(f"Неизвестный оператор в правиле {entry.get('name')}: {entry['op']}")
+        rules.append(Rule(**entry))
+    return rules
+
+
+class AlertEngine:
+    """Проверка новых значений метрик и событий журналов по правилам с учётом заглушек."""
+
+    def __init__(self, rules, dedup_seconds=3600):
+        self.dedup_seconds = dedup_seconds
+        self.lock = threading.Lock()
+        self.__exact = defaultdict(list)  # метрика -> правила
+        self.__prefix = defaultdict(list)  # 'disk:' -> правила вида 'disk:*'
+        for rule in rules:
+            if rule.metric.endswith('*'):
+                self.__prefix[rule.metric[:-1]].append(rule)
+            else:
+                self.__exact[rule.metric].append(rule)
+        self.__firing = {}  # (правило, хост, метрика) -> значение при срабатывании
+        self.__seen = {}  # (правило, хост, ключ события) -> время оповещения
+        self.__silences = {}  # правило, хост или '*' -> до какого времени
+        self.rules_count = len(rules)
+
+    def __rules(self, metric):
+        rules = self.__exact.get(metric, [])
+        head, sep, _ = metric.partition(':')
+        if sep and head + ':' in self.__prefix:
+            rules = rules + self.__prefix[head + ':']
+        return rules
+
+    def __silenced(self, rule, host, now):
+        return any(self.__silences.get(target, 0) > now for target in (rule.name, host, '*'))
+
+    def on_sample(self, host, values, now=None):
+        """Новый замер хоста {метрика: значение} -> оповещения о переходах состояний."""
+        now = now or time.time()
+        alerts = []
+        with self.lock:
+            for metric, value in values.items():
+                for rule in self.__rules(metric):
+                    if rule.hosts and host not in rule.hosts:
+                        continue
+                    key = (rule.name, host, metric)
+                    if key not in self.__firing and rule.fires(value):
+                        self.__firing[key] = value
+                        status = 'firing'
+                    elif key in self.__firing and rule.clears(value):
+                        del self.__firing[key]
+                        status = 'resolved'
+                    else:
+                        continue
+                    # состояние меняется и под заглушкой - после её снятия не будет лавины оповещений
+                    if not self.__silenced(rule, host, now):
+                        alerts.append(Alert(host, rule.name, status,
+                                            f'{metric} = {value:.1f} ({rule.op} {rule.threshold:g})'))
+        return alerts
+
+    def on_event(self, host, kind, key, text, now=None):
+        """Событие журнала типа kind; key - по нему повторы в течение dedup_seconds отбрасываются."""
+        now = now or time.time()
+        alerts = []
+        with self.lock:
+            for rule in self.__rules(EVENT_PREFIX + kind):
+                if rule.hosts and host not in rule.hosts:
+                    continue
+                seen_key = (rule.name, host, key)
+                if now - self.__seen.get(seen_key, 0) < self.dedup_seconds:
+                    continue
+                self.__seen[seen_key] = now
+                if not self.__silenced(rule, host, now):
+                    alerts.append(Alert(host, rule.name, 'event', text))
+            if len(self.__seen) > 10000:
+                self.__seen = {item: ts for item, ts in self.__seen.items() if now - ts < self.dedup_seconds}
+        return alerts
+
+    def silence(self, target, seconds):
+        """Заглушает правило, хост или всё ('*') на seconds секунд; 0 - снять заглушку."""
+        with self.lock:
+            if seconds:
+                self.__silences[target] = time.time() + seconds
+            else:
+                self.__silences.pop(target, None)
+
+    def silences(self):
+        now = time.time()
+        with self.lock:
+            return {target: until for target, until in self.__silences.items() if until > now}
+
+    def firing(self):
+        with self.lock:
+            return [(rule, host, metric, value) for (rule, host, metric), value in self.__firing.items()]
+
+
+class Notifier:
+    """
+    Отправка оповещений не чаще per_minute сообщений в минуту.
+    Оповещения одного такта объединяются в одно сообщение; не отправленные из-за
+    ограничения считаются и упоминаются в следующем сообщении.
+    """
+
+    ICONS = {'firing': '🔴', 'resolved': '🟢', 'event': '⚠️'}
+
+    def __init__(self, send, per_minute=20):
+        self.send = send
+        self.per_minute = per_minute
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self.suppressed = 0
+        self.sent = 0
+        self.lock = threading.Lock()
+
+    def __take(self):
+        now = time.monotonic()
+        self.tokens = min(self.per_minute, self.tokens + (now - self.updated) * self.per_minute / 60)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def push(self, alerts):
+        if not alerts:
+            return
+        lines = [f'{self.ICONS[alert.status]} {alert.host} {alert.rule}: {alert.text}\n' for alert in alerts]
+        with self.lock:
+            if self.suppressed:
+                lines.append(f'(пропущено оповещений: {self.suppressed})\n')
+            for chunk in split_chunks(lines):
+                if not self.__take():
+                    self.suppressed += sum(1 for line in chunk.splitlines() if not line.startswith('('))
+                    logger.warning(f'Оповещения отброшены ограничением частоты: {self.suppressed}')
+                    continue
+                try:
+                    self.send(chunk)
+                    self.sent += 1
+                    self.suppressed = 0
+                except Exception as error:
+                    logger.error(f'Оповещение не отправлено: {error}')
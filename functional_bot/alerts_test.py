@@ -0,0 +1,122 @@
+"""
+Тесты оповещений: пороги с гистерезисом, заглушки, повторы событий
+и чтение журнала по курсору, когда journalctl курсор не вернул.
+
+Запуск:
+    python -m pytest alerts_test.py
+"""
+import shlex
+
+from alerts import AlertEngine, Rule
+from log_query import LogQuery
+from log_tail import JournalTail
+
+NOW = 1729400000
+
+
+def test_threshold_fires_once_and_clears_below_clear_level():
+    engine = AlertEngine([Rule('memory-high', 'mem', '>=', 95, 90)])
+    assert [alert.status for alert in engine.on_sample('db1', {'mem': 96})] == ['firing']
+    # пока значение выше порога снятия, повторных оповещений нет
+    assert engine.on_sample('db1', {'mem': 97}) == []
+    assert engine.on_sample('db1', {'mem': 92}) == []
+    assert engine.firing() == [('memory-high', 'db1', 'mem', 96)]
+    assert [alert.status for alert in engine.on_sample('db1', {'mem': 89})] == ['resolved']
+    assert engine.on_sample('db1', {'mem': 89}) == []
+    assert engine.firing() == []
+
+
+def test_prefix_rule_tracks_each_metric_and_host_filter():
+    engine = AlertEngine([Rule('disk-full', 'disk:*', '>=', 90, 85, frozenset({'db1'}))])
+    alerts = engine.on_sample('db1', {'disk:/': 91, 'disk:/var': 95, 'disk': 95, 'mem': 99})
+    assert sorted(alert.text.split()[0] for alert in alerts) == ['disk:/', 'disk:/var']
+    assert engine.on_sample('web1', {'disk:/': 99}) == []
+    assert [alert.status for alert in engine.on_sample('db1', {'disk:/': 84, 'disk:/var': 88})] == ['resolved']
+
+
+def test_less_than_rule_hysteresis():
+    engine = AlertEngine([Rule('conns-low', 'conns', '<', 2, 5)])
+    assert [alert.status for alert in engine.on_sample('db1', {'conns': 1})] == ['firing']
+    assert engine.on_sample('db1', {'conns': 3}) == []
+    assert [alert.status for alert in engine.on_sample('db1', {'conns': 5})] == ['resolved']
+
+
+def test_silenced_transitions_are_tracked_but_not_sent():
+    engine = AlertEngine([Rule('cpu-high', 'cpu', '>=', 95, 80)])
+    engine.silence('db1', 60)
+    assert engine.on_sample('db1', {'cpu': 99}) == []
+    engine.silence('db1', 0)
+    # тревога уже учтена под заглушкой: после снятия заглушки повтора нет
+    assert engine.on_sample('db1', {'cpu': 99}) == []
+    assert [alert.status for alert in engine.on_sample('db1', {'cpu': 10})] == ['resolved']
+
+
+def test_events_deduplicated_by_key():
+    engine = AlertEngine([Rule('journal-crit', 'event:journal_crit')], dedup_seconds=3600)
+    assert len(engine.on_event('db1', 'journal_crit', 'disk failure', 'line 1', now=NOW)) == 1
+    assert engine.on_event('db1', 'journal_crit', 'disk failure', 'line 2', now=NOW + 1000) == []
+    assert len(engine.on_event('db1', 'journal_crit', 'oom', 'line 3', now=NOW + 1000)) == 1
+    assert len(engine.on_event('db2', 'journal_crit', 'disk failure', 'line 4', now=NOW + 1000)) == 1
+    assert len(engine.on_event('db1', 'journal_crit', 'disk failure', 'line 5', now=NOW + 4000)) == 1
+
+
+class FakeJournal:
+    """
+    journalctl на хосте: записи (курсор, строка). Как в старых версиях systemd,
+    курсор печатается только вместе с записями.
+    """
+
+    def __init__(self, entries=()):
+        self.entries = list(entries)
+        self.commands = []
+
+    def run(self, command):
+        self.commands.append(command)
+        args = shlex.split(command)
+        after = [arg.split('=', 1)[1] for arg in args if arg.startswith('--after-cursor=')]
+        if after:
+            cursors = [cursor for cursor, _ in self.entries]
+            shown = self.entries[cursors.index(after[0]) + 1:]
+        elif '-n' in args:
+            count = int(args[args.index('-n') + 1])
+            shown = self.entries[len(self.entries) - count:] if count else []
+        else:
+            shown = self.entries
+        if not shown:
+            return b''
+        return ''.join(f'{line}\n' for _, line in shown).encode() + f'-- cursor: {shown[-1][0]}\n'.encode()
+
+
+def test_first_read_without_cursor_still_alerts_later(tmp_path):
+    journal = FakeJournal()
+    tail = JournalTail(str(tmp_path))
+    engine = AlertEngine([Rule('journal-crit', 'event:journal_crit')])
+
+    def poll(query):
+        alerts = []
+        for line in tail.read_new(journal.run, 'db1', query):
+            alerts += engine.on_event('db1', 'journal_crit', line, line)
+        return alerts
+
+    query = LogQuery(priority='crit')
+    # пустой журнал: курсора нет, позиция будет запомнена при следующем опросе
+    assert poll(query) == []
+    journal.entries.append(('c1', '2024-10-20T10:00:00+0300 db1 systemd[1]: Started session'))
+    assert poll(query) == []
+    assert '-n 1' in journal.commands[-1] and '-p' not in shlex.split(journal.commands[-1])
+    journal.entries.append(('c2', '2024-10-20T10:01:00+0300 db1 kernel: disk failure'))
+    alerts = poll(query)
+    assert [alert.text for alert in alerts] == ['2024-10-20T10:01:00+0300 db1 kernel: disk failure']
+    assert '--after-cursor=c1' in journal.commands[-1]
+    # курсор переживает перезапуск бота
+    assert JournalTail(str(tmp_path)).read_new(journal.run, 'db1', query) == []
+    assert '--after-cursor=c2' in journal.commands[-1]
+
+
+def test_first_read_skips_existing_entries(tmp_path):
+    journal = FakeJournal([('c1', 'old crit 1'), ('c2', 'old crit 2')])
+    tail = JournalTail(str(tmp_path))
+    assert tail.read_new(journal.run, 'db1', LogQuery(priority='crit')) == []
+    journal.entries.append(('c3', 'new crit'))
+    assert tail.read_new(journal.run, 'db1', LogQuery(priority='crit')) == ['new crit']
+
@@ -0,0 +1,189 @@
+import time
+import threading
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from ssh_pool import CommandTimeout, CommandCancelled
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+def current_job():
+    """Возвращает задачу, которая выполняется в текущем потоке (или None)."""
+    return getattr(_local, 'job', None)
+
+
+class Job:
+    """Одна команда пользователя, поставленная в очередь чата."""
+
+    def __init__(self, chat_id, callback, update, context, timeout):
+        self.chat_id = chat_id
+        self.callback = callback
+        self.update = update
+        self.context = context
+        self.timeout = timeout
+        self.cancelled = threading.Event()
+        self.submitted = time.monotonic()
+        self.started = None
+
+    def remaining(self):
+        """Сколько секунд осталось до истечения таймаута команды."""
+        if not self.timeout or self.started is None:
+            return self.timeout
+        return max(self.timeout - (time.monotonic() - self.started), 0.001)
+
+
+class CommandExecutor:
+    """
+    Выполняет команды бота на ограниченном пуле потоков.
+    Команды одного чата выполняются строго по очереди, команды разных чатов - параллельно.
+    """
+
+    def __init__(self, workers=4, default_timeout=60):
+        self.default_timeout = default_timeout
+        self.__pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='command')
+        self.__lock = threading.Lock()
+        self.__queues = {}  # chat_id -> deque ожидающих задач
+        self.__running = {}  # chat_id -> выполняемая задача
+        self.__stats = {
+                'submitted'    : 0,
+                'started'      : 0,
+                'completed'    : 0,
+                'timeouts'     : 0,
+                'cancelled'    : 0,
+                'errors'       : 0,
+                'wait_total'   : 0.0,
+                'wait_max'     : 0.0,
+                'max_depth'    : 0,
+                }
+
+    def wrap(self, callback, timeout=None, returns=None):
+        """
+        Оборачивает обработчик так, чтобы он выполнялся через очередь чата.
+        returns - значение, которое сразу получает диспетчер (например, состояние ConversationHandler).
+        """
+
+        def handler(update, context):
+            self.submit(update.effective_chat.id, callback, update, context, timeout)
+            return returns
+
+        handler.__name__ = callback.__name__
+        return handler
+
+    def submit(self, chat_id, callback, update, context, timeout=None):
+        job = Job(chat_id, callback, update, context, timeout or self.default_timeout)
+        with self.__lock:
+            self.__stats['submitted'] += 1
+            queue = self.__queues.setdefault(chat_id, deque())
+            queue.append(job)
+            self.__stats['max_depth'] = max(self.__stats['max_depth'], self.__depth())
+            # если чат уже обслуживается, задача будет взята тем же воркером
+            start = chat_id not in self.__running
+            if start:
+                self.__running[chat_id] = None
+        if start:
+            self.__pool.submit(self.__drain, chat_id)
+        return job
+
+    def __depth(self):
+        return sum(len(queue) for queue in self.__queues.values())
+
+    def __drain(self, chat_id):
+        try:
+            while True:
+                with self.__lock:
+                    queue = self.__queues.get(chat_id)
+                    if not queue:
+                        self.__queues.pop(chat_id, None)
+                        self.__running.pop(chat_id, None)
+                        return
+                    job = queue.popleft()
+                    self.__running[chat_id] = job
+                    job.started = time.monotonic()
+                    self.__stats['started'] += 1
+                    wait = job.started - job.submitted
+                    self.__stats['wait_total'] += wait
+                    self.__stats['wait_max'] = max(self.__stats['wait_max'], wait)
+                self.__run(job)
+        except BaseException:
+            # чат не должен остаться помеченным как обслуживаемый: оставшиеся задачи берёт новый воркер
+            with self.__lock:
+                restart = bool(self.__queues.get(chat_id))
+                if restart:
+                    self.__running[chat_id] = None
+                else:
+                    self.__queues.pop(chat_id, None)
+                    self.__running.pop(chat_id, None)
+            if restart:
+                self.__pool.submit(self.__drain, chat_id)
+            raise
+
+    def __run(self, job):
+        logger.info(f'Start {job.callback.__name__} chat={job.chat_id}')
+        _local.job = job
+        try:
+            job.callback(job.update, job.context)
+            self.__count('completed')
+        except CommandCancelled:
+            self.__count('cancelled')
+            logger.info(f'Cancelled {job.callback.__name__} chat={job.chat_id}')
+        except CommandTimeout:
+            self.__count('timeouts')
+            logger.warning(f'Timeout {job.callback.__name__} chat={job.chat_id}')
+            self.__reply(job, f'Команда не выполнена за {job.timeout} с.')
+        except Exception as error:
+            self.__count('errors')
+            logger.error(f'Ошибка в {job.callback.__name__}: {error}')
+            self.__reply(job, 'Ошибка при выполнении команды.')
+        finally:
+            _local.job = None
+        logger.info(f'Stop {job.callback.__name__} chat={job.chat_id}')
+
+    @staticmethod
+    def __reply(job, text):
+        """Сообщение об ошибке команды; сбой отправки не должен останавливать очередь чата."""
+        try:
+            job.update.effective_message.reply_text(text)
+        except Exception as error:
+            logger.error(f'Не удалось отправить сообщение chat={job.chat_id}: {error}')
+
+    def __count(self, name):
+        with self.__lock:
+            self.__stats[name] += 1
+
+    def cancel(self, chat_id):
+        """Снимает с очереди ожидающие команды чата и прерывает выполняемую. Возвращает их число."""
+        with self.__lock:
+            queue = self.__queues.get(chat_id) or deque()
+            dropped = len(queue)
+            queue.clear()
+            # снятые с очереди задачи считаем сразу, выполняемая посчитается при прерывании
+            self.__stats['cancelled'] += dropped
+            job = self.__running.get(chat_id)
+            if job is not None and not job.cancelled.is_set():
+                job.cancelled.set()
+                dropped += 1
+        return dropped
+
+    def stats(self):
+        """Метрики очереди: глубина, время ожидания, число завершённых/прерванных команд."""
+        with self.__lock:
+            stats = dict(self.__stats)
+            stats['queue_depth'] = self.__depth()
+            stats['running'] = sum(job is not None for job in self.__running.values())
+            stats['wait_avg'] = stats['wait_total'] / stats['started'] if stats['started'] else 0.0
+        return stats
+
+    def shutdown(self):
+        logger.info(f'Start {self.shutdown.__name__}')
+        with self.__lock:
+            for queue in self.__queues.values():
+                queue.clear()
+            for job in self.__running.values():
+                if job is not None:
+                    job.cancelled.set()
+        self.__pool.shutdown(wait=True)
+        logger.info(f'Stop {self.shutdown.__name__}')
@@ -0,0 +1,74 @@
+import threading
+import logging
+from contextlib import contextmanager
+
+from psycopg2 import sql
+from psycopg2.pool import ThreadedConnectionPool
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger(__name__)
+
+
+class Database:
+    """
+    Общий доступ к PostgreSQL через пул соединений.
+    Пул создаётся при первом обращении, соединения переиспользуются между командами.
+    """
+
+    def __init__(self, host, port, user, password, database, minconn=1, maxconn=4):
+        self.__params = dict(host=host, port=port, user=user, password=password, database=database)
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.__pool = None
+        self.__lock = threading.Lock()
+
+    def __get_pool(self):
+        with self.__lock:
+            if self.__pool is None:
+                logger.info('Создание пула соединений с PostgreSQL')
+                self.__pool = ThreadedConnectionPool(self.minconn, self.maxconn, **self.__params)
+            return self.__pool
+
+    @contextmanager
+    def connection(self):
+        """Соединение из пула: commit при успехе, rollback при ошибке."""
+        pool = self.__get_pool()
+        connection = pool.getconn()
+        try:
+            yield connection
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            pool.putconn(connection)
+
+    def insert_unique(self, table, column, values, page_size=1000):
+        """
+        Добавляет значения одним пакетным параметризованным запросом.
+        Повторы (в самих данных и уже имеющиеся в таблице) пропускаются.
+        Возвращает (добавлено, пропущено).
+        """
+        logger.info(f'Start {self.insert_unique.__name__} {table}.{column}')
+        values = [value for value in values if value]
+        unique = list(dict.fromkeys(values))
+        if not unique:
+            return 0, len(values)
+        # повторы отсекаются самим запросом, а не уникальным индексом, которого в схеме может не быть;
+        # блокировка не даёт параллельной вставке добавить то же значение между проверкой и записью
+        query = sql.SQL('INSERT INTO {table} ({column}) '
+                        'SELECT new.value FROM (VALUES %s) AS new (value) '
+                        'WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {column} = new.value) '
+                        'RETURNING 1').format(table=sql.Identifier(table), column=sql.Identifier(column))
+        with self.connection() as connection, connection.cursor() as cursor:
+            cursor.execute(sql.SQL('LOCK TABLE {} IN SHARE ROW EXCLUSIVE MODE').format(sql.Identifier(table)))
+            rows = execute_values(cursor, query, [(value,) for value in unique], page_size=page_size, fetch=True)
+        inserted = len(rows)
+        logger.info(f'Stop {self.insert_unique.__name__} {table}.{column}: {inserted}/{len(values)}')
+        return inserted, len(values) - inserted
+
+    def close(self):
+        with self.__lock:
+            if self.__pool is not None:
+                self.__pool.closeall()
+                self.__pool = None
@@ -0,0 +1,76 @@
+"""
+Общий реестр регулярных выражений бота.
+Все шаблоны компилируются один раз при импорте модуля,
+шаблоны, зависящие от даты, строятся фабриками с кэшем.
+"""
+import re
+from functools import lru_cache
+
+### 1. Поиск информации в тексте.
+
+# формат email-адресов
+EMAIL = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,3}')
+
+# Различные варианты записи номеров телефона:
+# 8XXXXXXXXXX, 8(XXX)XXXXXXX, 8 XXX XXX XX XX, 8 (XXX) XXX XX XX, 8-XXX-XXX-XX-XX,
+# вместо ‘8’ на первом месте может быть ‘+7’.
+PHONE = re.compile(r'(\+7|8)(\s?[(-]?\d{3}[)-]?\s?\d{3}-?\s?\d{2}-?\s?\d{2})')
+
+### 2. Проверка сложности пароля:
+# не менее восьми символов, заглавная и строчная буквы, цифра и специальный символ !@#$%^&*().
+PASSWORD = re.compile(r'(?=.*[A-Z])(?=.*[a-z])(?=.*\d)(?=.*[@$!%*#?&])[A-Za-z\d@$!%*#?&]{8,}')
+
+### 3. Мониторинг Linux-системы.
+
+# имена установленных пакетов в выводе dpkg -l
+DPKG_PACKAGE = re.compile(r'ii\s\s([a-z:.0-9-]+)\s')
+
+# замена имени хоста в выводе критических событий
+CRITICAL_HOSTNAME = re.compile(r'nautilus')
+
+# логи репликации PostgreSQL
+REPL_CONNECTION_RECEIVED = re.compile(r'connection received')
+REPL_CONNECTION_AUTHENTICATED = re.compile(r'connection authenticated')
+REPL_CONNECTION_AUTHORIZED = re.compile(r'connection authorized')
+REPL_COMMAND = re.compile(r'received replication command')
+REPL_DISCONNECTION = re.compile(r'disconnection')
+
+REPL_HOST_PORT = re.compile(r'host=([0-9:.]+)\sport=([0-9]+)')
+REPL_IDENTITY_METHOD = re.compile(r'identity="([0-9a-zA-Z_-]+)"\smethod=([0-9a-zA-Z_-]+)')
+REPL_USER_APPLICATION = re.compile(r'user=([0-9a-zA-Z_-]+)\sapplication_name=([/0-9a-zA-Z_-]+)')
+REPL_COMMAND_TEXT = re.compile(r'received replication command:\s(.*)')
+REPL_DISCONNECTION_INFO = re.compile(r'time:\s([0-9:.]+)\suser=([0-9a-zA-Z_-]+)\s.*\shost=([0-9:.]+)\sport=([0-9]+)')
+
+
+@lru_cache(maxsize=32)
+def repl_line(date):
+    """Строка лога PostgreSQL за дату date (YYYY-MM-DD): дата, время, остаток строки."""
+    return re.compile(fr'^({re.escape(date)})\s([0-9:.]+)(.*)')
+
+
+### Входы по SSH.
+
+@lru_cache(maxsize=32)
+def ssh_login(month, day):
+    """Строка journalctl за день: месяц, день, время, пользователь, ip-адрес, порт."""
+    return re.compile(
+            fr'^({month})\s({day})\s([0-9:]+)\s.*\sfor\s([a-z0-9-_]+)\sfrom\s([0-9:.]+)\sport\s([0-9]+)\s'
+            )
+
+
+# успешный вход по SSH: пользователь, ip-адрес, порт
+SSH_ACCEPTED = re.compile(r'Accepted\s\S+\sfor\s(\S+)\sfrom\s([0-9a-fA-F:.]+)\sport\s([0-9]+)')
+
+# Реестр по именам - для перебора и бенчмарков
+REGISTRY = {
+        'email'        : EMAIL,
+        'phone'        : PHONE,
+        'password'     : PASSWORD,
+        'dpkg_package' : DPKG_PACKAGE,
+        'repl_received': REPL_CONNECTION_RECEIVED,
+        'repl_auth'    : REPL_CONNECTION_AUTHENTICATED,
+        'repl_authz'   : REPL_CONNECTION_AUTHORIZED,
+        'repl_command' : REPL_COMMAND,
+        'repl_disconn' : REPL_DISCONNECTION,
+        'ssh_accepted' : SSH_ACCEPTED,
+        }
@@ -0,0 +1,99 @@
+"""
+Микробенчмарк: стоимость обработки одной строки при компиляции шаблонов
+в цикле (как было) и с заранее скомпилированными шаблонами из extractors.
+Запуск: python extractors_benchmark.py [число строк]
+"""
+import re
+import sys
+import timeit
+
+import extractors
+
+DATE = '2024-09-20'
+REPL_LINES = [
+        f'{DATE} 10:15:01.123 MSK [1234] [unknown]@[unknown] LOG:  connection received: host=192.168.1.10 port=50412',
+        f'{DATE} 10:15:01.130 MSK [1234] repl_user@[unknown] LOG:  connection authenticated: '
+        f'identity="repl_user" method=scram-sha-256 (/etc/postgresql/15/main/pg_hba.conf:128)',
+        f'{DATE} 10:15:01.131 MSK [1234] repl_user@[unknown] LOG:  replication connection authorized: '
+        f'user=repl_user application_name=walreceiver',
+        f'{DATE} 10:15:01.140 MSK [1234] repl_user@[unknown] LOG:  received replication command: IDENTIFY_SYSTEM',
+        f'{DATE} 10:20:11.500 MSK [1234] repl_user@[unknown] LOG:  disconnection: session time: 0:05:10.377 '
+        f'user=repl_user database= host=192.168.1.10 port=50412',
+        f'{DATE} 10:21:00.000 MSK [77] LOG:  checkpoint starting: time',
+        ]
+SSH_LINES = [
+        'Sep 20 10:15:01 host sshd[4321]: Accepted password for ptstart from 192.168.1.5 port 50022 ssh2',
+        'Sep 20 10:15:02 host sshd[4321]: pam_unix(sshd:session): session opened for user ptstart(uid=1000)',
+        ]
+
+
+def repl_compile_per_line(lines):
+    for line in lines:
+        m = re.compile(fr'^({DATE})\s([0-9:.]+)(.*)').search(line)
+        if not m:
+            continue
+        rest = m.groups()[-1]
+        if re.compile(r'connection received').search(rest):
+            re.compile(r'host=([0-9:.]+)\sport=([0-9]+)').search(rest)
+        elif re.compile(r'connection authenticated').search(rest):
+            re.compile(r'identity="([0-9a-zA-Z_-]+)"\smethod=([0-9a-zA-Z_-]+)').search(rest)
+        elif re.compile(r'connection authorized').search(rest):
+            re.compile(r'user=([0-9a-zA-Z_-]+)\sapplication_name=([/0-9a-zA-Z_-]+)').search(rest)
+        elif re.compile(r'received replication command').search(rest):
+            re.compile(r'received replication command:\s(.*)').search(rest)
+        elif re.compile(r'disconnection').search(rest):
+            re.compile(r'time:\s([0-9:.]+)\suser=([0-9a-zA-Z_-]+)\s.*\shost=([0-9:.]+)\sport=([0-9]+)').search(rest)
+
+
+def repl_precompiled(lines):
+    line_regex = extractors.repl_line(DATE)
+    for line in lines:
+        m = line_regex.search(line)
+        if not m:
+            continue
+        rest = m.groups()[-1]
+        if extractors.REPL_CONNECTION_RECEIVED.search(rest):
+            extractors.REPL_HOST_PORT.search(rest)
+        elif extractors.REPL_CONNECTION_AUTHENTICATED.search(rest):
+            extractors.REPL_IDENTITY_METHOD.search(rest)
+        elif extractors.REPL_CONNECTION_AUTHORIZED.search(rest):
+            extractors.REPL_USER_APPLICATION.search(rest)
+        elif extractors.REPL_COMMAND.search(rest):
+            extractors.REPL_COMMAND_TEXT.search(rest)
+        elif extractors.REPL_DISCONNECTION.search(rest):
+            extractors.REPL_DISCONNECTION_INFO.search(rest)
+
+
+def ssh_compile_per_line(lines, month='Sep', day=20):
+    for line in lines:
+        re.compile(
+                fr'^({month})\s({day})\s([0-9:]+)\s.*\sfor\s([a-z0-9-_]+)\sfrom\s([0-9:.]+)\sport\s([0-9]+)\s'
+                ).search(line)
+
+
+def ssh_precompiled(lines, month='Sep', day=20):
+    template = extractors.ssh_login(month, day)
+    for line in lines:
+        template.search(line)
+
+
+def measure(function, lines, repeat=5):
+    best = min(timeit.repeat(lambda: function(lines), number=1, repeat=repeat))
+    return best / len(lines) * 1e9
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    repl = (REPL_LINES * (count // len(REPL_LINES) + 1))[:count]
+    ssh = (SSH_LINES * (count // len(SSH_LINES) + 1))[:count]
+    for name, before, after, lines in (
+            ('repl log', repl_compile_per_line, repl_precompiled, repl),
+            ('ssh log', ssh_compile_per_line, ssh_precompiled, ssh),
+            ):
+        old, new = measure(before, lines), measure(after, lines)
+        print(f'{name:10} re.compile в цикле: {old:8.0f} нс/строка, '
+              f'предкомпиляция: {new:8.0f} нс/строка, ускорение x{old / new:.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+Локальная замена Bot API Telegram для проверки бота без сети.
+Поддерживает getMe, getUpdates (long polling), setWebhook/deleteWebhook и отправку сообщений;
+обновления, добавленные push_update, отдаются через getUpdates или отправляются на
+зарегистрированный webhook с заголовком секрета - как это делает Telegram.
+
+Подключение бота:
+    api = FakeTelegramAPI()
+    api.start()
+    bot = Bot(api.token, base_url=api.base_url)
+"""
+import json
+import time
+import itertools
+import threading
+import logging
+import urllib.request
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from webhook_server import SECRET_HEADER
+
+logger = logging.getLogger(__name__)
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        self.__handle()
+
+    def do_GET(self):
+        self.__handle()
+
+    def __handle(self):
+        api = self.server.api
+        token, _, method = self.path.lstrip('/').partition('/')
+        if token != 'bot' + api.token:
+            return self.__reply(401, {'ok': False, 'error_code': 401, 'description': 'Unauthorized'})
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        try:
+            params = json.loads(body) if body and 'json' in self.headers.get('Content-Type', '') else {}
+        except ValueError:
+            params = {}
+        result = api.call(method.split('?')[0], params)
+        if result is None:
+            return self.__reply(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+        self.__reply(200, {'ok': True, 'result': result})
+
+    def __reply(self, code, data):
+        body = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeTelegramAPI:
+    """Состояние поддельного API: очередь обновлений, webhook и отправленные ботом сообщения."""
+
+    def __init__(self, port=0, token='123456:fake'):
+        self.token = token
+        self.__server = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+        self.__server.daemon_threads = True
+        self.__server.api = self
+        self.__cond = threading.Condition()
+        self.__updates = []
+        self.__update_ids = itertools.count(1)
+        self.__message_ids = itertools.count(1)
+        self.webhook_url = None
+        self.secret_token = None
+        self.sent = []  # (время, chat_id, текст) сообщений бота
+        self.requests = Counter()  # метод -> число вызовов
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.__server.server_address[1]}/bot'
+
+    def start(self):
+        threading.Thread(target=self.__server.serve_forever, name='fake-telegram', daemon=True).start()
+
+    def stop(self):
+        with self.__cond:
+            self.__cond.notify_all()
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def __user(self):
+        return {'id': int(self.token.split(':')[0]), 'is_bot': True, 'first_name': 'fake', 'username': 'fake_bot'}
+
+    def __message(self, chat_id, text, from_user):
+        return {'message_id': next(self.__message_ids), 'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'group'},
+                'from': from_user, 'text': text}
+
+    def call(self, method, params):
+        """Ответ на вызов метода Bot API; None - метод не поддерживается."""
+        with self.__cond:
+            self.requests[method] += 1
+        if method == 'getMe':
+            return self.__user()
+        if method == 'setWebhook':
+            self.webhook_url, self.secret_token = params.get('url'), params.get('secret_token')
+            return True
+        if method == 'deleteWebhook':
+            self.webhook_url = self.secret_token = None
+            return True
+        if method == 'getWebhookInfo':
+            return {'url': self.webhook_url or '', 'has_custom_certificate': False, 'pending_update_count': 0}
+        if method == 'getUpdates':
+            return self.__get_updates(int(params.get('offset') or 0), float(params.get('timeout') or 0))
+        if method in ('sendMessage', 'editMessageText'):
+            chat_id = int(params['chat_id'])
+            with self.__cond:
+                self.sent.append((time.perf_counter(), chat_id, params.get('text', '')))
+                self.__cond.notify_all()
+            return self.__message(chat_id, params.get('text', ''), self.__user())
+        if method in ('editMessageReplyMarkup', 'answerCallbackQuery', 'sendChatAction'):
+            return True
+        return None
+
+    def __get_updates(self, offset, timeout):
+        deadline = time.monotonic() + timeout
+        with self.__cond:
+            self.__updates = [update for update in self.__updates if update['update_id'] >= offset]
+            while not self.__updates and time.monotonic() < deadline:
+                self.__cond.wait(deadline - time.monotonic())
+            return list(self.__updates)
+
+    def push_update(self, text, chat_id=1):
+        """Сообщение пользователя text в чат chat_id; возвращает время отправки (perf_counter)."""
+        user = {'id': chat_id, 'is_bot': False, 'first_name': 'user'}
+        update = {'update_id': next(self.__update_ids), 'message': self.__message(chat_id, text, user)}
+        sent = time.perf_counter()
+        if self.webhook_url:
+            request = urllib.request.Request(self.webhook_url, data=json.dumps(update).encode(),
+                                             headers={'Content-Type': 'application/json'})
+            if self.secret_token:
+                request.add_header(SECRET_HEADER, self.secret_token)
+            urllib.request.urlopen(request, timeout=10).close()
+        else:
+            with self.__cond:
+                self.__updates.append(update)
+                self.__cond.notify_all()
+        return sent
+
+    def wait_message(self, chat_id, text, timeout=10):
+        """Время (perf_counter) отправки ботом сообщения text в чат chat_id или None по таймауту."""
+        deadline = time.monotonic() + timeout
+        with self.__cond:
+            while True:
+                for sent, sent_chat, sent_text in self.sent:
+                    if sent_chat == chat_id and sent_text == text:
+                        return sent
+                if time.monotonic() >= deadline:
+                    return None
+                self.__cond.wait(deadline - time.monotonic())
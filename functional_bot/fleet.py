@@ -0,0 +1,180 @@
+"""
+Инвентарь хостов с группами и параллельный опрос группы хостов.
+
+Инвентарь читается из INI-файла (переменная окружения HOSTS_FILE):
+
+    [host:db1]
+    host = 10.0.0.5
+    port = 22
+    user = ptstart
+    password_env = DB1_PASSWORD
+    groups = db
+
+и/или из переменной окружения RM_GROUPS вида "db:10.0.0.5,10.0.0.6:2222;web:10.0.0.7",
+для этих хостов учётные данные берутся из RM_USER/RM_PASSWORD.
+Хост из RM_HOST доступен под именем default, все хосты входят в группу all.
+"""
+import os
+import re
+import time
+import logging
+import configparser
+from typing import NamedTuple
+from concurrent.futures import as_completed, TimeoutError
+
+import host_parsers
+
+logger = logging.getLogger(__name__)
+
+
+class Host(NamedTuple):
+    name: str
+    host: str
+    port: int
+    username: str
+    password: str
+
+
+class Inventory:
+    """Хосты и группы хостов."""
+
+    def __init__(self):
+        self.hosts = {}
+        self.groups = {}
+
+    def add(self, host, groups=()):
+        self.hosts[host.name] = host
+        for group in ('all', *groups):
+            members = self.groups.setdefault(group, [])
+            if host.name not in members:
+                members.append(host.name)
+
+    def group(self, name):
+        """Хосты группы (или один хост по имени); пустой список, если такой группы нет."""
+        if name in self.groups:
+            return [self.hosts[member] for member in self.groups[name]]
+        if name in self.hosts:
+            return [self.hosts[name]]
+        return []
+
+    @classmethod
+    def from_env(cls):
+        logger.info(f'Start {cls.from_env.__name__}')
+        inventory = cls()
+        user, password = os.getenv('RM_USER'), os.getenv('RM_PASSWORD')
+        if os.getenv('RM_HOST'):
+            inventory.add(Host('default', os.getenv('RM_HOST'), int(os.getenv('RM_PORT') or 22), user, password))
+
+        hosts_file = os.getenv('HOSTS_FILE')
+        if hosts_file and os.path.exists(hosts_file):
+            config = configparser.ConfigParser()
+            config.read(hosts_file)
+            for section in config.sections():
+                if not section.startswith('host:'):
+                    continue
+                entry = config[section]
+                inventory.add(
+                        Host(section[len('host:'):],
+                             entry['host'],
+                             entry.getint('port', 22),
+                             entry.get('user', user),
+                             os.getenv(entry['password_env']) if 'password_env' in entry
+                             else entry.get('password', password)
+                             ),
+                        [group.strip() for group in entry.get('groups', '').split(',') if group.strip()]
+                        )
+
+        # RM_GROUPS="db:10.0.0.5,10.0.0.6:2222;web:10.0.0.7"
+        for group_spec in filter(None, (os.getenv('RM_GROUPS') or '').split(';')):
+            group, _, members = group_spec.partition(':')
+            for member in filter(None, members.split(',')):
+                address, _, port = member.strip().partition(':')
+                name = inventory.name_of(address, int(port or 22))
+                inventory.add(Host(name, address, int(port or 22), user, password), [group.strip()])
+        logger.info(f'Stop {cls.from_env.__name__}: {len(inventory.hosts)} хостов')
+        return inventory
+
+    def name_of(self, address, port):
+        """Имя уже известного хоста с таким адресом или адрес в качестве нового имени."""
+        for host in self.hosts.values():
+            if (host.host, host.port) == (address, port):
+                return host.name
+        return address if port == 22 else f'{address}:{port}'
+
+
+def fan_out(executor, hosts, function, timeout):
+    """
+    Вызывает function(host) для всех хостов на пуле executor.
+    Результаты отдаются по мере готовности: (host, результат, ошибка).
+    Хосты, не ответившие за timeout секунд, возвращаются с TimeoutError.
+    """
+    futures = {executor.submit(function, host): host for host in hosts}
+    done = set()
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            done.add(future)
+            host = futures[future]
+            try:
+                yield host, future.result(), None
+            except Exception as error:
+                yield host, None, error
+    except TimeoutError:
+        for future, host in futures.items():
+            if future not in done:
+                future.cancel()
+                yield host, None, TimeoutError(f'нет ответа за {timeout} с')
+
+
+### Краткие сводки по выводу команд для таблицы по группе хостов.
+
+UPTIME = re.compile(r'up\s+(.*?),\s+\d+\s+users?,\s+load average:\s+(.*)$')
+
+
+def summary_df(text):
+    """Самая заполненная файловая система."""
+    disks = host_parsers.parse_df(text)
+    if not disks:
+        return text.strip()[:40]
+    disk = max(disks, key=lambda disk: disk.use_percent)
+    return f'{disk.use_percent}% {disk.mount}'
+
+
+def summary_uptime(text):
+    """Время работы и средняя загрузка."""
+    match = UPTIME.search(text.strip())
+    if not match:
+        return text.strip()[:40]
+    return f'up {match[1]}, load {match[2]}'
+
+
+def summary_critical(text):
+    """Число критических событий и последнее из них."""
+    lines = [line for line in text.split('\n') if line.strip()]
+    if not lines:
+        return '0'
+    return f'{len(lines)}: {lines[-1][:60]}'
+
+
+def format_table(rows, pending=()):
+    """Таблица 'хост | статус | сводка' моноширинным текстом."""
+    items = [(name, status, summary) for name, (status, summary) in rows.items()]
+    items += [(name, '...', '') for name in pending]
+    width = max([len(name) for name, _, _ in items] + [4])
+    lines = [f'{"host":<{width}} | st  | summary']
+    lines += [f'{name:<{width}} | {status:<3} | {summary}' for name, status, summary in items]
+    return '\n'.join(lines)
+
+
+class EditThrottle:
+    """Не чаще одного изменения сообщения в interval секунд."""
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.last = 0.0
+
+    def ready(self):
+        now = time.monotonic()
+        if now - self.last >= self.interval:
+            self.last = now
+            return True
+        return False
@@ -0,0 +1,249 @@
+"""
+Разбор вывода команд мониторинга в типизированные записи.
+Размеры из человекочитаемого вида (-h) переводятся в байты,
+поэтому записи можно сортировать, фильтровать и агрегировать локально.
+"""
+import re
+from dataclasses import dataclass
+
+SIZE = re.compile(r'^([\d.,]+)\s*([KMGTPE]?)(i?)B?$', re.IGNORECASE)
+UNITS = {'': 0, 'K': 1, 'M': 2, 'G': 3, 'T': 4, 'P': 5, 'E': 6}
+
+
+def parse_size(text):
+    """'5.1G', '1.9Gi', '512M', '0B', '1024' -> байты (int); None, если не размер."""
+    match = SIZE.match(text.strip())
+    if not match:
+        return None
+    number, unit, _ = match.groups()
+    return int(float(number.replace(',', '.')) * 1024 ** UNITS[unit.upper()])
+
+
+def format_size(size):
+    """Байты -> короткая запись с двоичной единицей."""
+    for unit in ('B', 'K', 'M', 'G', 'T', 'P'):
+        if abs(size) < 1024 or unit == 'P':
+            return f'{size:.0f}{unit}' if unit == 'B' else f'{size:.1f}{unit}'
+        size /= 1024
+
+
+def _split_address(address):
+    """'0.0.0.0:22', '[::]:22', '*:5432' -> (адрес, порт)."""
+    host, _, port = address.rpartition(':')
+    return host.strip('[]'), port
+
+
+@dataclass(slots=True)
+class DiskUsage:
+    filesystem: str
+    size: int
+    used: int
+    available: int
+    use_percent: int
+    mount: str
+
+
+def parse_df(text):
+    """Вывод df -h / df -P."""
+    result = []
+    for line in text.splitlines()[1:]:
+        parts = line.split(None, 5)
+        if len(parts) < 6 or not parts[4].endswith('%') or not parts[4][:-1].isdigit():
+            continue
+        result.append(DiskUsage(parts[0], parse_size(parts[1]) or 0, parse_size(parts[2]) or 0,
+                                parse_size(parts[3]) or 0, int(parts[4][:-1]), parts[5]))
+    return result
+
+
+@dataclass(slots=True)
+class MemoryUsage:
+    kind: str  # Mem или Swap
+    total: int
+    used: int
+    free: int
+    shared: int = 0
+    buff_cache: int = 0
+    available: int = 0
+
+
+def parse_free(text):
+    """Вывод free -h / free -b."""
+    result = []
+    for line in text.splitlines():
+        name, _, rest = line.partition(':')
+        if not rest or name.strip() not in ('Mem', 'Swap'):
+            continue
+        sizes = [parse_size(part) or 0 for part in rest.split()]
+        result.append(MemoryUsage(name.strip(), *sizes[:6]))
+    return result
+
+
+@dataclass(slots=True)
+class Socket:
+    netid: str
+    state: str
+    recv_q: int
+    send_q: int
+    local_address: str
+    local_port: str
+    peer_address: str
+    peer_port: str
+
+
+def parse_ss(text):
+    """Вывод ss -tuln (Netid State Recv-Q Send-Q Local Peer)."""
+    result = []
+    for line in text.splitlines()[1:]:
+        parts = line.split()
+        if len(parts) < 6 or not parts[2].isdigit():
+            continue
+        local_address, local_port = _split_address(parts[4])
+        peer_address, peer_port = _split_address(parts[5])
+        result.append(Socket(parts[0], parts[1], int(parts[2]), int(parts[3]),
+                             local_address, local_port, peer_address, peer_port))
+    return result
+
+
+@dataclass(slots=True)
+class Process:
+    user: str
+    pid: int
+    cpu: float
+    mem: float
+    vsz: int  # КиБ
+    rss: int  # КиБ
+    tty: str
+    stat: str
+    start: str
+    time: str
+    command: str
+
+
+def parse_ps(text):
+    """Вывод ps aux."""
+    result = []
+    for line in text.splitlines()[1:]:
+        parts = line.split(None, 10)
+        if len(parts) < 11 or not parts[1].isdigit():
+            continue
+        result.append(Process(parts[0], int(parts[1]), float(parts[2]), float(parts[3]),
+                              int(parts[4]), int(parts[5]), *parts[6:]))
+    return result
+
+
+@dataclass(slots=True)
+class CpuUsage:
+    cpu: str  # all или номер процессора
+    usr: float
+    nice: float
+    sys: float
+    iowait: float
+    irq: float
+    soft: float
+    steal: float
+    idle: float
+
+
+def parse_mpstat(text):
+    """Строки Average: вывода mpstat -P ALL (колонки определяются по заголовку)."""
+    result, columns = [], None
+    for line in text.splitlines():
+        parts = line.split()
+        if 'CPU' in parts and '%idle' in parts:
+            columns = {name.lstrip('%'): index for index, name in enumerate(parts)}
+            continue
+        if columns is None or not parts or not parts[0].startswith('Average'):
+            continue
+        if len(parts) < len(columns) or parts[columns['CPU']] == 'CPU':
+            continue
+        value = lambda name: float(parts[columns[name]].replace(',', '.')) if name in columns else 0.0
+        result.append(CpuUsage(parts[columns['CPU']], value('usr'), value('nice'), value('sys'), value('iowait'),
+                               value('irq'), value('soft'), value('steal'), value('idle')))
+    return result
+
+
+@dataclass(slots=True)
+class LoggedUser:
+    user: str
+    tty: str
+    source: str
+    login: str
+    idle: str
+    what: str
+
+
+def parse_w(text):
+    """Вывод w (первая строка - uptime, вторая - заголовок)."""
+    result = []
+    lines = text.splitlines()
+    header = lines[1].split() if len(lines) > 1 else []
+    has_from = 'FROM' in header
+    for line in lines[2:]:
+        parts = line.split(None, 7 if has_from else 6)
+        if len(parts) < (8 if has_from else 7):
+            continue
+        if not has_from:
+            parts.insert(2, '-')
+        result.append(LoggedUser(parts[0], parts[1], parts[2], parts[3], parts[4], parts[7]))
+    return result
+
+
+@dataclass(slots=True)
+class Login:
+    user: str
+    tty: str
+    source: str
+    period: str
+
+
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+
+def parse_last(text):
+    """
+    Вывод last -n N (служебные строки reboot/wtmp пропускаются).
+    У локального входа столбца адреса нет - сразу за терминалом идёт день недели.
+    """
+    result = []
+    for line in text.splitlines():
+        parts = line.split(None, 2)
+        if len(parts) < 3 or parts[0] in ('reboot', 'wtmp'):
+            continue
+        user, tty, rest = parts
+        source, _, period = rest.partition(' ')
+        if source in WEEKDAYS:
+            source, period = '', rest
+        elif not period.strip():
+            continue
+        result.append(Login(user, tty, source, period.strip()))
+    return result
+
+
+LOAD_AVERAGE = re.compile(r'load averages?:\s*(\d+[.,]\d+),?\s+(\d+[.,]\d+),?\s+(\d+[.,]\d+)')
+
+
+def parse_load(text):
+    """Средняя загрузка (1, 5, 15 минут) из вывода uptime или w; None, если её нет."""
+    match = LOAD_AVERAGE.search(text)
+    if not match:
+        return None
+    return tuple(float(value.replace(',', '.')) for value in match.groups())
+
+
+### Локальные выборки по разобранным данным.
+
+def top_processes(processes, count=10):
+    """count процессов с наибольшим RSS."""
+    return sorted(processes, key=lambda process: process.rss, reverse=True)[:count]
+
+
+def full_filesystems(disks, threshold=90):
+    """Файловые системы, заполненные на threshold% и более."""
+    return [disk for disk in disks if disk.use_percent >= threshold]
+
+
+def new_listening_ports(sockets, baseline):
+    """Прослушиваемые порты (netid, порт), которых нет в baseline."""
+    return [socket for socket in sockets
+            if socket.state in ('LISTEN', 'UNCONN') and socket.local_port not in baseline
+            and f'{socket.netid}/{socket.local_port}' not in baseline]
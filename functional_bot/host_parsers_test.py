@@ -0,0 +1,153 @@
+"""
+Тесты разбора вывода команд мониторинга на выводе, снятом с реальных хостов (Ubuntu 22.04).
+
+Запуск:
+    python -m pytest host_parsers_test.py
+"""
+import pytest
+
+import host_parsers
+from host_parsers import DiskUsage, Login, MemoryUsage
+
+UPTIME = ' 10:14:03 up 12 days,  3:41,  2 users,  load average: 0,08, 0,17, 0,21\n'
+
+DF = """\
+Filesystem      Size  Used Avail Use% Mounted on
+tmpfs           197M  1.3M  196M   1% /run
+/dev/sda2        49G   21G   26G  45% /
+/dev/loop0       64M   64M     0 100% /snap/core20/2318
+/dev/sdb1       916G  870G   0.5G  99% /mnt/backup disk
+"""
+
+FREE_H = """\
+               total        used        free      shared  buff/cache   available
+Mem:           1.9Gi       512Mi       1.0Gi       1.2Mi       433Mi       1.3Gi
+Swap:             0B          0B          0B
+"""
+
+FREE_B = """\
+               total        used        free      shared  buff/cache   available
+Mem:      2063511552   546865152  1118633984     1290240   454012416  1337614336
+Swap:     2147479552           0  2147479552
+"""
+
+MPSTAT = """\
+Linux 5.15.0-105-generic (db1) 	20.10.2024 	_x86_64_	(2 CPU)
+
+10:14:05     CPU    %usr   %nice    %sys %iowait    %irq   %soft  %steal  %guest  %gnice   %idle
+10:14:06     all    2,51    0,00    1,01    0,50    0,00    0,00    0,00    0,00    0,00   95,98
+10:14:06       0    3,00    0,00    1,00    1,00    0,00    0,00    0,00    0,00    0,00   95,00
+10:14:06       1    2,02    0,00    1,01    0,00    0,00    0,00    0,00    0,00    0,00   96,97
+
+Average:     CPU    %usr   %nice    %sys %iowait    %irq   %soft  %steal  %guest  %gnice   %idle
+Average:     all    2,51    0,00    1,01    0,50    0,00    0,00    0,00    0,00    0,00   95,98
+Average:       0    3,00    0,00    1,00    1,00    0,00    0,00    0,00    0,00    0,00   95,00
+Average:       1    2,02    0,00    1,01    0,00    0,00    0,00    0,00    0,00    0,00   96,97
+"""
+
+SS = """\
+Netid State  Recv-Q Send-Q  Local Address:Port   Peer Address:Port Process
+udp   UNCONN 0      0       127.0.0.53%lo:53          0.0.0.0:*
+tcp   LISTEN 0      128           0.0.0.0:22          0.0.0.0:*
+tcp   LISTEN 0      244         127.0.0.1:5432        0.0.0.0:*
+tcp   ESTAB  0      36       192.168.1.10:22     192.168.1.5:51234
+tcp   LISTEN 0      128              [::]:22             [::]:*
+"""
+
+W = """\
+ 10:14:03 up 12 days,  3:41,  2 users,  load average: 0.08, 0.17, 0.21
+USER     TTY      FROM             LOGIN@   IDLE   JCPU   PCPU WHAT
+admin    pts/0    192.168.1.5      10:02    1.00s  0.05s  0.00s w
+root     tty1     -                Mon09    4days  0.02s  0.02s -bash
+"""
+
+PS = """\
+USER         PID %CPU %MEM    VSZ   RSS TTY      STAT START   TIME COMMAND
+root           1  0.0  0.6 167712 12876 ?        Ss   Oct14   0:09 /sbin/init splash
+postgres     812  0.1  2.4 215324 49812 ?        Ss   Oct14   1:12 /usr/lib/postgresql/14/bin/postgres -D /var/lib/postgresql/14/main
+admin       4031  0.0  0.2  10072  5120 pts/0    Ss   10:02   0:00 -bash
+"""
+
+LAST = """\
+admin    pts/0        192.168.1.5      Sun Oct 20 10:02   still logged in
+root     tty1                          Mon Oct 14 09:12   still logged in
+admin    pts/1        10.0.0.7         Sat Oct 19 18:40 - 19:05  (00:24)
+reboot   system boot  5.15.0-105-gener Mon Oct 14 09:10   still running
+
+wtmp begins Tue Oct  1 08:00:01 2024
+"""
+
+
+@pytest.mark.parametrize('text, size', [
+    ('5.1G', int(5.1 * 1024 ** 3)),
+    ('1.9Gi', int(1.9 * 1024 ** 3)),
+    ('512M', 512 * 1024 ** 2),
+    ('0B', 0),
+    ('1024', 1024),
+    ('0,5K', 512),
+    ('n/a', None),
+])
+def test_parse_size(text, size):
+    assert host_parsers.parse_size(text) == size
+
+
+def test_parse_load_comma_decimal():
+    assert host_parsers.parse_load(UPTIME) == (0.08, 0.17, 0.21)
+    assert host_parsers.parse_load(W) == (0.08, 0.17, 0.21)
+    assert host_parsers.parse_load('no load here') is None
+
+
+def test_parse_df():
+    disks = host_parsers.parse_df(DF)
+    assert [disk.mount for disk in disks] == ['/run', '/', '/snap/core20/2318', '/mnt/backup disk']
+    assert disks[1] == DiskUsage('/dev/sda2', 49 * 1024 ** 3, 21 * 1024 ** 3, 26 * 1024 ** 3, 45, '/')
+    assert [disk.mount for disk in host_parsers.full_filesystems(disks)] == ['/snap/core20/2318',
+                                                                             '/mnt/backup disk']
+
+
+def test_parse_free_human_and_bytes():
+    memory, swap = host_parsers.parse_free(FREE_H)
+    assert memory.kind == 'Mem' and memory.total == int(1.9 * 1024 ** 3) and memory.used == 512 * 1024 ** 2
+    assert swap == MemoryUsage('Swap', 0, 0, 0)
+    memory, swap = host_parsers.parse_free(FREE_B)
+    assert memory == MemoryUsage('Mem', 2063511552, 546865152, 1118633984, 1290240, 454012416, 1337614336)
+    assert swap == MemoryUsage('Swap', 2147479552, 0, 2147479552)
+
+
+def test_parse_mpstat_uses_average_rows():
+    cpus = host_parsers.parse_mpstat(MPSTAT)
+    assert [cpu.cpu for cpu in cpus] == ['all', '0', '1']
+    assert cpus[0].usr == 2.51 and cpus[0].iowait == 0.5 and cpus[0].idle == 95.98
+
+
+def test_parse_ss_and_new_ports():
+    sockets = host_parsers.parse_ss(SS)
+    assert len(sockets) == 5
+    assert (sockets[3].state, sockets[3].peer_address, sockets[3].peer_port) == ('ESTAB', '192.168.1.5', '51234')
+    assert (sockets[4].local_address, sockets[4].local_port) == ('::', '22')
+    new = host_parsers.new_listening_ports(sockets, {'22', 'udp/53'})
+    assert [(socket.netid, socket.local_port) for socket in new] == [('tcp', '5432')]
+
+
+def test_parse_ps_and_top_processes():
+    processes = host_parsers.parse_ps(PS)
+    assert [process.pid for process in processes] == [1, 812, 4031]
+    assert processes[1].command == '/usr/lib/postgresql/14/bin/postgres -D /var/lib/postgresql/14/main'
+    assert [process.user for process in host_parsers.top_processes(processes, 2)] == ['postgres', 'root']
+
+
+def test_parse_w():
+    users = host_parsers.parse_w(W)
+    assert [(user.user, user.tty, user.source, user.what) for user in users] == [
+        ('admin', 'pts/0', '192.168.1.5', 'w'),
+        ('root', 'tty1', '-', '-bash'),
+    ]
+
+
+def test_parse_last_remote_and_local_logins():
+    assert host_parsers.parse_last(LAST) == [
+        Login('admin', 'pts/0', '192.168.1.5', 'Sun Oct 20 10:02   still logged in'),
+        # локальный вход: столбца адреса нет, период начинается с дня недели
+        Login('root', 'tty1', '', 'Mon Oct 14 09:12   still logged in'),
+        Login('admin', 'pts/1', '10.0.0.7', 'Sat Oct 19 18:40 - 19:05  (00:24)'),
+    ]
@@ -0,0 +1,96 @@
+"""
+Перенос фильтрации логов на удалённую сторону.
+Окно времени, приоритет и ключевые слова из запроса пользователя превращаются
+в параметры journalctl и фильтры grep/awk, чтобы по SSH передавались только нужные строки.
+Тот же запрос умеет проверять строки локально, поэтому результат не зависит от того,
+сработала ли фильтрация на хосте.
+"""
+import shlex
+from dataclasses import dataclass
+
+# последняя строка вывода awk-фильтра: число прочитанных байт и длина последней строки
+TAIL_MARKER = '#TAIL'
+
+
+@dataclass(frozen=True)
+class LogQuery:
+    """
+    since, until - границы окна в формате journalctl ('2024-09-20', '2024-09-20 10:00', 'today', '-1h');
+    keywords - строки, хотя бы одна из которых должна встречаться в записи;
+    priority - приоритет journalctl (emerg, alert, crit, err, warning, notice, info, debug).
+    """
+    since: str = None
+    until: str = None
+    keywords: tuple = ()
+    priority: str = None
+
+    @classmethod
+    def from_args(cls, args, priority=None):
+        """
+        Разбирает аргументы команды бота:
+        since=2024-09-20 until=2024-09-21 p=err слово1 слово2
+        Аргументы force (кэш) и @группа (группа хостов) пропускаются.
+        """
+        since = until = None
+        keywords = []
+        for arg in args or []:
+            name, sep, value = arg.partition('=')
+            if sep and name == 'since':
+                since = value.replace('T', ' ')
+            elif sep and name == 'until':
+                until = value.replace('T', ' ')
+            elif sep and name in ('p', 'priority'):
+                priority = value
+            elif arg != 'force' and not arg.startswith('@'):
+                keywords.append(arg)
+        return cls(since, until, tuple(keywords), priority)
+
+    def journalctl(self, *options):
+        """Команда journalctl с окном времени и приоритетом и grep по ключевым словам."""
+        command = ['journalctl', '--no-pager', *options]
+        if self.priority:
+            command += ['-p', self.priority]
+        if self.since:
+            command.append(f'--since={self.since}')
+        if self.until:
+            command.append(f'--until={self.until}')
+        return ' '.join(shlex.quote(part) for part in command) + self.grep()
+
+    def grep(self):
+        """Фильтр конвейера по ключевым словам (пустая строка, если слов нет)."""
+        if not self.keywords:
+            return ''
+        return ' | grep -F ' + ' '.join(f'-e {shlex.quote(keyword)}' for keyword in self.keywords)
+
+    def awk_tail(self, size):
+        """
+        awk-фильтр для чтения куска лога из size байт.
+        Печатает только полные строки с ключевыми словами, последней строкой -
+        TAIL_MARKER, число прочитанных байт и длину последней строки:
+        по ним вычисляется, сколько байт занимают полные строки.
+        """
+        variables = ' '.join(f'-v k{i}={shlex.quote(keyword)}' for i, keyword in enumerate(self.keywords))
+        condition = ' || '.join(f'index($0, k{i})' for i in range(len(self.keywords))) or '1'
+        script = (f'{{ if (keep) print prev; n += length($0) + 1; last = length($0); '
+                  f'keep = ({condition}); prev = $0 }} '
+                  f'END {{ if (keep && n <= {size}) print prev; print "{TAIL_MARKER}", n + 0, last + 0 }}')
+        return f' | LC_ALL=C awk {variables} {shlex.quote(script)}'
+
+    @staticmethod
+    def split_awk_tail(data, size):
+        """
+        Отделяет строки от служебной строки awk_tail. Возвращает (строки, байт полных строк).
+        Служебная строка ищется с конца: после неё может оказаться вывод stderr.
+        """
+        position = data.rfind(TAIL_MARKER.encode() + b' ')
+        if position < 0 or (position and data[position - 1:position] != b'\n'):
+            raise ValueError(f'Нет строки {TAIL_MARKER} в выводе фильтра')
+        body, marker = data[:position], data[position:].split(b'\n', 1)[0]
+        _, read, last = marker.split()
+        read, last = int(read), int(last)
+        complete = read if read <= size else read - last - 1
+        return body, complete
+
+    def matches(self, line):
+        """Локальная проверка строки по ключевым словам."""
+        return not self.keywords or any(keyword in line for keyword in self.keywords)
@@ -0,0 +1,52 @@
+"""
+Тесты разбора вывода awk-фильтра LogQuery.awk_tail: служебная строка в данных,
+пустой кусок лога, stderr после служебной строки.
+
+Запуск:
+    python -m pytest log_query_test.py
+"""
+import shutil
+import subprocess
+
+import pytest
+
+from log_query import LogQuery
+
+
+def test_marker_text_inside_data():
+    data = b'line with #TAIL 1 1 inside\n#TAIL 5 3 in the middle\n#TAIL 60 25\n'
+    body, complete = LogQuery.split_awk_tail(data, 60)
+    assert body == b'line with #TAIL 1 1 inside\n#TAIL 5 3 in the middle\n'
+    assert complete == 60
+
+
+def test_empty_tail():
+    assert LogQuery.split_awk_tail(b'#TAIL 0 0\n', 0) == (b'', 0)
+
+
+def test_unfinished_last_line_is_not_complete():
+    # прочитано больше size: последняя строка (10 байт + перевод строки) дописывается и не считается
+    body, complete = LogQuery.split_awk_tail(b'first\n#TAIL 17 10\n', 16)
+    assert (body, complete) == (b'first\n', 6)
+
+
+def test_stderr_after_marker():
+    data = b'error: disk full\n#TAIL 17 16\ntail: /var/log/x: file truncated\n'
+    assert LogQuery.split_awk_tail(data, 17) == (b'error: disk full\n', 17)
+
+
+@pytest.mark.parametrize('data', [b'', b'just lines\n', b'text#TAIL 5 5\n', b'stderr only\n'])
+def test_missing_marker(data):
+    with pytest.raises(ValueError):
+        LogQuery.split_awk_tail(data, 10)
+
+
+@pytest.mark.skipif(shutil.which('awk') is None, reason='нужен awk')
+def test_awk_tail_round_trip():
+    text = b'keep one\nskip\nkeep #TAIL 1 1\nkeep unfinish'
+    query = LogQuery(keywords=('keep',))
+    data = subprocess.run('cat' + query.awk_tail(len(text) - 3), shell=True, input=text,
+                          capture_output=True).stdout
+    body, complete = LogQuery.split_awk_tail(data, len(text) - 3)
+    assert body == b'keep one\nkeep #TAIL 1 1\n'
+    assert complete == len(b'keep one\nskip\nkeep #TAIL 1 1\n')
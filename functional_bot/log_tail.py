@@ -0,0 +1,226 @@
+"""
+Инкрементальное чтение удалённых логов.
+Для каждой пары (хост, путь) сохраняются inode и смещение уже прочитанных байт,
+поэтому при следующем запросе с хоста забираются только новые строки.
+Разобранные события складываются в локальное хранилище (JSON Lines).
+"""
+import os
+import re
+import json
+import shlex
+import datetime
+import threading
+import logging
+
+from log_query import LogQuery
+
+logger = logging.getLogger(__name__)
+
+
+def _file_name(host, path, suffix):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', f'{host}-{path}') + suffix
+
+
+class LogTail:
+    """
+    Смещения прочитанных логов, сохраняемые в state_dir/log_offsets.json.
+    Ротация определяется по смене inode (хвост старого файла дочитывается из path.1),
+    усечение - по размеру файла меньше сохранённого смещения.
+    """
+
+    def __init__(self, state_dir):
+        self.state_dir = state_dir
+        self.state_file = os.path.join(state_dir, 'log_offsets.json')
+        self.lock = threading.Lock()
+        os.makedirs(state_dir, exist_ok=True)
+        self.__state = self.__load()
+
+    def __load(self):
+        try:
+            with open(self.state_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def __save(self):
+        tmp = self.state_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.__state, f)
+        os.replace(tmp, self.state_file)
+
+    def reset(self, host, path):
+        with self.lock:
+            self.__state.pop(f'{host}|{path}', None)
+            self.__save()
+
+    @staticmethod
+    def __stat(run, path):
+        """inode и размер удалённого файла и его ротированной копии path.1 (None, если файла нет)."""
+        output = run(f"for f in {shlex.quote(path)} {shlex.quote(path + '.1')}; do "
+                     f"stat -L -c '%i %s' \"$f\" 2>/dev/null || echo -; done").decode()
+        result = []
+        for line in output.split('\n')[:2]:
+            parts = line.split()
+            result.append((int(parts[0]), int(parts[1])) if len(parts) == 2 else None)
+        while len(result) < 2:
+            result.append(None)
+        return result
+
+    @staticmethod
+    def __read_range(run, path, start, end, query=None):
+        """
+        Читает байты файла с позиции start до end и возвращает (полные строки, их длина в байтах).
+        query - LogQuery: строки отбираются по ключевым словам ещё на хосте.
+        """
+        command = f'tail -c +{start + 1} {shlex.quote(path)} | head -c {end - start}'
+        if query is not None and query.keywords:
+            command += query.awk_tail(end - start)
+        # run возвращает stdout вместе с stderr: сообщения об ошибках (например, tail: cannot open
+        # при ротации между stat и чтением) не должны попасть в строки лога
+        data = run(f'{{ {command}; }} 2>/dev/null')
+        if query is not None and query.keywords:
+            return LogQuery.split_awk_tail(data, end - start)
+        # незавершённую последнюю строку оставляем до следующего чтения
+        complete = data.rfind(b'\n') + 1
+        return data[:complete], complete
+
+    def read_new(self, run, host, path, query=None):
+        """
+        Возвращает новые полные строки лога (bytes), появившиеся с прошлого вызова.
+        run(command) -> bytes выполняет команду на хосте,
+        query - LogQuery для отбора строк на стороне хоста.
+        """
+        logger.info(f'Start {self.read_new.__name__} {host}:{path}')
+        key = f'{host}|{path}'
+        with self.lock:
+            state = self.__state.get(key, {'inode': None, 'offset': 0})
+            current, rotated = self.__stat(run, path)
+            if current is None:
+                logger.warning(f'Лог {path} на {host} не найден')
+                return b''
+            inode, size = current
+            offset = state['offset']
+            chunks = []
+            if state['inode'] is not None and inode != state['inode']:
+                # лог ротирован: дочитываем хвост прежнего файла, если он переименован в path.1
+                if rotated is not None and rotated[0] == state['inode'] and rotated[1] > offset:
+                    chunks.append(self.__read_range(run, path + '.1', offset, rotated[1], query)[0])
+                logger.info(f'Лог {path} ротирован, чтение с начала')
+                offset = 0
+            elif size < offset:
+                logger.info(f'Лог {path} усечён, чтение с начала')
+                offset = 0
+            if size > offset:
+                data, complete = self.__read_range(run, path, offset, size, query)
+                chunks.append(data)
+                offset += complete
+            self.__state[key] = {'inode': inode, 'offset': offset}
+            self.__save()
+        data = b''.join(chunks)
+        logger.info(f'Stop {self.read_new.__name__} {host}:{path}: {len(data)} байт')
+        return data
+
+
+class JournalTail:
+    """
+    Инкрементальное чтение журнала systemd по курсору journalctl.
+    Курсор последней прочитанной записи для пары (хост, фильтр) сохраняется
+    в state_dir/journal_cursors.json; при первом чтении запоминается только текущая позиция.
+    """
+
+    CURSOR_PREFIX = '-- cursor: '
+
+    def __init__(self, state_dir):
+        self.state_file = os.path.join(state_dir, 'journal_cursors.json')
+        self.lock = threading.Lock()
+        os.makedirs(state_dir, exist_ok=True)
+        try:
+            with open(self.state_file) as f:
+                self.__cursors = json.load(f)
+        except (OSError, ValueError):
+            self.__cursors = {}
+
+    def read_new(self, run, host, query, options=()):
+        """
+        Возвращает новые записи журнала (список строк), подходящие под query (LogQuery).
+        run(command) -> bytes выполняет команду на хосте,
+        options - дополнительные параметры journalctl, например ('-u', 'ssh').
+        """
+        key = f'{host}|{" ".join(options)}|{query}'
+        with self.lock:
+            cursor = self.__cursors.get(key)
+        if cursor:
+            # фильтр по словам применяется локально: grep отрезал бы строку с курсором
+            command = LogQuery(query.since, query.until, (), query.priority).journalctl(
+                    *options, '--show-cursor', '-o', 'short-iso', f'--after-cursor={cursor}')
+        else:
+            # позиция - последняя запись всего журнала: с -n 0 часть версий systemd курсор не печатает,
+            # а под фильтры запроса записей может ещё не быть. Сама запись отбрасывается
+            command = LogQuery().journalctl('-n', '1', '--show-cursor', '-o', 'short-iso')
+        lines = run(command).decode('utf-8', errors='replace').splitlines()
+        if lines and lines[-1].startswith(self.CURSOR_PREFIX):
+            with self.lock:
+                self.__cursors[key] = lines.pop()[len(self.CURSOR_PREFIX):]
+                tmp = self.state_file + '.tmp'
+                with open(tmp, 'w') as f:
+                    json.dump(self.__cursors, f)
+                os.replace(tmp, self.state_file)
+        if not cursor:
+            return []
+        return [line for line in lines if line and not line.startswith('-- ') and query.matches(line)]
+
+
+class EventStore:
+    """
+    Хранилище разобранных событий лога: по файлу JSON Lines на пару (хост, путь).
+    Каждая запись - кортеж события, первым элементом которого идёт дата YYYY-MM-DD.
+    """
+
+    def __init__(self, state_dir, retention_days=7):
+        self.state_dir = state_dir
+        self.retention_days = retention_days
+        self.lock = threading.Lock()
+        os.makedirs(state_dir, exist_ok=True)
+
+    def __path(self, host, path):
+        return os.path.join(self.state_dir, _file_name(host, path, '.events.jsonl'))
+
+    def append(self, host, path, events):
+        count = 0
+        with self.lock, open(self.__path(host, path), 'a') as f:
+            for event in events:
+                f.write(json.dumps(event, ensure_ascii=False) + '\n')
+                count += 1
+        return count
+
+    def load(self, host, path, date=None):
+        """События хранилища; date (YYYY-MM-DD) - только за эту дату."""
+        prefix = f'["{date}"' if date else None
+        with self.lock:
+            try:
+                with open(self.__path(host, path)) as f:
+                    return [tuple(json.loads(line)) for line in f
+                            if prefix is None or line.startswith(prefix)]
+            except FileNotFoundError:
+                return []
+
+    def prune(self, host, path):
+        """Удаляет события старше retention_days."""
+        border = (datetime.date.today() - datetime.timedelta(days=self.retention_days)).isoformat()
+        file = self.__path(host, path)
+        with self.lock:
+            try:
+                with open(file) as f:
+                    lines = [line for line in f if json.loads(line)[0] >= border]
+            except FileNotFoundError:
+                return
+            with open(file + '.tmp', 'w') as f:
+                f.writelines(lines)
+            os.replace(file + '.tmp', file)
+
+    def clear(self, host, path):
+        with self.lock:
+            try:
+                os.remove(self.__path(host, path))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,42 @@
+# Максимальная длина текстового сообщения Telegram
+MAX_MESSAGE_LENGTH = 4096
+
+
+def utf16_length(text):
+    """Длина текста так, как её считает Telegram: в кодовых единицах UTF-16 (эмодзи - две)."""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def utf16_prefix(text, start, units):
+    """Сколько символов text начиная со start умещается в units кодовых единиц UTF-16."""
+    length = units
+    while True:
+        excess = utf16_length(text[start:start + length]) - units
+        if excess <= 0:
+            return min(length, len(text) - start)
+        # каждый символ занимает одну или две единицы
+        length -= (excess + 1) // 2
+
+
+def split_chunks(lines, max_length=MAX_MESSAGE_LENGTH):
+    """
+    Собирает строки в сообщения длиной не более max_length, разрезая по границам строк.
+    Строки длиннее max_length режутся на части.
+    Работает с любым итератором строк, поэтому первое сообщение готово,
+    как только набралось достаточно строк, а не после чтения всего вывода.
+    """
+    buffer, size = [], 0
+    for line in lines:
+        while len(line) > max_length:
+            if buffer:
+                yield ''.join(buffer)
+                buffer, size = [], 0
+            yield line[:max_length]
+            line = line[max_length:]
+        if size + len(line) > max_length:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+        buffer.append(line)
+        size += len(line)
+    if buffer:
+        yield ''.join(buffer)
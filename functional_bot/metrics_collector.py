@@ -0,0 +1,111 @@
+"""
+Периодический сбор метрик с хостов инвентаря.
+За один замер на хосте выполняется одна составная команда через пул SSH-соединений;
+разобранные значения записываются в MetricsStore. Вывод замера (без stderr) в кэш результатов
+команд пользователя не попадает: у /get_free, /get_mpstat и т.п. свой срок актуальности.
+"""
+import time
+import logging
+
+import fleet
+import host_parsers
+
+logger = logging.getLogger(__name__)
+
+# строка-разделитель частей вывода составной команды
+SECTION_MARKER = '#METRICS'
+
+# free -b: точные байты, а не округлённые единицы free -h (1.9Gi)
+COMMANDS = ('uptime', 'free -b', 'df -h', 'mpstat -P ALL 1 1', 'ss -tun')
+
+# псевдофайловые системы и образы snap (всегда заполнены на 100%) не учитываются
+SKIP_FILESYSTEMS = ('tmpfs', 'devtmpfs', 'udev', 'none', 'overlay')
+
+
+def sample_command(commands=COMMANDS):
+    return '; '.join(f"echo '{SECTION_MARKER} {index}'; {command} 2>/dev/null"
+                     for index, command in enumerate(commands))
+
+
+def split_sections(text, commands=COMMANDS):
+    """Вывод составной команды -> {команда: её вывод}."""
+    sections, current = {}, None
+    for line in text.splitlines(keepends=True):
+        if line.startswith(SECTION_MARKER):
+            current = commands[int(line.split()[1])]
+            sections[current] = []
+        elif current is not None:
+            sections[current].append(line)
+    return {command: ''.join(lines) for command, lines in sections.items()}
+
+
+def metrics(outputs):
+    """Значения метрик по выводу команд: загрузка, память и swap, диски (%), CPU (%), соединения."""
+    values = {}
+    load = host_parsers.parse_load(outputs.get('uptime', ''))
+    if load:
+        values['load1'], values['load5'], values['load15'] = load
+    for memory in host_parsers.parse_free(outputs.get('free -b', '')):
+        if memory.total:
+            values['mem' if memory.kind == 'Mem' else 'swap'] = 100 * memory.used / memory.total
+    disks = [disk for disk in host_parsers.parse_df(outputs.get('df -h', ''))
+             if disk.filesystem not in SKIP_FILESYSTEMS and not disk.filesystem.startswith('/dev/loop')]
+    for disk in disks:
+        values[f'disk:{disk.mount}'] = disk.use_percent
+    if disks:
+        values['disk'] = max(disk.use_percent for disk in disks)
+    for cpu in host_parsers.parse_mpstat(outputs.get('mpstat -P ALL 1 1', '')):
+        if cpu.cpu == 'all':
+            values['cpu'] = 100 - cpu.idle
+    if 'ss -tun' in outputs:
+        values['conns'] = sum(1 for socket in host_parsers.parse_ss(outputs['ss -tun']) if socket.state == 'ESTAB')
+    return values
+
+
+class MetricsCollector:
+    """
+    Сбор замеров со всех хостов, вызывается по расписанию (JobQueue.run_repeating).
+    run(host, command) -> bytes выполняет команду на хосте,
+    hosts() - список опрашиваемых хостов (fleet.Host).
+    listeners - функции listener(имя хоста, значения), вызываемые после каждого замера.
+    """
+
+    def __init__(self, store, run, hosts, executor, concurrency, interval=60, host_timeout=20):
+        self.store = store
+        self.run = run
+        self.hosts = hosts
+        self.executor = executor
+        self.concurrency = concurrency
+        self.interval = interval
+        self.host_timeout = host_timeout
+        self.last_compact = 0.0
+        self.listeners = []
+
+    def sample(self, host):
+        """Один замер хоста: значения метрик по выводу команд."""
+        text = self.run(host, sample_command()).decode('utf-8', errors='replace')
+        return metrics(split_sections(text))
+
+    def collect(self, context=None):
+        logger.info(f'Start {self.collect.__name__}')
+        started = time.time()
+        hosts = self.hosts()
+        collected = 0
+        # хосты опрашиваются волнами по concurrency штук
+        deadline = -(-len(hosts) // self.concurrency) * self.host_timeout
+        for host, values, error in fleet.fan_out(self.executor, hosts, self.sample, deadline):
+            if error is not None:
+                logger.warning(f'Замер {host.name} не получен: {error}')
+                continue
+            self.store.add(host.name, values, started)
+            collected += 1
+            for listener in self.listeners:
+                try:
+                    listener(host.name, values)
+                except Exception as error:
+                    logger.error(f'Ошибка обработчика замера {host.name}: {error}')
+        if started - self.last_compact >= self.store.rollup:
+            self.store.compact(started)
+            self.last_compact = started
+        logger.info(f'Stop {self.collect.__name__}: {collected}/{len(hosts)} хостов, '
+                    f'{time.time() - started:.1f} с')
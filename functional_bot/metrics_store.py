@@ -0,0 +1,122 @@
+"""
+Локальное хранилище временных рядов метрик хостов (SQLite).
+Свежие замеры хранятся как есть, старше raw_hours часов - сворачиваются
+в интервалы по rollup секунд (min/avg/max), старше retention_days дней - удаляются.
+"""
+import time
+import sqlite3
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+SPARK = '▁▂▃▄▅▆▇█'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    host   TEXT    NOT NULL,
+    metric TEXT    NOT NULL,
+    ts     INTEGER NOT NULL,
+    value  REAL    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS samples_host_metric_ts ON samples (host, metric, ts);
+CREATE TABLE IF NOT EXISTS rollups (
+    host   TEXT    NOT NULL,
+    metric TEXT    NOT NULL,
+    ts     INTEGER NOT NULL,
+    min    REAL    NOT NULL,
+    avg    REAL    NOT NULL,
+    max    REAL    NOT NULL,
+    count  INTEGER NOT NULL,
+    PRIMARY KEY (host, metric, ts)
+) WITHOUT ROWID;
+"""
+
+
+class MetricsStore:
+    """Замеры (хост, метрика, время, значение) с прореживанием и ограниченным сроком хранения."""
+
+    def __init__(self, path, raw_hours=24, rollup=300, retention_days=30):
+        self.path = path
+        self.raw_hours = raw_hours
+        self.rollup = rollup
+        self.retention_days = retention_days
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        self.__connection.executescript(SCHEMA)
+
+    def add(self, host, values, ts=None):
+        """Записывает замер: values - {метрика: число}."""
+        ts = int(ts or time.time())
+        with self.__lock, self.__connection:
+            self.__connection.executemany('INSERT INTO samples VALUES (?, ?, ?, ?)',
+                                          [(host, metric, ts, float(value)) for metric, value in values.items()]
+                                          )
+
+    def metrics(self, host):
+        with self.__lock:
+            rows = self.__connection.execute(
+                    'SELECT DISTINCT metric FROM samples WHERE host = ? '
+                    'UNION SELECT DISTINCT metric FROM rollups WHERE host = ?', (host, host)
+                    ).fetchall()
+        return sorted(metric for metric, in rows)
+
+    def series(self, host, metric, since, until=None):
+        """Точки (время, min, avg, max) за период: свёрнутые интервалы, затем сырые замеры."""
+        until = until or time.time()
+        with self.__lock:
+            return self.__connection.execute(
+                    'SELECT ts, min, avg, max FROM rollups WHERE host = ? AND metric = ? AND ts BETWEEN ? AND ? '
+                    'UNION ALL '
+                    'SELECT ts, value, value, value FROM samples WHERE host = ? AND metric = ? AND ts BETWEEN ? AND ? '
+                    'ORDER BY ts',
+                    (host, metric, since, until, host, metric, since, until)
+                    ).fetchall()
+
+    def compact(self, now=None):
+        """Сворачивает сырые замеры старше raw_hours и удаляет данные старше retention_days."""
+        now = now or time.time()
+        border = int(now - self.raw_hours * 3600) // self.rollup * self.rollup
+        expired = int(now - self.retention_days * 86400)
+        with self.__lock, self.__connection:
+            # интервал, уже свёрнутый раньше, объединяется с новыми замерами
+            rolled = self.__connection.execute(
+                    'INSERT INTO rollups '
+                    'SELECT host, metric, ts / :rollup * :rollup AS bucket, MIN(value), AVG(value), MAX(value), COUNT(*) '
+                    'FROM samples WHERE ts < :border GROUP BY host, metric, bucket '
+                    'ON CONFLICT (host, metric, ts) DO UPDATE SET '
+                    'min = MIN(min, excluded.min), max = MAX(max, excluded.max), '
+                    'avg = (avg * count + excluded.avg * excluded.count) / (count + excluded.count), '
+                    'count = count + excluded.count',
+                    {'rollup': self.rollup, 'border': border}
+                    ).rowcount
+            self.__connection.execute('DELETE FROM samples WHERE ts < ?', (border,))
+            self.__connection.execute('DELETE FROM rollups WHERE ts < ?', (expired,))
+        logger.info(f'Свёрнуто интервалов метрик: {rolled}')
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+
+def resample(points, since, until, width):
+    """Разбивает период на width интервалов: среднее значение в каждом (None, если точек нет)."""
+    step = (until - since) / width
+    sums, counts = [0.0] * width, [0] * width
+    for ts, _, avg, _ in points:
+        index = min(int((ts - since) / step), width - 1)
+        if index >= 0:
+            sums[index] += avg
+            counts[index] += 1
+    return [total / count if count else None for total, count in zip(sums, counts)]
+
+
+def sparkline(values):
+    """Строка из символов ▁..█ по значениям (пропуски - пробелы)."""
+    present = [value for value in values if value is not None]
+    if not present:
+        return ''
+    low, high = min(present), max(present)
+    scale = (len(SPARK) - 1) / (high - low) if high > low else 0
+    return ''.join(' ' if value is None else SPARK[round((value - low) * scale)] for value in values)
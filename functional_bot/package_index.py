@@ -0,0 +1,139 @@
+"""
+Индекс установленных пакетов хоста.
+Строится по одному выводу dpkg-query и перестраивается, только когда на хосте
+меняется /var/lib/dpkg/status или /var/log/dpkg.log (проверка mtime - одна короткая команда).
+Сведения о пакете берутся из индекса без обращения к хосту.
+"""
+import time
+import bisect
+import difflib
+import threading
+import logging
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('binary:Package', 'Version', 'Architecture', 'db:Status-Abbrev', 'Installed-Size',
+          'Section', 'Priority', 'Maintainer', 'Depends', 'binary:Summary')
+
+DUMP_COMMAND = "dpkg-query -W -f='" + '\\t'.join(f'${{{field}}}' for field in FIELDS) + "\\n'"
+
+MTIME_COMMAND = 'stat -c %Y /var/lib/dpkg/status /var/log/dpkg.log 2>/dev/null'
+
+
+@dataclass(slots=True)
+class Package:
+    name: str
+    version: str
+    architecture: str
+    status: str
+    installed_size: int  # КиБ
+    section: str
+    priority: str
+    maintainer: str
+    depends: str
+    summary: str
+
+    def details(self):
+        return (f'Package: {self.name}\n'
+                f'Version: {self.version}\n'
+                f'Architecture: {self.architecture}\n'
+                f'Status: {self.status}\n'
+                f'Installed-Size: {self.installed_size} KiB\n'
+                f'Section: {self.section}\n'
+                f'Priority: {self.priority}\n'
+                f'Maintainer: {self.maintainer}\n'
+                f'Depends: {self.depends}\n'
+                f'Description: {self.summary}')
+
+
+class PackageIndex:
+    """Пакеты хоста: словарь имя -> Package и отсортированный список имён для поиска по префиксу."""
+
+    def __init__(self, packages, mtime=None):
+        self.packages = {package.name: package for package in packages}
+        self.names = sorted(self.packages)
+        # multiarch-пакеты называются libssl3:amd64 - ищутся и без суффикса архитектуры
+        self.aliases = {name.partition(':')[0]: name for name in reversed(self.names) if ':' in name}
+        self.mtime = mtime
+        self.checked = time.monotonic()
+
+    @classmethod
+    def from_dump(cls, text, mtime=None):
+        """Разбор вывода DUMP_COMMAND; в индекс попадают только установленные пакеты (ii, hi)."""
+        packages = []
+        for line in text.split('\n'):
+            parts = line.split('\t')
+            if len(parts) != len(FIELDS) or parts[3].strip()[1:2] != 'i':
+                continue
+            parts[3] = parts[3].strip()
+            parts[4] = int(parts[4]) if parts[4].isdigit() else 0
+            packages.append(Package(*parts))
+        return cls(packages, mtime)
+
+    def __len__(self):
+        return len(self.names)
+
+    def get(self, name):
+        return self.packages.get(name) or self.packages.get(self.aliases.get(name))
+
+    def prefix(self, text):
+        start = bisect.bisect_left(self.names, text)
+        end = bisect.bisect_left(self.names, text + '\uffff', start)
+        return self.names[start:end]
+
+    def substring(self, text):
+        return [name for name in self.names if text in name]
+
+    def fuzzy(self, text, count=20):
+        return difflib.get_close_matches(text, self.names, n=count, cutoff=0.6)
+
+    def search(self, text):
+        """Поиск по префиксу, затем по подстроке, затем нечёткий. Возвращает (способ, имена)."""
+        text = text.strip().lower()
+        for mode, function in (('prefix', self.prefix), ('substring', self.substring), ('fuzzy', self.fuzzy)):
+            found = function(text)
+            if found:
+                return mode, found
+        return None, []
+
+    def diff(self, other):
+        """Сравнение с индексом другого хоста: (только здесь, только там, [(имя, версия здесь, версия там)])."""
+        only_here = [name for name in self.names if name not in other.packages]
+        only_there = [name for name in other.names if name not in self.packages]
+        changed = [(name, package.version, other.packages[name].version)
+                   for name, package in sorted(self.packages.items())
+                   if name in other.packages and package.version != other.packages[name].version]
+        return only_here, only_there, changed
+
+
+class PackageCatalog:
+    """
+    Индексы пакетов по хостам.
+    mtime файлов dpkg проверяется не чаще check_interval секунд, индекс перестраивается при его изменении.
+    """
+
+    def __init__(self, check_interval=60):
+        self.check_interval = check_interval
+        self.__indexes = {}
+        self.__locks = {}
+        self.__lock = threading.Lock()
+
+    def get(self, host, run, force=False):
+        """Индекс хоста host (имя); run(command) -> bytes выполняет команду на нём."""
+        with self.__lock:
+            lock = self.__locks.setdefault(host, threading.Lock())
+        with lock:
+            index = self.__indexes.get(host)
+            if index is not None and not force and time.monotonic() - index.checked < self.check_interval:
+                return index
+            mtimes = run(MTIME_COMMAND).decode().split()
+            mtime = max((int(value) for value in mtimes if value.isdigit()), default=None)
+            if index is not None and not force and mtime is not None and mtime == index.mtime:
+                index.checked = time.monotonic()
+                return index
+            logger.info(f'Построение индекса пакетов {host}')
+            index = PackageIndex.from_dump(run(DUMP_COMMAND).decode('utf-8', errors='replace'), mtime)
+            self.__indexes[host] = index
+            logger.info(f'Индекс пакетов {host}: {len(index)}')
+            return index
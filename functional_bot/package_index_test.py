@@ -0,0 +1,73 @@
+"""
+Тесты индекса пакетов: разбор вывода dpkg-query, поиск по префиксу, подстроке и нечёткий,
+multiarch-имена и сравнение хостов.
+
+Запуск:
+    python -m pytest package_index_test.py
+"""
+from package_index import PackageIndex
+
+DUMP = '\n'.join('\t'.join(fields) for fields in [
+    ('openssh-server', '1:8.9p1-3ubuntu0.10', 'amd64', 'ii ', '1520', 'net', 'optional',
+     'Ubuntu Developers <ubuntu-devel-discuss@lists.ubuntu.com>', 'openssh-client (= 1:8.9p1-3ubuntu0.10)',
+     'secure shell (SSH) server, for secure access from remote machines'),
+    ('openssh-client', '1:8.9p1-3ubuntu0.10', 'amd64', 'ii ', '4470', 'net', 'standard',
+     'Ubuntu Developers <ubuntu-devel-discuss@lists.ubuntu.com>', 'libc6 (>= 2.34)',
+     'secure shell (SSH) client, for secure access to remote machines'),
+    ('openssl', '3.0.2-0ubuntu1.15', 'amd64', 'ii ', '2061', 'utils', 'important', 'Ubuntu Developers', '',
+     'Secure Sockets Layer toolkit - cryptographic utility'),
+    ('libssl3:amd64', '3.0.2-0ubuntu1.15', 'amd64', 'ii ', '5797', 'libs', 'important', 'Ubuntu Developers',
+     'libc6 (>= 2.34)', 'Secure Sockets Layer toolkit - shared libraries'),
+    ('postgresql-14', '14.12-0ubuntu0.22.04.1', 'amd64', 'hi ', '50123', 'database', 'optional',
+     'Ubuntu Developers', 'postgresql-common (>= 241~)', 'The World\'s Most Advanced Open Source Database'),
+    # удалённый пакет с оставшимися конфигурационными файлами в индекс не попадает
+    ('apache2', '2.4.52-1ubuntu4.9', 'amd64', 'rc ', '', 'httpd', 'optional', 'Ubuntu Developers', '',
+     'Apache HTTP Server'),
+    ('nginx', '1.18.0-6ubuntu14.4', 'all', 'ii ', '49', 'httpd', 'optional', 'Ubuntu Developers', '',
+     'small, powerful, scalable web/proxy server'),
+]) + '\n'
+
+
+def test_from_dump_keeps_installed_packages():
+    index = PackageIndex.from_dump(DUMP, mtime=1729400000)
+    assert index.names == ['libssl3:amd64', 'nginx', 'openssh-client', 'openssh-server', 'openssl',
+                           'postgresql-14']
+    package = index.get('openssh-server')
+    assert (package.version, package.status, package.installed_size) == ('1:8.9p1-3ubuntu0.10', 'ii', 1520)
+    assert index.get('postgresql-14').status == 'hi'
+    assert index.get('apache2') is None
+    assert 'Installed-Size: 1520 KiB' in package.details()
+
+
+def test_multiarch_alias():
+    index = PackageIndex.from_dump(DUMP)
+    assert index.get('libssl3').name == 'libssl3:amd64'
+
+
+def test_search_prefix_then_substring_then_fuzzy():
+    index = PackageIndex.from_dump(DUMP)
+    assert index.search('openssh') == ('prefix', ['openssh-client', 'openssh-server'])
+    assert index.search(' OpenSSL ') == ('prefix', ['openssl'])
+    assert index.search('ssl') == ('substring', ['libssl3:amd64', 'openssl'])
+    assert index.search('ssh-server') == ('substring', ['openssh-server'])
+    assert index.search('ngnix') == ('fuzzy', ['nginx'])
+    assert index.search('postgresql-41')[0] == 'fuzzy'
+    assert index.search('zzzzzz') == (None, [])
+
+
+def test_prefix_bounds():
+    index = PackageIndex.from_dump(DUMP)
+    assert index.prefix('openssh-') == ['openssh-client', 'openssh-server']
+    assert index.prefix('openssh-server') == ['openssh-server']
+    assert index.prefix('openssh-serverx') == []
+    assert index.prefix('') == index.names
+
+
+def test_diff_between_hosts():
+    here = PackageIndex.from_dump(DUMP)
+    there = PackageIndex.from_dump(DUMP.replace('1.18.0-6ubuntu14.4', '1.18.0-6ubuntu14.5')
+                                   .replace('openssl\t', 'openssl-dev\t'))
+    only_here, only_there, changed = here.diff(there)
+    assert only_here == ['openssl']
+    assert only_there == ['openssl-dev']
+    assert changed == [('nginx', '1.18.0-6ubuntu14.4', '1.18.0-6ubuntu14.5')]
@@ -0,0 +1,161 @@
+"""
+Постраничный просмотр больших результатов команд.
+Текст хранится на стороне бота в LRU-хранилище, ограниченном по объёму;
+границы страниц вычисляются по мере листания, а не заранее.
+"""
+import io
+import re
+import sys
+import gzip
+import itertools
+import threading
+import logging
+from collections import OrderedDict
+
+from message_chunks import MAX_MESSAGE_LENGTH, utf16_prefix
+
+logger = logging.getLogger(__name__)
+
+# пометка в конце документа, не поместившегося в хранилище целиком
+TRUNCATED = '\n… вывод обрезан: сохранено {size} символов\n'
+
+
+class Document:
+    """Текст результата и найденные начала его страниц; размер страницы - в единицах UTF-16, как у Telegram."""
+
+    def __init__(self, text, title, page_size, truncated=False):
+        self.text = text
+        self.title = title
+        # пометка хранится отдельно: кириллица в тексте удвоила бы его размер в памяти
+        self.note = TRUNCATED.format(size=len(text)) if truncated else ''
+        self.page_size = page_size
+        self.offsets = [0]
+        self.complete = not text
+        self.size = sys.getsizeof(text)
+
+    def __extend(self, number):
+        """Находит границы страниц до number-й (или до конца текста)."""
+        while not self.complete and len(self.offsets) <= number:
+            start = self.offsets[-1]
+            # последняя страница вместе с пометкой об обрезке умещается в одно сообщение
+            if start + utf16_prefix(self.text, start, self.page_size - len(self.note)) >= len(self.text):
+                self.complete = True
+                break
+            # страница заканчивается на границе строки, слишком длинная строка режется
+            length = utf16_prefix(self.text, start, self.page_size)
+            end = self.text.rfind('\n', start, start + length) + 1
+            self.offsets.append(end if end > start else start + length)
+
+    @property
+    def pages(self):
+        """Число страниц; None, пока конец текста не достигнут листанием."""
+        return len(self.offsets) if self.complete else None
+
+    def page(self, number):
+        """(текст страницы, её номер): номер ограничивается первой и последней страницей."""
+        # нужна и граница следующей страницы - конец текущей
+        self.__extend(max(number, 0) + 1)
+        number = min(max(number, 0), len(self.offsets) - 1)
+        if number + 1 < len(self.offsets):
+            return self.text[self.offsets[number]:self.offsets[number + 1]], number
+        return self.text[self.offsets[number]:] + self.note, number
+
+    def last(self):
+        self.__extend(sys.maxsize)
+        return len(self.offsets) - 1
+
+
+class Pager:
+    """Хранилище документов для листания, вытесняющее давно не просмотренные при превышении max_bytes."""
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, page_size=MAX_MESSAGE_LENGTH):
+        self.max_bytes = max_bytes
+        self.page_size = page_size
+        self.__documents = OrderedDict()
+        self.__size = 0
+        self.__ids = itertools.count()
+        self.__lock = threading.Lock()
+        self.__stats = {'documents': 0, 'evictions': 0, 'page_views': 0, 'downloads': 0}
+
+    def truncate(self, text):
+        """(текст, занимающий не больше max_bytes, был ли он обрезан): лишнее отрезается по границе строки."""
+        size = sys.getsizeof(text)
+        if size <= self.max_bytes:
+            return text, False
+        length = int(len(text) * self.max_bytes / size)
+        # заголовок строки не пропорционален длине: начало укорачивается, пока не уложится
+        while length and sys.getsizeof(text[:length]) > self.max_bytes:
+            length -= 64
+        end = text.rfind('\n', 0, length) + 1
+        return text[:end or length], True
+
+    def add(self, text, title='output', truncated=False):
+        """Сохраняет документ; текст больше max_bytes обрезается, а не хранится целиком."""
+        text, cut = self.truncate(text)
+        document = Document(text, title, self.page_size, truncated or cut)
+        with self.__lock:
+            document_id = next(self.__ids)
+            self.__documents[document_id] = document
+            self.__size += document.size
+            self.__stats['documents'] += 1
+            while self.__size > self.max_bytes and len(self.__documents) > 1:
+                _, evicted = self.__documents.popitem(last=False)
+                self.__size -= evicted.size
+                self.__stats['evictions'] += 1
+        return document_id
+
+    def add_chunks(self, chunks, title='output'):
+        """
+        Документ из частей текста: читается не больше max_bytes символов, остаток не читается.
+        Возвращает (номер документа, был ли текст обрезан).
+        """
+        parts, length, truncated = [], 0, False
+        for chunk in chunks:
+            if length + len(chunk) > self.max_bytes:
+                parts.append(chunk[:self.max_bytes - length])
+                truncated = True
+                break
+            parts.append(chunk)
+            length += len(chunk)
+        close = getattr(chunks, 'close', None)
+        if truncated and close is not None:
+            close()
+        text = ''.join(parts)
+        if truncated:
+            end = text.rfind('\n') + 1
+            text = text[:end] if end else text
+        return self.add(text, title, truncated), truncated
+
+    def get(self, document_id):
+        """Документ (None, если он вытеснен); просмотренный документ становится самым свежим."""
+        with self.__lock:
+            document = self.__documents.get(document_id)
+            if document is not None:
+                self.__documents.move_to_end(document_id)
+            return document
+
+    def page(self, document_id, number):
+        """(текст, номер страницы, всего страниц или None) или None, если документ вытеснен."""
+        document = self.get(document_id)
+        if document is None:
+            return None
+        with self.__lock:
+            self.__stats['page_views'] += 1
+            if number < 0:
+                number = document.last()
+            text, number = document.page(number)
+            return text, number, document.pages
+
+    def gzip(self, document_id):
+        """(сжатый файл, имя файла) или None, если документ вытеснен."""
+        document = self.get(document_id)
+        if document is None:
+            return None
+        with self.__lock:
+            self.__stats['downloads'] += 1
+        data = io.BytesIO(gzip.compress((document.text + document.note).encode('utf-8')))
+        return data, re.sub(r'[^\w.-]+', '_', document.title)[:60] + '.txt.gz'
+
+    def stats(self):
+        with self.__lock:
+            return dict(self.__stats, entries=len(self.__documents), bytes=self.__size)
@@ -0,0 +1,106 @@
+"""
+Тесты постраничного просмотра: число страниц, границы строк, предел 4096 единиц UTF-16
+и обрезка документов больше max_bytes.
+
+Запуск:
+    python -m pytest pager_test.py
+"""
+import gzip
+
+from message_chunks import MAX_MESSAGE_LENGTH, utf16_length
+from pager import Pager
+
+
+def all_pages(pager, document_id):
+    pages, number = [], 0
+    while True:
+        text, number, total = pager.page(document_id, number)
+        pages.append(text)
+        if total is not None and number == total - 1:
+            return pages
+        number += 1
+
+
+def test_pages_end_on_line_boundaries():
+    lines = [f'{index:05d} ' + 'x' * 93 + '\n' for index in range(1000)]
+    pager = Pager(page_size=1000)
+    document_id = pager.add(''.join(lines))
+    # до листания до конца число страниц неизвестно
+    assert pager.page(document_id, 0)[2] is None
+    pages = all_pages(pager, document_id)
+    assert len(pages) == 100
+    assert ''.join(pages) == ''.join(lines)
+    assert all(page.endswith('\n') and len(page) <= 1000 for page in pages)
+    # страница за концом - последняя
+    assert pager.page(document_id, 500)[1:] == (99, 100)
+    assert pager.page(document_id, -1)[1:] == (99, 100)
+
+
+def test_long_line_is_cut():
+    pager = Pager(page_size=100)
+    document_id = pager.add('y' * 250)
+    assert [len(page) for page in all_pages(pager, document_id)] == [100, 100, 50]
+
+
+def test_pages_fit_telegram_utf16_limit():
+    # эмодзи - два символа UTF-16: 4096 символов строки заняли бы 8192 единицы
+    line = '🔥' * 30 + ' диск заполнен\n'
+    text = line * 400
+    pager = Pager()
+    document_id = pager.add(text)
+    pages = all_pages(pager, document_id)
+    assert ''.join(pages) == text
+    assert all(utf16_length(page) <= MAX_MESSAGE_LENGTH for page in pages)
+    assert all(page.endswith('\n') for page in pages)
+    assert utf16_length(pages[0]) > MAX_MESSAGE_LENGTH - utf16_length(line)
+
+
+def test_oversized_text_is_truncated_with_notice():
+    text = ''.join(f'line {index}\n' for index in range(20000))
+    pager = Pager(max_bytes=64 * 1024, page_size=500)
+    document_id = pager.add(text)
+    pages = all_pages(pager, document_id)
+    stored = ''.join(pages)
+    assert pages[-1].endswith('\n… вывод обрезан: сохранено ' + str(len(stored.split('\n…')[0])) + ' символов\n')
+    assert all(len(page) <= 500 for page in pages)
+    body = stored.split('\n…')[0]
+    assert text.startswith(body) and body.endswith('\n') and len(body) < len(text)
+    assert pager.stats()['bytes'] <= 64 * 1024
+    data, name = pager.gzip(document_id)
+    assert gzip.decompress(data.getvalue()).decode('utf-8') == stored
+    assert name == 'output.txt.gz'
+
+
+def test_add_chunks_stops_reading_at_max_bytes():
+    read, closed = [], []
+
+    def chunks():
+        try:
+            for index in range(1000):
+                read.append(index)
+                yield f'chunk {index:04d}\n' * 100
+        finally:
+            closed.append(True)
+
+    pager = Pager(max_bytes=10000)
+    document_id, truncated = pager.add_chunks(chunks(), 'journalctl -p err')
+    assert truncated and closed == [True]
+    # 1100 символов на часть: десятая уже не помещается, дальше генератор не читается
+    assert len(read) == 10
+    text = ''.join(all_pages(pager, document_id))
+    assert text.rstrip().endswith('символов') and '… вывод обрезан' in text
+
+    document_id, truncated = pager.add_chunks(iter(['short\n', 'output\n']))
+    assert not truncated
+    assert pager.page(document_id, 0) == ('short\noutput\n', 0, 1)
+
+
+def test_least_recently_viewed_document_is_evicted():
+    pager = Pager(max_bytes=30000)
+    first = pager.add('a\n' * 5000)
+    second = pager.add('b\n' * 5000)
+    pager.page(first, 0)
+    pager.add('c\n' * 5000)
+    assert pager.page(second, 0) is None
+    assert pager.page(first, 0) is not None
+    assert pager.stats()['evictions'] == 1
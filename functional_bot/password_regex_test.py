@@ -1,4 +1,4 @@
-import re
+import extractors
 
 text = (
         'G4dL8pM*\n'
@@ -17,7 +17,7 @@ text = (
         'M4dL8pJ#\n'
         'E8pS4dK*\n'
 )
-passwdRegex = re.compile(r'(?=.*[A-Z])(?=.*[a-z])(?=.*\d)(?=.*[@$!%*#?&])[A-Za-z\d@$!%*#?&]{8,}')  # формат
+passwdRegex = extractors.PASSWORD  # формат из общего реестра
 
 passwdList = passwdRegex.findall(text)
 print(*passwdList, sep='\n')
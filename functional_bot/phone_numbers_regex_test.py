@@ -1,4 +1,4 @@
-import re
+import extractors
 
 text = ("jhgfds8 (978) 011-68-38poiuytrewq,./;[]=-0987654321~!@#$%^&*()_+7-978-011-68-38|}"
         "{:?><,./;[]=-0987654321!@#$%^&*()_8 (978) 011 68 38poiuytrewq,./;[]=-0987654321~"
@@ -9,7 +9,7 @@ text = ("jhgfds8 (978) 011-68-38poiuytrewq,./;[]=-0987654321~!@#$%^&*()_+7-978-0
         "^&*()_+7 (978) 0116838|}{:?><,./;[]=-0987654321!@#$%^&*()_8-978-011-68-38poiu"
         "ytrewq,./;[]=-0987654321~!@#$%^&*()_+7(978)0116838|}{:?><,./;[]=-0987654321!@#$%"
         "^&*()+79780116838")
-phoneNumRegex = re.compile(r'(\+7|8)(\s?[(-]?\d{3}[)-]?\s?\d{3}-?\s?\d{2}-?\s?\d{2})')  # формат
+phoneNumRegex = extractors.PHONE  # формат из общего реестра
 
 phoneNumberList = phoneNumRegex.findall(text)
 print(*phoneNumberList, sep='\n')
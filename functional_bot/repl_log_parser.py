@@ -0,0 +1,78 @@
+"""
+Однопроходный разбор лога репликации PostgreSQL.
+Тип события определяется по префиксу сообщения после 'LOG:  ' через таблицу диспетчеризации,
+после чего поля извлекаются одним регулярным выражением только для строк-событий.
+Строки, не являющиеся событиями репликации, отбрасываются без запуска регулярных выражений.
+"""
+import re
+from typing import NamedTuple
+
+import extractors
+
+# дата и время в начале строки лога
+LINE_HEAD = re.compile(r'(\d{4}-\d{2}-\d{2})\s([0-9:.]+)\s')
+
+# уровень сообщения, после которого идёт его текст
+LOG_MARKER = 'LOG:  '
+
+# префикс сообщения (до первого ':') -> (тип события, шаблон полей или None, если поле - остаток сообщения)
+DISPATCH = {
+        'connection received'              : ('received', extractors.REPL_HOST_PORT),
+        'connection authenticated'         : ('authenticated', extractors.REPL_IDENTITY_METHOD),
+        'connection authorized'            : ('authorized', extractors.REPL_USER_APPLICATION),
+        'replication connection authorized': ('authorized', extractors.REPL_USER_APPLICATION),
+        'received replication command'     : ('command', None),
+        'disconnection'                    : ('disconnection', extractors.REPL_DISCONNECTION_INFO),
+        }
+
+
+class ReplEvent(NamedTuple):
+    """Событие лога репликации: дата, время, тип и поля события."""
+    date: str
+    time: str
+    kind: str
+    fields: tuple
+
+    def as_tuple(self):
+        """Кортеж в формате вывода бота: дата, время, ТИП, поля..."""
+        return (self.date, self.time, self.kind.upper()) + self.fields
+
+
+def parse_line(line):
+    """Возвращает ReplEvent для строки лога или None, если строка не описывает событие репликации."""
+    position = line.find(LOG_MARKER)
+    if position < 0:
+        return None
+    message = line[position + len(LOG_MARKER):]
+    prefix, _, body = message.partition(':')
+    entry = DISPATCH.get(prefix)
+    if entry is None:
+        return None
+    head = LINE_HEAD.match(line)
+    if head is None:
+        return None
+    kind, template = entry
+    if template is None:
+        fields = (body.strip(),)
+        if not fields[0]:
+            return None
+    else:
+        match = template.search(body)
+        if match is None:
+            return None
+        fields = match.groups()
+    return ReplEvent(head[1], head[2], kind, fields)
+
+
+def parse_lines(lines, date=None):
+    """
+    Разбирает строки лога и отдаёт события по одному.
+    date (YYYY-MM-DD) - оставить только события этой даты; строки других дат
+    отбрасываются сравнением префикса.
+    """
+    for line in lines:
+        if date is not None and not line.startswith(date):
+            continue
+        event = parse_line(line.strip())
+        if event is not None:
+            yield event
@@ -0,0 +1,112 @@
+import sys
+import time
+import threading
+import logging
+from collections import OrderedDict
+
+from ssh_pool import CommandTimeout, CommandCancelled, POLL_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """Загрузка значения, которую ожидают все одновременные запросы того же ключа."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResultCache:
+    """
+    Кэш результатов команд с временем жизни записи и LRU-вытеснением.
+    Объём кэша ограничен max_bytes, одновременные запросы одного ключа
+    объединяются в одну загрузку.
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.__entries = OrderedDict()  # key -> (expires, value, size)
+        self.__size = 0
+        self.__flights = {}  # key -> _Flight
+        self.__lock = threading.Lock()
+        self.__stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'evictions': 0}
+
+    def get_or_load(self, key, ttl, loader, force=False, timeout=None, cancel_event=None):
+        """
+        Возвращает значение по ключу, при отсутствии или устаревании вызывает loader().
+        force - не использовать сохранённое значение и загрузить заново.
+        timeout, cancel_event - таймаут и отмена собственной команды, пока она ждёт чужую загрузку.
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+        while True:
+            with self.__lock:
+                if not force:
+                    entry = self.__entries.get(key)
+                    if entry is not None and entry[0] > time.monotonic():
+                        self.__entries.move_to_end(key)
+                        self.__stats['hits'] += 1
+                        return entry[1]
+                flight = self.__flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self.__flights[key] = _Flight()
+                    self.__stats['misses'] += 1
+                else:
+                    self.__stats['coalesced'] += 1
+            if leader:
+                break
+
+            while not flight.done.wait(POLL_INTERVAL):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise CommandCancelled()
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise CommandTimeout()
+            # отмена или таймаут чужой команды - не ошибка загрузки: значение загружается заново
+            if isinstance(flight.error, (CommandCancelled, CommandTimeout)):
+                continue
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+            self.put(key, flight.value, ttl)
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self.__lock:
+                self.__flights.pop(key, None)
+            flight.done.set()
+        return flight.value
+
+    def put(self, key, value, ttl):
+        size = sys.getsizeof(value)
+        if value is None or not ttl or size > self.max_bytes:
+            return
+        with self.__lock:
+            self.__discard(key)
+            self.__entries[key] = (time.monotonic() + ttl, value, size)
+            self.__size += size
+            while self.__size > self.max_bytes:
+                old_key, _ = next(iter(self.__entries.items()))
+                self.__discard(old_key)
+                self.__stats['evictions'] += 1
+
+    def __discard(self, key):
+        entry = self.__entries.pop(key, None)
+        if entry is not None:
+            self.__size -= entry[2]
+
+    def invalidate(self, key):
+        with self.__lock:
+            self.__discard(key)
+
+    def stats(self):
+        with self.__lock:
+            stats = dict(self.__stats)
+            stats['entries'] = len(self.__entries)
+            stats['bytes'] = self.__size
+        return stats
@@ -0,0 +1,101 @@
+"""
+Регрессионные тесты объединения одновременных загрузок ResultCache:
+ожидающий запрос подчиняется своим таймауту и отмене, а не чужим.
+
+Запуск:
+    python -m pytest result_cache_test.py
+"""
+import threading
+import time
+
+import pytest
+
+from result_cache import ResultCache
+from ssh_pool import CommandTimeout, CommandCancelled
+
+
+def start_leader(cache, key, release, error=None):
+    """Загрузка-лидер, которая ждёт release и возвращает 'leader' или падает с error."""
+    started = threading.Event()
+    result = {}
+
+    def loader():
+        started.set()
+        release.wait(5)
+        if error is not None:
+            raise error
+        return 'leader'
+
+    def run():
+        try:
+            result['value'] = cache.get_or_load(key, 60, loader)
+        except Exception as exc:
+            result['error'] = exc
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    assert started.wait(5)
+    return thread, result
+
+
+@pytest.mark.parametrize('error', [CommandCancelled(), CommandTimeout()])
+def test_follower_reloads_after_leader_cancelled(error):
+    cache = ResultCache()
+    release = threading.Event()
+    leader, leader_result = start_leader(cache, 'key', release, error)
+    follower_result = {}
+
+    def follower():
+        follower_result['value'] = cache.get_or_load('key', 60, lambda: 'follower', timeout=5)
+
+    thread = threading.Thread(target=follower)
+    thread.start()
+    time.sleep(0.1)
+    release.set()
+    leader.join(5)
+    thread.join(5)
+    assert leader_result['error'] is error
+    assert follower_result == {'value': 'follower'}
+
+
+def test_follower_gets_loader_error():
+    cache = ResultCache()
+    release = threading.Event()
+    leader, _ = start_leader(cache, 'key', release, ValueError('bad output'))
+    follower_result = {}
+
+    def follower():
+        try:
+            cache.get_or_load('key', 60, lambda: 'follower', timeout=5)
+        except ValueError as exc:
+            follower_result['error'] = exc
+
+    thread = threading.Thread(target=follower)
+    thread.start()
+    time.sleep(0.1)
+    release.set()
+    leader.join(5)
+    thread.join(5)
+    assert str(follower_result['error']) == 'bad output'
+
+
+def test_follower_own_timeout_and_cancel():
+    cache = ResultCache()
+    release = threading.Event()
+    leader, leader_result = start_leader(cache, 'key', release)
+    try:
+        start = time.monotonic()
+        with pytest.raises(CommandTimeout):
+            cache.get_or_load('key', 60, lambda: 'follower', timeout=0.3)
+        assert time.monotonic() - start < 2
+
+        cancelled = threading.Event()
+        threading.Timer(0.2, cancelled.set).start()
+        with pytest.raises(CommandCancelled):
+            cache.get_or_load('key', 60, lambda: 'follower', cancel_event=cancelled)
+    finally:
+        release.set()
+        leader.join(5)
+    # лидер не затронут ни таймаутом, ни отменой ожидавших
+    assert leader_result == {'value': 'leader'}
+    assert cache.get_or_load('key', 60, lambda: 'again') == 'leader'
@@ -0,0 +1,278 @@
+"""
+Центральная очередь исходящих сообщений Telegram.
+Частота отправки ограничивается корзинами токенов по опубликованным лимитам Telegram:
+около 30 сообщений в секунду всего, около одного сообщения в секунду в один чат
+и не более 20 сообщений в минуту в группу.
+Ответ RetryAfter (429) приостанавливает отправку на указанное время, после чего запрос повторяется.
+"""
+import time
+import threading
+import logging
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+from telegram import Bot, ReplyKeyboardMarkup
+from telegram.error import RetryAfter, TimedOut, NetworkError, BadRequest
+from telegram.utils.helpers import DefaultValue
+
+from message_chunks import MAX_MESSAGE_LENGTH
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """rate токенов в секунду, не более capacity накопленных."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def delay(self, now):
+        """Через сколько секунд будет доступен токен (0 - доступен сейчас)."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+def _chat_key(chat_id):
+    """
+    Идентификатор чата для корзин и очередей: CHAT_ID из окружения приходит строкой,
+    а '-100…' и -100… - одна и та же группа. Имя канала ('@channel') остаётся строкой
+    """
+    try:
+        return int(chat_id)
+    except (TypeError, ValueError):
+        return chat_id
+
+
+class _Request:
+    """Вызов метода Bot, ожидающий отправки; futures - ожидающие его результат (несколько при объединении)."""
+
+    __slots__ = ('chat_id', 'function', 'kwargs', 'futures', 'queued', 'attempts', 'not_before')
+
+    def __init__(self, chat_id, function, kwargs):
+        self.chat_id = chat_id
+        self.function = function
+        self.kwargs = kwargs
+        self.futures = [(Future(), time.monotonic())]
+        self.queued = time.monotonic()
+        self.attempts = 0
+        self.not_before = 0.0
+
+    def coalesce_key(self):
+        """
+        Объединяются только отправки текста с обычной клавиатурой (ReplyKeyboardMarkup) -
+        такие сообщения бот потом не редактирует. Сообщения без клавиатуры или с кнопками
+        (страницы, таблицы группы хостов) могут редактироваться и отправляются как есть.
+        Параметры, не заданные явно (None или DEFAULT_NONE из Message.reply_text), объединению не мешают.
+        """
+        markup = self.kwargs.get('reply_markup')
+        options = {name for name, value in self.kwargs.items()
+                   if value is not None and not isinstance(value, DefaultValue)}
+        if not isinstance(markup, ReplyKeyboardMarkup) or options - {'chat_id', 'text', 'reply_markup', 'parse_mode'}:
+            return None
+        return self.function, self.kwargs.get('parse_mode'), markup.to_json()
+
+
+class SendQueue:
+    """
+    Очередь вызовов Bot с ограничением частоты.
+    Запросы одного чата отправляются по порядку, чаты обслуживаются по кругу;
+    подряд идущие короткие сообщения одного чата объединяются в одно.
+    """
+
+    def __init__(self, global_rate=30, chat_rate=1, chat_burst=3, group_per_minute=20, workers=4, retries=3):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_per_minute = group_per_minute
+        self.workers = workers
+        self.retries = retries
+        self.__global = TokenBucket(global_rate, global_rate)
+        self.__buckets = {}  # chat_id -> [корзины чата]
+        self.__queues = OrderedDict()  # chat_id -> deque запросов, порядок - очередь обслуживания чатов
+        self.__busy = set()  # чаты, запрос которых отправляется сейчас
+        self.__paused_until = 0.0
+        self.__cond = threading.Condition()
+        self.__threads = []
+        self.__stopped = False
+        self.__stats = {'submitted': 0, 'sent': 0, 'coalesced': 0, 'retries': 0, 'retry_after': 0, 'failed': 0,
+                        'wait_total': 0.0, 'wait_max': 0.0}
+
+    @property
+    def running(self):
+        return bool(self.__threads) and not self.__stopped
+
+    def start(self):
+        self.__stopped = False
+        self.__threads = [threading.Thread(target=self.__loop, name=f'send-{i}', daemon=True)
+                          for i in range(self.workers)]
+        for thread in self.__threads:
+            thread.start()
+
+    def stop(self, timeout=5):
+        """Останавливает отправку, дождавшись уже поставленных запросов (не дольше timeout секунд)."""
+        with self.__cond:
+            self.__stopped = True
+            self.__cond.notify_all()
+        for thread in self.__threads:
+            thread.join(timeout)
+        self.__threads = []
+
+    def call(self, chat_id, function, kwargs):
+        """Ставит вызов function(**kwargs) в очередь и дожидается результата."""
+        if not self.running:
+            return function(**kwargs)
+        return self.submit(chat_id, function, kwargs).result()
+
+    def submit(self, chat_id, function, kwargs):
+        request = _Request(_chat_key(chat_id), function, kwargs)
+        with self.__cond:
+            self.__queues.setdefault(request.chat_id, deque()).append(request)
+            self.__stats['submitted'] += 1
+            self.__cond.notify()
+        return request.futures[0][0]
+
+    def __chat_buckets(self, chat_id):
+        buckets = self.__buckets.get(chat_id)
+        if buckets is None:
+            buckets = self.__buckets[chat_id] = []
+            if chat_id is not None:
+                buckets.append(TokenBucket(self.chat_rate, self.chat_burst))
+                if isinstance(chat_id, int) and chat_id < 0:
+                    buckets.append(TokenBucket(self.group_per_minute / 60, self.group_per_minute))
+        return buckets
+
+    def __coalesce(self, request, queue):
+        """Присоединяет к request следующие запросы чата с тем же ключом, пока текст помещается в сообщение."""
+        key = request.coalesce_key()
+        if key is None:
+            return
+        while queue and queue[0].coalesce_key() == key and queue[0].attempts == 0:
+            text = request.kwargs['text'] + '\n' + queue[0].kwargs['text']
+            if len(text) > MAX_MESSAGE_LENGTH:
+                break
+            following = queue.popleft()
+            request.kwargs = dict(request.kwargs, text=text)
+            request.futures += following.futures
+            self.__stats['coalesced'] += 1
+
+    def __next(self, now):
+        """Следующий запрос, который можно отправить сейчас, или (None, сколько ждать)."""
+        wait = max(self.__paused_until - now, self.__global.delay(now))
+        if wait > 0:
+            return None, wait
+        wait = 1.0
+        for chat_id, queue in self.__queues.items():
+            if chat_id in self.__busy:
+                continue
+            buckets = self.__chat_buckets(chat_id)
+            delay = max([queue[0].not_before - now] + [bucket.delay(now) for bucket in buckets])
+            if delay > 0:
+                wait = min(wait, delay)
+                continue
+            request = queue.popleft()
+            self.__coalesce(request, queue)
+            if queue:
+                self.__queues.move_to_end(chat_id)
+            else:
+                del self.__queues[chat_id]
+            for bucket in buckets + [self.__global]:
+                bucket.take()
+            self.__busy.add(chat_id)
+            return request, 0
+        return None, wait
+
+    def __loop(self):
+        while True:
+            with self.__cond:
+                while True:
+                    if not self.__queues and self.__stopped:
+                        return
+                    request, wait = self.__next(time.monotonic()) if self.__queues else (None, None)
+                    if request is not None:
+                        break
+                    self.__cond.wait(wait)
+            self.__execute(request)
+
+    def __requeue(self, request, delay, counter):
+        with self.__cond:
+            request.attempts += 1
+            request.not_before = time.monotonic() + delay
+            self.__queues.setdefault(request.chat_id, deque()).appendleft(request)
+            self.__queues.move_to_end(request.chat_id, last=False)
+            self.__stats[counter] += 1
+
+    def __execute(self, request):
+        try:
+            result = request.function(**request.kwargs)
+        except RetryAfter as error:
+            logger.warning(f'Telegram RetryAfter {error.retry_after} с, чат {request.chat_id}')
+            with self.__cond:
+                self.__paused_until = time.monotonic() + error.retry_after
+            self.__requeue(request, error.retry_after, 'retry_after')
+        except TimedOut as error:
+            # запрос мог дойти до Telegram: повтор отправил бы сообщение дважды
+            logger.warning(f'Таймаут отправки в чат {request.chat_id}, без повтора: {error}')
+            self.__finish(request, error=error)
+        except NetworkError as error:
+            if isinstance(error, BadRequest) or request.attempts >= self.retries:
+                self.__finish(request, error=error)
+            else:
+                logger.warning(f'Ошибка отправки в чат {request.chat_id}, повтор: {error}')
+                self.__requeue(request, 2 ** request.attempts, 'retries')
+        except Exception as error:
+            self.__finish(request, error=error)
+        else:
+            self.__finish(request, result=result)
+        finally:
+            with self.__cond:
+                self.__busy.discard(request.chat_id)
+                self.__cond.notify_all()
+
+    def __finish(self, request, result=None, error=None):
+        now = time.monotonic()
+        with self.__cond:
+            self.__stats['sent' if error is None else 'failed'] += 1
+            for _, queued in request.futures:
+                self.__stats['wait_total'] += now - queued
+                self.__stats['wait_max'] = max(self.__stats['wait_max'], now - queued)
+        for future, _ in request.futures:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def stats(self):
+        with self.__cond:
+            stats = dict(self.__stats)
+            stats['queue_depth'] = sum(len(queue) for queue in self.__queues.values())
+        finished = stats['sent'] + stats['failed'] + stats['coalesced']
+        stats['wait_avg'] = stats['wait_total'] / finished if finished else 0.0
+        return stats
+
+
+class QueuedBot(Bot):
+    """Bot, отправляющий сообщения и изменения сообщений через SendQueue."""
+
+    def __init__(self, *args, send_queue, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.send_queue = send_queue
+
+    def send_message(self, chat_id, text, **kwargs):
+        return self.send_queue.call(chat_id, super().send_message, dict(kwargs, chat_id=chat_id, text=text))
+
+    def edit_message_text(self, text, chat_id=None, **kwargs):
+        return self.send_queue.call(chat_id, super().edit_message_text, dict(kwargs, chat_id=chat_id, text=text))
+
+    def edit_message_reply_markup(self, chat_id=None, **kwargs):
+        return self.send_queue.call(chat_id, super().edit_message_reply_markup, dict(kwargs, chat_id=chat_id))
+
+    def send_document(self, chat_id, document, **kwargs):
+        return self.send_queue.call(chat_id, super().send_document,
+                                    dict(kwargs, chat_id=chat_id, document=document)
+                                    )
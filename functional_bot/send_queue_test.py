@@ -0,0 +1,69 @@
+"""
+Тесты очереди отправки: объединение ответов с обычной клавиатурой и корзины чатов по CHAT_ID.
+
+Запуск:
+    python -m pytest send_queue_test.py
+"""
+import datetime
+import threading
+
+from telegram import Chat, Message, ReplyKeyboardMarkup
+
+from send_queue import SendQueue
+
+
+class CapturingBot:
+    """Запоминает аргументы send_message так, как их передаёт Message.reply_text."""
+
+    defaults = None
+
+    def __init__(self):
+        self.calls = []
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.calls.append(dict(kwargs, chat_id=chat_id, text=text))
+
+
+def reply_text_kwargs(text, markup):
+    bot = CapturingBot()
+    message = Message(1, datetime.datetime.now(), Chat(42, Chat.PRIVATE), bot=bot)
+    message.reply_text(text, reply_markup=markup)
+    return bot.calls[0]
+
+
+def test_reply_text_requests_coalesce():
+    markup = ReplyKeyboardMarkup([['/get_uptime']], resize_keyboard=True)
+    sent = []
+    lock = threading.Lock()
+
+    def send_message(**kwargs):
+        with lock:
+            sent.append(kwargs['text'])
+        return len(sent)
+
+    queue = SendQueue(workers=1)
+    # оба запроса уже в очереди, когда начинается отправка
+    futures = [queue.submit(42, send_message, reply_text_kwargs(text, markup)) for text in ('first', 'second')]
+    queue.start()
+    try:
+        assert [future.result(5) for future in futures] == [1, 1]
+    finally:
+        queue.stop()
+    assert sent == ['first\nsecond']
+    assert queue.stats()['coalesced'] == 1
+
+
+def test_string_chat_id_shares_buckets_with_int():
+    sent = []
+    queue = SendQueue(workers=1, chat_rate=0.001, chat_burst=1)
+    futures = [queue.submit(chat_id, lambda **kwargs: sent.append(kwargs['chat_id']), {'chat_id': chat_id})
+               for chat_id in ('-100123', -100123)]
+    queue.start()
+    try:
+        futures[0].result(5)
+        # второй запрос ждёт токен той же корзины чата, а не своей собственной
+        assert not futures[1].done()
+        assert queue.stats()['queue_depth'] == 1
+    finally:
+        queue.stop(timeout=0)
+    assert sent == ['-100123']
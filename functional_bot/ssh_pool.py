@@ -0,0 +1,212 @@
+import codecs
+import socket
+import threading
+import time
+import logging
+
+import paramiko
+
+logger = logging.getLogger(__name__)
+
+# период, с которым чтение из канала проверяет отмену и истечение таймаута
+POLL_INTERVAL = 0.2
+# размер блока, читаемого из канала за один раз
+CHUNK_SIZE = 32768
+
+
+class CommandTimeout(Exception):
+    """Команда не уложилась в отведённое время."""
+
+
+class CommandCancelled(Exception):
+    """Команда отменена пользователем."""
+
+
+class SSHConnection:
+    """
+    Долгоживущее SSH-соединение с одним хостом.
+    Ограничивает число одновременно открытых каналов на транспорт.
+    """
+
+    def __init__(self, host, port, username, password, keepalive=30, max_channels=4, connect_timeout=10):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.keepalive = keepalive
+        self.connect_timeout = connect_timeout
+        self.client = None
+        self.lock = threading.Lock()  # защищает (пере)подключение
+        self.channels = threading.BoundedSemaphore(max_channels)  # ограничение числа каналов
+
+    def is_alive(self):
+        transport = self.client.get_transport() if self.client else None
+        return transport is not None and transport.is_active()
+
+    def connect(self):
+        logger.info(f'Start {self.connect.__name__} {self.username}@{self.host}:{self.port}')
+        self.close()
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(hostname=self.host,
+                       username=self.username,
+                       password=self.password,
+                       port=self.port,
+                       timeout=self.connect_timeout
+                       )
+        # keepalive не даёт NAT и межсетевым экранам закрыть простаивающий транспорт
+        client.get_transport().set_keepalive(self.keepalive)
+        self.client = client
+        logger.info(f'Stop {self.connect.__name__} {self.username}@{self.host}:{self.port}')
+
+    def close(self):
+        if self.client:
+            self.client.close()
+            self.client = None
+
+
+class SSHPool:
+    """
+    Пул SSH-соединений с ключом (host, port, user).
+    Соединение устанавливается один раз и переиспользуется всеми командами,
+    при обрыве транспорт прозрачно переподключается.
+    """
+
+    def __init__(self, keepalive=30, max_channels=4, connect_timeout=10):
+        self.keepalive = keepalive
+        self.max_channels = max_channels
+        self.connect_timeout = connect_timeout
+        self.__connections = {}
+        self.__lock = threading.Lock()
+        self.__stats = {'hits': 0, 'misses': 0, 'reconnects': 0, 'bytes_received': 0}
+
+    def __count(self, name, value=1):
+        with self.__lock:
+            self.__stats[name] += value
+
+    def stats(self):
+        """Возвращает счётчики попаданий, промахов, переподключений и принятых байт."""
+        with self.__lock:
+            stats = dict(self.__stats)
+            stats['connections'] = len(self.__connections)
+        return stats
+
+    def get_connection(self, host, port, username, password):
+        key = (host, int(port), username)
+        with self.__lock:
+            connection = self.__connections.get(key)
+            if connection is None:
+                connection = SSHConnection(host, int(port), username, password,
+                                           keepalive=self.keepalive,
+                                           max_channels=self.max_channels,
+                                           connect_timeout=self.connect_timeout
+                                           )
+                self.__connections[key] = connection
+        with connection.lock:
+            if connection.is_alive():
+                self.__count('hits')
+            elif connection.client is None:
+                self.__count('misses')
+                connection.connect()
+            else:
+                self.__count('reconnects')
+                connection.connect()
+        return connection
+
+    def reconnect(self, connection, failed_client=None):
+        """
+        Переподключает соединение, если в нём всё ещё тот клиент, на котором произошёл сбой.
+        Если другой поток уже переподключился, новый клиент не закрывается.
+        """
+        with connection.lock:
+            if failed_client is not None and connection.client is not failed_client and connection.is_alive():
+                return
+            self.__count('reconnects')
+            connection.connect()
+
+    def iter_chunks(self, host, port, username, password, command, timeout=None, cancel_event=None):
+        """
+        Выполняет команду на удалённом хосте через соединение из пула
+        и по мере поступления отдаёт блоки bytes stdout, а после них - накопленный stderr.
+        timeout - общее время на выполнение команды в секундах,
+        cancel_event - threading.Event, установка которого прерывает команду.
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+        connection = self.get_connection(host, port, username, password)
+        if not connection.channels.acquire(timeout=timeout or None):
+            raise CommandTimeout(command)
+        channel = None
+        try:
+            client = connection.client
+            try:
+                channel = client.get_transport().open_session()
+            except (paramiko.SSHException, EOFError, socket.error, AttributeError) as error:
+                # транспорт мог умереть между проверкой и открытием канала - переподключаемся один раз
+                logger.warning(f'SSH канал не открыт: {error}, переподключение')
+                self.reconnect(connection, client)
+                channel = connection.client.get_transport().open_session()
+            channel.exec_command(command)
+            channel.settimeout(POLL_INTERVAL)
+            # stderr читается одновременно с stdout: иначе удалённая команда, заполнившая окно канала
+            # выводом в stderr, остановится, и stdout не дойдёт до конца. Отдаётся stderr после stdout
+            stderr, out_done, err_done = [], False, False
+            while not (out_done and err_done):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise CommandCancelled(command)
+                if deadline is not None and time.monotonic() > deadline:
+                    raise CommandTimeout(command)
+                try:
+                    if out_done or channel.recv_stderr_ready():
+                        chunk = channel.recv_stderr(CHUNK_SIZE)
+                        if chunk:
+                            self.__count('bytes_received', len(chunk))
+                            stderr.append(chunk)
+                        else:
+                            err_done = True
+                        continue
+                    chunk = channel.recv(CHUNK_SIZE)
+                except socket.timeout:
+                    continue
+                if not chunk:
+                    out_done = True
+                    continue
+                self.__count('bytes_received', len(chunk))
+                yield chunk
+            yield from stderr
+        finally:
+            if channel is not None:
+                channel.close()
+            connection.channels.release()
+
+    def iter_lines(self, host, port, username, password, command, timeout=None, cancel_event=None):
+        """
+        Построчно отдаёт вывод команды, декодированный как UTF-8.
+        Строки возвращаются вместе с завершающим '\n'.
+        """
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        tail = ''
+        for chunk in self.iter_chunks(host, port, username, password, command, timeout, cancel_event):
+            lines = (tail + decoder.decode(chunk)).split('\n')
+            tail = lines.pop()
+            for line in lines:
+                yield line + '\n'
+        tail += decoder.decode(b'', final=True)
+        if tail:
+            yield tail
+
+    def exec_command(self, host, port, username, password, command, timeout=None, cancel_event=None):
+        """Выполняет команду целиком и возвращает stdout + stderr в виде bytes."""
+        logger.info(f'Start {self.exec_command.__name__} && {command}')
+        data = b''.join(self.iter_chunks(host, port, username, password, command, timeout, cancel_event))
+        logger.info(f'Stop {self.exec_command.__name__} && {command}')
+        return data
+
+    def close_all(self):
+        logger.info(f'Start {self.close_all.__name__}')
+        with self.__lock:
+            connections = list(self.__connections.values())
+            self.__connections.clear()
+        for connection in connections:
+            with connection.lock:
+                connection.close()
+        logger.info(f'Stop {self.close_all.__name__}')
@@ -0,0 +1,102 @@
+"""
+Тесты чтения вывода команды через SSHPool на встроенном SSH-сервере paramiko:
+большой stderr не должен останавливать команду, stdout отдаётся раньше stderr.
+
+Запуск:
+    python -m pytest ssh_pool_test.py
+"""
+import time
+import socket
+import threading
+
+import paramiko
+import pytest
+
+from ssh_pool import SSHPool, CommandTimeout
+
+# больше окна канала paramiko (2 МБ): без одновременного чтения stderr команда остановится
+STDERR_SIZE = 3 * 1024 * 1024
+
+
+class Server(paramiko.ServerInterface):
+    """Принимает любой пароль; команда 'noisy' пишет STDERR_SIZE байт в stderr, затем строку в stdout."""
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED if kind == 'session' else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self.run, args=(channel, command.decode()), daemon=True).start()
+        return True
+
+    @staticmethod
+    def run(channel, command):
+        # ответ на exec отправляется после возврата из check_channel_exec_request
+        time.sleep(0.1)
+        try:
+            if command == 'noisy':
+                block = b'e' * 32768
+                for _ in range(STDERR_SIZE // len(block)):
+                    channel.sendall_stderr(block)
+                channel.sendall(b'stdout done\n')
+            else:
+                channel.sendall(b'out 1\n')
+                channel.sendall_stderr(b'warning\n')
+                channel.sendall(b'out 2\n')
+            channel.send_exit_status(0)
+        except (EOFError, OSError):
+            pass
+        finally:
+            channel.close()
+
+
+@pytest.fixture
+def server():
+    host_key = paramiko.RSAKey.generate(2048)
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(4)
+    transports = []
+
+    def accept():
+        while True:
+            try:
+                client, _ = listener.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(client)
+            transport.add_server_key(host_key)
+            transport.start_server(server=Server())
+            transports.append(transport)
+
+    threading.Thread(target=accept, daemon=True).start()
+    yield listener.getsockname()
+    listener.close()
+    for transport in transports:
+        transport.close()
+
+
+def test_large_stderr_does_not_block_stdout(server):
+    pool = SSHPool()
+    try:
+        data = pool.exec_command(*server, 'user', 'password', 'noisy', timeout=20)
+    except CommandTimeout:
+        pytest.fail('команда остановилась на заполненном окне stderr')
+    finally:
+        pool.close_all()
+    assert data.startswith(b'stdout done\n')
+    assert len(data) == len(b'stdout done\n') + STDERR_SIZE
+
+
+def test_stdout_before_stderr(server):
+    pool = SSHPool()
+    try:
+        lines = list(pool.iter_lines(*server, 'user', 'password', 'short', timeout=10))
+    finally:
+        pool.close_all()
+    assert lines == ['out 1\n', 'out 2\n', 'warning\n']
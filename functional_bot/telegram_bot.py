@@ -1,7 +1,7 @@
 import psycopg2
-import re
 import os
 import datetime
+import time
 import logging
 
 # logging.disable(logging.CRITICAL)
@@ -14,13 +14,39 @@ if logging.getLogger().isEnabledFor(logging.CRITICAL):
 
 logger = logging.getLogger(__name__)
 
-import paramiko
 from dotenv import load_dotenv
 from pathlib import Path
-
-from telegram import Update, ForceReply, ReplyKeyboardMarkup, KeyboardButton
+from concurrent.futures import ThreadPoolExecutor
+import html
+import secrets
+import itertools
+import threading
+from collections import OrderedDict
+
+from telegram import Update, ForceReply, ReplyKeyboardMarkup, KeyboardButton, ParseMode
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Updater, CommandHandler, MessageHandler, Filters, ConversationHandler, CallbackQueryHandler
 from telegram.error import BadRequest
+from telegram.utils.request import Request
+
+from ssh_pool import SSHPool
+from command_executor import CommandExecutor, current_job
+from result_cache import ResultCache
+from message_chunks import split_chunks, MAX_MESSAGE_LENGTH
+from db import Database
+import extractors
+import repl_log_parser
+from log_tail import LogTail, JournalTail, EventStore
+from log_query import LogQuery
+import fleet
+import host_parsers
+from metrics_store import MetricsStore, resample, sparkline
+from metrics_collector import MetricsCollector
+from alerts import AlertEngine, Notifier, load_rules
+from package_index import PackageCatalog
+from pager import Pager
+from send_queue import SendQueue, QueuedBot
+from webhook_server import WebhookServer, start_webhook
 
 
 class DotDict(dict):
@@ -45,6 +71,109 @@ class TelegramBot:
         self.emails = None
         self.phones = None
 
+        # пул долгоживущих SSH-соединений для всех команд мониторинга
+        self.ssh_pool = SSHPool(keepalive=int(os.getenv('SSH_KEEPALIVE', 30)),
+                                max_channels=int(os.getenv('SSH_MAX_CHANNELS', 4)),
+                                connect_timeout=int(os.getenv('SSH_CONNECT_TIMEOUT', 10))
+                                )
+
+        # общий пул соединений с PostgreSQL
+        self.db = Database(host=os.getenv('DB_HOST'),
+                           port=os.getenv('DB_PORT'),
+                           user=os.getenv('DB_USER'),
+                           password=os.getenv('DB_PASSWORD'),
+                           database=os.getenv('DB_DATABASE'),
+                           maxconn=int(os.getenv('DB_POOL_SIZE', 4))
+                           )
+        logger.info('Get DB_* settings')
+
+        # кэш результатов редко меняющихся команд, время жизни задаётся ключом 'ttl' в self.commands
+        self.result_cache = ResultCache(max_bytes=int(os.getenv('CACHE_MAX_BYTES', 8 * 1024 * 1024)))
+
+        # инкрементальное чтение лога репликации: смещения и разобранные события хранятся локально
+        state_dir = os.getenv('BOT_STATE_DIR', 'bot_state')
+        self.repl_log_path = os.getenv('REPL_LOG_PATH', '/var/log/postgresql/postgresql-15-main.log')
+        self.log_tail = LogTail(state_dir)
+        self.repl_events = EventStore(state_dir, retention_days=int(os.getenv('REPL_EVENTS_RETENTION_DAYS', 7)))
+        self.repl_events_pruned = None
+        self.repl_log_query = LogQuery(keywords=tuple(repl_log_parser.DISPATCH))
+
+        # инвентарь хостов и пул для параллельного опроса группы хостов
+        self.inventory = fleet.Inventory.from_env()
+        self.fleet_concurrency = int(os.getenv('FLEET_CONCURRENCY', 8))
+        self.fleet_pool = ThreadPoolExecutor(max_workers=self.fleet_concurrency, thread_name_prefix='fleet')
+        self.fleet_host_timeout = int(os.getenv('FLEET_HOST_TIMEOUT', 20))
+
+        # порты, которые ожидаемо слушаются на хосте: "22,5432,udp/53"
+        self.ss_baseline = {port.strip() for port in os.getenv('SS_BASELINE', '22').split(',') if port.strip()}
+
+        # периодический сбор метрик хостов инвентаря в локальное хранилище (METRICS_INTERVAL=0 - отключить)
+        self.metrics_interval = int(os.getenv('METRICS_INTERVAL', 60))
+        self.metrics_store = MetricsStore(os.getenv('METRICS_DB', os.path.join(state_dir, 'metrics.sqlite3')),
+                                          raw_hours=int(os.getenv('METRICS_RAW_HOURS', 24)),
+                                          rollup=int(os.getenv('METRICS_ROLLUP', 300)),
+                                          retention_days=int(os.getenv('METRICS_RETENTION_DAYS', 30))
+                                          )
+        self.metrics_collector = MetricsCollector(self.metrics_store,
+                                                  lambda host, command: self.ssh_pool.exec_command(
+                                                          host.host, host.port, host.username, host.password,
+                                                          command, timeout=self.fleet_host_timeout
+                                                          ),
+                                                  lambda: self.inventory.group('all'),
+                                                  self.fleet_pool, self.fleet_concurrency,
+                                                  interval=self.metrics_interval or 60,
+                                                  host_timeout=self.fleet_host_timeout
+                                                  )
+
+        # оповещения в CHAT_ID: правила из ALERT_RULES (JSON-файл или строка) проверяются
+        # по новым замерам метрик и новым записям журналов хостов
+        self.journal_tail = JournalTail(state_dir)
+        self.ssh_known_ips = {ip.strip() for ip in os.getenv('SSH_KNOWN_IPS', '').split(',') if ip.strip()}
+        self.alert_interval = int(os.getenv('ALERT_INTERVAL', 60))
+        self.alerts = AlertEngine(load_rules(os.getenv('ALERT_RULES')),
+                                  dedup_seconds=int(os.getenv('ALERT_DEDUP_SECONDS', 3600))
+                                  )
+        self.notifier = Notifier(self.send_alert, per_minute=int(os.getenv('ALERT_PER_MINUTE', 20)))
+        self.alert_bot = None
+        self.metrics_collector.listeners.append(
+                lambda host, values: self.notifier.push(self.alerts.on_sample(host, values))
+                )
+
+        # большие результаты листаются кнопками вместо отправки десятков сообщений
+        self.pager = Pager(max_bytes=int(os.getenv('PAGER_MAX_BYTES', 16 * 1024 * 1024)))
+
+        # индексы установленных пакетов по хостам и результаты поиска для листания кнопками
+        self.packages = PackageCatalog(check_interval=int(os.getenv('PACKAGES_CHECK_INTERVAL', 60)))
+        # пишется из потоков очереди команд, читается обработчиками кнопок
+        self.package_results = OrderedDict()  # номер -> (заголовок, индекс, имена пакетов)
+        self.package_results_ids = itertools.count()
+        self.package_results_lock = threading.Lock()
+        self.package_page_size = 10
+
+        # все исходящие сообщения идут через очередь с ограничением частоты по лимитам Telegram
+        self.send_queue = SendQueue(global_rate=int(os.getenv('SEND_GLOBAL_RATE', 30)),
+                                    chat_rate=float(os.getenv('SEND_CHAT_RATE', 1)),
+                                    chat_burst=int(os.getenv('SEND_CHAT_BURST', 3)),
+                                    group_per_minute=int(os.getenv('SEND_GROUP_PER_MINUTE', 20)),
+                                    workers=int(os.getenv('SEND_WORKERS', 4))
+                                    )
+
+        # получение обновлений: polling (по умолчанию) или webhook на локальном HTTP-сервере
+        self.bot_mode = os.getenv('BOT_MODE', 'polling')
+        self.dispatcher_workers = int(os.getenv('DISPATCHER_WORKERS', 4))
+        self.webhook = None
+        self.webhook_url = os.getenv('WEBHOOK_URL')
+        if self.bot_mode not in ('polling', 'webhook'):
+            raise ValueError(f'BOT_MODE должен быть polling или webhook, а не {self.bot_mode}')
+        # без адреса webhook не зарегистрировать: ошибка до запуска потоков, а не посреди него
+        if self.bot_mode == 'webhook' and not self.webhook_url:
+            raise ValueError('Для BOT_MODE=webhook нужен WEBHOOK_URL')
+
+        # ограниченный пул потоков для команд, обращающихся к хосту
+        self.executor = CommandExecutor(workers=int(os.getenv('BOT_WORKERS', 4)),
+                                        default_timeout=int(os.getenv('BOT_COMMAND_TIMEOUT', 60))
+                                        )
+
         self.commands = DotDict(
                 {
                         'start'             : DotDict(
@@ -134,6 +263,8 @@ class TelegramBot:
                                         'button'     : '/get_release',
                                         'state_point': 'get_release',
                                         'callback'   : self.command_GetRelease,
+                                        'timeout'    : 15,
+                                        'ttl'        : 6 * 60 * 60,
                                         }
                                 ),
 
@@ -144,6 +275,8 @@ class TelegramBot:
                                         'button'     : '/get_uname',
                                         'state_point': 'get_uname',
                                         'callback'   : self.command_GetUname,
+                                        'timeout'    : 15,
+                                        'ttl'        : 6 * 60 * 60,
                                         }
                                 ),
 
@@ -154,6 +287,8 @@ class TelegramBot:
                                         'button'     : '/get_uptime',
                                         'state_point': 'get_uptime',
                                         'callback'   : self.command_GetUptime,
+                                        'timeout'    : 15,
+                                        'ttl'        : 30,
                                         }
                                 ),
 
@@ -164,6 +299,8 @@ class TelegramBot:
                                         'button'     : '/get_df',
                                         'state_point': 'get_df',
                                         'callback'   : self.command_GetDF,
+                                        'timeout'    : 15,
+                                        'ttl'        : 60,
                                         }
                                 ),
 
@@ -174,6 +311,8 @@ class TelegramBot:
                                         'button'     : '/get_free',
                                         'state_point': 'get_free',
                                         'callback'   : self.command_GetFree,
+                                        'timeout'    : 15,
+                                        'ttl'        : 10,
                                         }
                                 ),
 
@@ -184,6 +323,8 @@ class TelegramBot:
                                         'button'     : '/get_mpstat',
                                         'state_point': 'get_mpstat',
                                         'callback'   : self.command_GetMpstat,
+                                        'timeout'    : 20,
+                                        'ttl'        : 10,
                                         }
                                 ),
 
@@ -194,6 +335,8 @@ class TelegramBot:
                                         'button'     : '/get_w',
                                         'state_point': 'get_w',
                                         'callback'   : self.command_GetW,
+                                        'timeout'    : 15,
+                                        'ttl'        : 30,
                                         }
                                 ),
 
@@ -206,6 +349,8 @@ class TelegramBot:
                                         'button'     : '/get_auths',
                                         'state_point': 'get_auths',
                                         'callback'   : self.command_GetAuths,
+                                        'timeout'    : 15,
+                                        'ttl'        : 60,
                                         }
                                 ),
                         # 3.6.2. Последние 5 критических событий.
@@ -215,6 +360,8 @@ class TelegramBot:
                                         'button'     : '/get_critical',
                                         'state_point': 'get_critical',
                                         'callback'   : self.command_GetCritical,
+                                        'timeout'    : 30,
+                                        'ttl'        : 60,
                                         }
                                 ),
 
@@ -225,6 +372,8 @@ class TelegramBot:
                                         'button'     : '/get_ps',
                                         'state_point': 'get_ps',
                                         'callback'   : self.command_GetPS,
+                                        'timeout'    : 30,
+                                        'ttl'        : 10,
                                         }
                                 ),
 
@@ -235,9 +384,40 @@ class TelegramBot:
                                         'button'     : '/get_ss',
                                         'state_point': 'get_ss',
                                         'callback'   : self.command_GetSS,
+                                        'timeout'    : 15,
+                                        'ttl'        : 60,
                                         }
                                 ),
 
+                        ## Выборки по разобранному выводу команд.
+                        'topPS'             : DotDict(
+                                {
+                                        'command'    : 'top_ps',
+                                        'button'     : '/top_ps',
+                                        'state_point': None,
+                                        'callback'   : self.command_TopPS,
+                                        'timeout'    : 30,
+                                        },
+                                ),
+                        'dfFull'            : DotDict(
+                                {
+                                        'command'    : 'df_full',
+                                        'button'     : '/df_full',
+                                        'state_point': None,
+                                        'callback'   : self.command_DFFull,
+                                        'timeout'    : 15,
+                                        },
+                                ),
+                        'ssNew'             : DotDict(
+                                {
+                                        'command'    : 'ss_new',
+                                        'button'     : '/ss_new',
+                                        'state_point': None,
+                                        'callback'   : self.command_SSNew,
+                                        'timeout'    : 15,
+                                        },
+                                ),
+
                         ## 3.9 Сбор информации об установленных пакетах.
                         'getAptList'        : DotDict(
                                 {
@@ -253,6 +433,8 @@ class TelegramBot:
                                         'button'     : '/get_all_packages',
                                         'state_point': 'get_all_packages',
                                         'callback'   : self.command_GetAllPackagesList,
+                                        'timeout'    : 60,
+                                        'ttl'        : 60 * 60,
                                         }
                                 ),
                         'getOnePackageInfo' : DotDict(
@@ -261,6 +443,17 @@ class TelegramBot:
                                         'button'     : '/get_one_package',
                                         'state_point': 'get_one_package',
                                         'callback'   : self.command_GetOnePackageInfo,
+                                        'timeout'    : 30,
+                                        'ttl'        : 60 * 60,
+                                        }
+                                ),
+                        'packageDiff'       : DotDict(
+                                {
+                                        'command'    : 'package_diff',
+                                        'button'     : '/package_diff',
+                                        'state_point': None,
+                                        'callback'   : self.command_PackageDiff,
+                                        'timeout'    : 120,
                                         }
                                 ),
                         ## 3.10 Сбор информации о запущенных сервисах.
@@ -270,6 +463,8 @@ class TelegramBot:
                                         'button'     : '/get_services',
                                         'state_point': 'get_services',
                                         'callback'   : self.command_GetServices,
+                                        'timeout'    : 30,
+                                        'ttl'        : 300,
                                         },
                                 ),
                         ## 3.10 Сбор информации о запущенных сервисах.
@@ -279,6 +474,52 @@ class TelegramBot:
                                         'button'     : '/get_repl_logs',
                                         'state_point': 'get_repl_logs',
                                         'callback'   : self.command_GetReplLogs,
+                                        'timeout'    : 120,
+                                        },
+                                ),
+                        ## История метрик из локального хранилища.
+                        'history'           : DotDict(
+                                {
+                                        'command'    : 'history',
+                                        'button'     : '/history',
+                                        'state_point': None,
+                                        'callback'   : self.command_History,
+                                        },
+                                ),
+                        ## Активные тревоги и заглушки оповещений.
+                        'silence'           : DotDict(
+                                {
+                                        'command'    : 'silence',
+                                        'button'     : '/silence',
+                                        'state_point': None,
+                                        'callback'   : self.command_Silence,
+                                        },
+                                ),
+                        ## Статистика пула SSH-соединений.
+                        'getSSHStats'       : DotDict(
+                                {
+                                        'command'    : 'get_ssh_stats',
+                                        'button'     : '/get_ssh_stats',
+                                        'state_point': None,
+                                        'callback'   : self.command_GetSSHStats,
+                                        },
+                                ),
+                        ## Метрики очереди команд.
+                        'getQueueStats'     : DotDict(
+                                {
+                                        'command'    : 'get_queue_stats',
+                                        'button'     : '/get_queue_stats',
+                                        'state_point': None,
+                                        'callback'   : self.command_GetQueueStats,
+                                        },
+                                ),
+                        ## Статистика кэша результатов.
+                        'getCacheStats'     : DotDict(
+                                {
+                                        'command'    : 'get_cache_stats',
+                                        'button'     : '/get_cache_stats',
+                                        'state_point': None,
+                                        'callback'   : self.command_GetCacheStats,
                                         },
                                 ),
                         }
@@ -369,7 +610,9 @@ class TelegramBot:
 
     def command_Cancel(self, update: Update, context):
         logger.info(f'Start {self.command_Cancel.__name__}')
-        update.message.reply_text('Запрос отменен.', reply_markup=self.keyboard_menu_main())
+        cancelled = self.executor.cancel(update.effective_chat.id)
+        text = f'Запрос отменен. Прервано команд: {cancelled}' if cancelled else 'Запрос отменен.'
+        update.message.reply_text(text, reply_markup=self.keyboard_menu_main())
         logger.info(f'Stop {self.command_Cancel.__name__}')
         return ConversationHandler.END
 
@@ -400,6 +643,8 @@ class TelegramBot:
                 "Команда: /get_uname\n"
                 "3.1.3 О времени работы.\n"
                 "Команда: /get_uptime\n"
+                "Команды /get_uptime, /get_df и /get_critical можно выполнить на группе хостов\n"
+                "из инвентаря, указав её через @: /get_df @all\n"
                 "3.2 Сбор информации о состоянии файловой системы.\n"
                 "Команда: /get_df\n"
                 "3.3 Сбор информации о состоянии оперативной памяти.\n"
@@ -413,20 +658,47 @@ class TelegramBot:
                 "Команда: /get_auths\n"
                 "3.6.2 Последние 5 критических событий.\n"
                 "Команда: /get_critical\n"
+                "Фильтры выполняются на хосте: /get_critical since=2024-09-20 until=2024-09-21 p=err слово\n"
                 "3.7 Сбор информации о запущенных процессах.\n"
                 "Команда: /get_ps\n"
                 "3.8 Сбор информации об используемых портах.\n"
                 "Команда: /get_ss\n"
+                "Выборки по разобранному выводу команд (считаются в боте, без полного вывода):\n"
+                "10 процессов с наибольшим RSS: /top_ps (или /top_ps 20)\n"
+                "Файловые системы, заполненные на 90% и более: /df_full (или /df_full 80)\n"
+                "Прослушиваемые порты не из списка SS_BASELINE: /ss_new\n"
                 "3.9 Сбор информации об установленных пакетах.\n"
                 "Команда: /get_apt_list\n"
                 "Вывод всех пакетов:\n"
                 "команда: /get_apt_list, потом /get_all_packages\n"
                 "Поиск информации о пакете, название которого будет запрошено у пользователя:\n"
                 "команда: /get_apt_list, потом /get_one_package\n"
+                "Ищется точное имя, затем по началу имени, по подстроке и похожие имена;\n"
+                "список листается кнопками, нажатие на пакет показывает сведения о нём.\n"
+                "Сравнение версий пакетов двух хостов инвентаря: /package_diff db1 web1\n"
                 "3.10 Сбор информации о запущенных сервисах.\n"
                 "Команда: /get_services\n"
                 "Сбор логов о репликации из /var/log/postgresql/ Master-сервера.\n"
                 "Команда: /get_repl_logs\n"
+                "Читаются только новые строки лога, для полного перечитывания: /get_repl_logs force\n"
+                "Окно дат и ключевые слова: /get_repl_logs since=2024-09-19 until=2024-09-20 слово\n"
+                "История метрик (CPU, память, диск, загрузка, соединения), собираемых раз в METRICS_INTERVAL секунд.\n"
+                "Команда: /history, например: /history cpu mem 24h @db1\n"
+                "Оповещения в чат CHAT_ID: заполнение дисков, память, CPU, критические события журнала,\n"
+                "отключения реплик, входы по SSH с адресов не из SSH_KNOWN_IPS.\n"
+                "Активные тревоги и заглушки: /silence\n"
+                "Заглушить правило, хост или всё (*) на время: /silence disk-full 2h, снять: /silence disk-full 0\n"
+                "Статистика пула SSH-соединений.\n"
+                "Команда: /get_ssh_stats\n"
+                "Метрики очереди команд и очереди отправки сообщений (глубина, время ожидания, 429).\n"
+                "Команда: /get_queue_stats\n"
+                "Длинный вывод приходит одним сообщением с кнопками листания и загрузки файлом .gz.\n"
+                "Статистика кэша результатов команд.\n"
+                "Команда: /get_cache_stats\n"
+                "Результаты команд мониторинга кэшируются, для принудительного обновления\n"
+                "добавьте к команде force, например: /get_release force\n"
+                "Отмена выполняемых и ожидающих команд.\n"
+                "Команда: /cancel\n"
         )
         update.message.reply_text(text, reply_markup=self.keyboard_menu_main())
         logger.info(f'Stop {self.command_Help.__name__}')
@@ -446,8 +718,7 @@ class TelegramBot:
     def findEmails(self, update: Update, context):
         logger.info(f'Start {self.findEmails.__name__}')
         user_input = update.message.text  # Получаем текст, содержащий (или нет) email-адреса
-        emailsRegex = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,3}')  # формат email-адресов
-        emailsList = emailsRegex.findall(user_input)  # Ищем номера телефонов
+        emailsList = extractors.EMAIL.findall(user_input)  # Ищем номера телефонов
         if not emailsList:  # Обрабатываем случай, когда номеров телефонов нет
             update.message.reply_text('Email-адреса не найдены', reply_markup=self.keyboard_menu_cancel())
             return  # Завершаем выполнение функции
@@ -460,42 +731,16 @@ class TelegramBot:
 
     def command_Add_db_Emails(self, update: Update, context):
         logger.info(f'Start {self.command_Add_db_Emails.__name__}')
-        host = os.getenv('DB_HOST')
-        logger.info('Get DB_HOST')
-        port = os.getenv('DB_PORT')
-        logger.info('Get DB_PORT')
-        username = os.getenv('DB_USER')
-        logger.info('Get DB_USER')
-        password = os.getenv('DB_PASSWORD')
-        logger.info('Get DB_PASSWORD')
-        database = os.getenv('DB_DATABASE')
-        logger.info('Get DB_DATABASE')
-        connection = None
         try:
-            connection = psycopg2.connect(user=username,
-                                          password=password,
-                                          host=host,
-                                          port=port,
-                                          database=database
-                                          )
-
-            cursor = connection.cursor()
-            for mail in self.emails.split('\n'):
-                # logger.info(f'will insert {mail}')
-                cursor.execute(f"INSERT INTO Emails (mail) VALUES ('{mail}');")
-            connection.commit()
+            inserted, skipped = self.db.insert_unique('emails', 'mail', self.emails.split('\n'))
             update.message.reply_text(
-                    f'Данные успешно добавлены в БД',
+                    f'Данные успешно добавлены в БД. Добавлено: {inserted}, пропущено (уже есть): {skipped}',
                     reply_markup=self.keyboard_menu_main()  # Отправляем клавиатуру с кнопками
                     )
             logging.info("Команда успешно выполнена")
         except (Exception, psycopg2.Error) as error:
             logging.error(f"Ошибка при работе с PostgreSQL: {error}")
-        finally:
-            if connection:
-                cursor.close()
-                connection.close()
-                logging.info("Соединение с PostgreSQL закрыто")
+            update.message.reply_text('Ошибка при работе с БД', reply_markup=self.keyboard_menu_main())
         logger.info(f'Stop {self.command_Add_db_Emails.__name__}')
         return ConversationHandler.END
 
@@ -523,8 +768,7 @@ class TelegramBot:
         - 8-XXX-XXX-XX-XX.
         Также вместо ‘8’ на первом месте может быть ‘+7’.
         """
-        phoneNumRegex = re.compile(r'(\+7|8)(\s?[(-]?\d{3}[)-]?\s?\d{3}-?\s?\d{2}-?\s?\d{2})')  # формат
-        phoneNumberList = phoneNumRegex.findall(user_input)  # Ищем номера телефонов
+        phoneNumberList = extractors.PHONE.findall(user_input)  # Ищем номера телефонов
         if not phoneNumberList:  # Обрабатываем случай, когда номеров телефонов нет
             update.message.reply_text('Телефонные номера не найдены', reply_markup=self.keyboard_menu_cancel())
             return  # Завершаем выполнение функции
@@ -541,42 +785,16 @@ class TelegramBot:
 
     def command_Add_db_Phones(self, update: Update, context):
         logger.info(f'Start {self.command_Add_db_Phones.__name__}')
-        host = os.getenv('DB_HOST')
-        logger.info('Get DB_HOST')
-        port = os.getenv('DB_PORT')
-        logger.info('Get DB_PORT')
-        username = os.getenv('DB_USER')
-        logger.info('Get DB_USER')
-        password = os.getenv('DB_PASSWORD')
-        logger.info('Get DB_PASSWORD')
-        database = os.getenv('DB_DATABASE')
-        logger.info('Get DB_DATABASE')
-        connection = None
         try:
-            connection = psycopg2.connect(user=username,
-                                          password=password,
-                                          host=host,
-                                          port=port,
-                                          database=database
-                                          )
-
-            cursor = connection.cursor()
-            for phone in self.phones.split('\n'):
-                # logger.info(f'will insert {phone}')
-                cursor.execute(f"INSERT INTO Phones (phone) VALUES ('{phone}');")
-            connection.commit()
+            inserted, skipped = self.db.insert_unique('phones', 'phone', self.phones.split('\n'))
             update.message.reply_text(
-                    f'Данные успешно добавлены в БД',
+                    f'Данные успешно добавлены в БД. Добавлено: {inserted}, пропущено (уже есть): {skipped}',
                     reply_markup=self.keyboard_menu_main()  # Отправляем клавиатуру с кнопками
                     )
             logging.info("Команда успешно выполнена")
         except (Exception, psycopg2.Error) as error:
             logging.error(f"Ошибка при работе с PostgreSQL: {error}")
-        finally:
-            if connection:
-                cursor.close()
-                connection.close()
-                logging.info("Соединение с PostgreSQL закрыто")
+            update.message.reply_text('Ошибка при работе с БД', reply_markup=self.keyboard_menu_main())
         logger.info(f'Stop {self.command_Add_db_Phones.__name__}')
         return ConversationHandler.END
 
@@ -605,9 +823,7 @@ class TelegramBot:
         - Пароль должен включать хотя бы один специальный символ, такой как !@#$%^&*().
         """
 
-        passwdRegex = re.compile(r'(?=.*[A-Z])(?=.*[a-z])(?=.*\d)(?=.*[@$!%*#?&])[A-Za-z\d@$!%*#?&]{8,}')
-
-        passwdList = passwdRegex.search(user_input)
+        passwdList = extractors.PASSWORD.search(user_input)
 
         if not passwdList:  # Обрабатываем случай, когда совпадений нет
             update.message.reply_text('Пароль простой', reply_markup=self.keyboard_menu_cancel())
@@ -618,8 +834,8 @@ class TelegramBot:
         logger.info(f'Stop {self.verifyPassword.__name__}')
         return  # ConversationHandler.END  # Завершаем работу обработчика диалога
 
-    def getHostInfo(self, host='RM_HOST', port='RM_PORT', username='RM_USER', password='RM_PASSWORD', command="uname"):
-        logger.info(f"Start {self.getHostInfo.__name__}")
+    def hostCredentials(self, host='RM_HOST', port='RM_PORT', username='RM_USER', password='RM_PASSWORD'):
+        """Читает параметры SSH-подключения из переменных окружения с указанными именами."""
         host = os.getenv(host)
         logger.info('Get HOST')
         port = os.getenv(port)
@@ -628,109 +844,426 @@ class TelegramBot:
         logger.info('Get USER')
         password = os.getenv(password)
         logger.info('Get PASSWORD')
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        client.connect(hostname=host, username=username, password=password, port=int(port))
-        stdin, stdout, stderr = client.exec_command(command)
-        data = stdout.read() + stderr.read()
-        client.close()
-        data = str(data).replace('\\n', '\n').replace('\\t', '\t')[2:-1]
+        return host, int(port), username, password
+
+    def execHostCommand(self, command, host='RM_HOST', port='RM_PORT', username='RM_USER', password='RM_PASSWORD'):
+        """Выполняет команду на хосте и возвращает её вывод в виде bytes."""
+        # внутри очереди команд действуют таймаут и отмена текущей задачи
+        job = current_job()
+        return self.ssh_pool.exec_command(*self.hostCredentials(host, port, username, password), command,
+                                          timeout=job.remaining() if job else None,
+                                          cancel_event=job.cancelled if job else None
+                                          )
+
+    def getHostInfo(self, host='RM_HOST', port='RM_PORT', username='RM_USER', password='RM_PASSWORD', command="uname"):
+        logger.info(f"Start {self.getHostInfo.__name__}")
+        data = self.execHostCommand(command, host, port, username, password)
+        data = data.decode('utf-8', errors='replace')
         logger.info(f"Stop {self.getHostInfo.__name__}")
         return data
 
-    def general_TG_Output(self, update: Update, context, host_command=None, output_text=None):
+    def streamHostInfo(self, command, host='RM_HOST', port='RM_PORT', username='RM_USER', password='RM_PASSWORD'):
+        """Построчно отдаёт вывод команды по мере его получения с хоста."""
+        logger.info(f"Start {self.streamHostInfo.__name__} && {command}")
+        job = current_job()
+        return self.ssh_pool.iter_lines(*self.hostCredentials(host, port, username, password), command,
+                                        timeout=job.remaining() if job else None,
+                                        cancel_event=job.cancelled if job else None
+                                        )
+
+    @staticmethod
+    def is_force_refresh(context):
+        """Пользователь запросил обновление в обход кэша: /get_release force"""
+        return 'force' in (getattr(context, 'args', None) or [])
+
+    @staticmethod
+    def host_cache_key(command):
+        return os.getenv('RM_HOST'), command
+
+    def cachedHostInfo(self, command, ttl=None, force=False):
+        """Результат команды из кэша с ключом (хост, команда); без ttl команда выполняется всегда."""
+        if not ttl:
+            return self.getHostInfo(command=command)
+        job = current_job()
+        return self.result_cache.get_or_load(self.host_cache_key(command), ttl,
+                                             lambda: self.getHostInfo(command=command), force,
+                                             timeout=job.remaining() if job else None,
+                                             cancel_event=job.cancelled if job else None
+                                             )
+
+    def send_lines(self, update: Update, lines, keep=0, title='output'):
+        """
+        Отправляет строки. Вывод, умещающийся в одно сообщение, отправляется как есть;
+        более длинный - одним сообщением с первой страницей и кнопками листания,
+        весь текст сохраняется в self.pager.
+        Если весь текст не длиннее keep символов, возвращает его (для кэша), иначе None.
+        """
+        kept, kept_size = [], 0
+
+        def remember(lines):
+            nonlocal kept, kept_size
+            for line in lines:
+                if kept is not None:
+                    kept_size += len(line)
+                    if kept_size > keep:
+                        kept = None
+                    else:
+                        kept.append(line)
+                yield line
+
+        chunks = (chunk for chunk in split_chunks(remember(lines)) if chunk.strip())
+        first = next(chunks, None)
+        second = next(chunks, None) if first is not None else None
+        if first is None:
+            update.message.reply_text('Нет данных', reply_markup=self.keyboard_menu_main())
+        elif second is None:
+            update.message.reply_text(first, reply_markup=self.keyboard_menu_main())
+        else:
+            # первая страница уходит сразу, остальной вывод дочитывается и сохраняется для листания
+            message = update.message.reply_text(first)
+            def rest():
+                yield first
+                yield second
+                # закрытие генератора прекращает и чтение вывода с хоста
+                yield from chunks
+
+            document_id, truncated = self.pager.add_chunks(rest(), title)
+            message.edit_reply_markup(reply_markup=self.pager_keyboard(document_id, 0, None))
+            if truncated:
+                # вывод дочитан не до конца - в кэш не попадает
+                kept = None
+        return ''.join(kept) if kept is not None else None
+
+    @staticmethod
+    def pager_keyboard(document_id, number, pages):
+        """Кнопки листания: в начало, назад, номер страницы, вперёд, в конец, прыжки на 10 страниц, файл."""
+        data = lambda target: f'pg:{document_id}:{target}'
+        return InlineKeyboardMarkup([
+                [InlineKeyboardButton('⏮', callback_data=data(0)),
+                 InlineKeyboardButton('◀', callback_data=data(max(number - 1, 0))),
+                 InlineKeyboardButton(f'{number + 1}/{pages or "…"}', callback_data=data(number)),
+                 InlineKeyboardButton('▶', callback_data=data(number + 1)),
+                 InlineKeyboardButton('⏭', callback_data=data(-1))],
+                [InlineKeyboardButton('-10', callback_data=data(max(number - 10, 0))),
+                 InlineKeyboardButton('+10', callback_data=data(number + 10)),
+                 InlineKeyboardButton('⬇ .gz', callback_data=data('gz'))],
+                ])
+
+    def callback_Pager(self, update: Update, context):
+        """Кнопки листания: pg:<документ>:<страница> (-1 - последняя) и pg:<документ>:gz - файл."""
+        query = update.callback_query
+        _, document_id, target = query.data.split(':')
+        if target == 'gz':
+            result = self.pager.gzip(int(document_id))
+            if result is not None:
+                query.answer()
+                query.message.reply_document(document=result[0], filename=result[1])
+                return
+        else:
+            result = self.pager.page(int(document_id), int(target))
+            if result is not None:
+                query.answer()
+                text, number, pages = result
+                try:
+                    query.edit_message_text(text if text.strip() else '(пусто)',
+                                            reply_markup=self.pager_keyboard(int(document_id), number, pages)
+                                            )
+                except BadRequest:
+                    # та же страница - сообщение не изменилось
+                    pass
+                return
+        query.answer('Результат устарел, повторите команду')
+
+    def general_TG_Output(self, update: Update, context, host_command=None, output_text=None, ttl=None):
         if host_command:
             logger.info(f'Start {self.general_TG_Output.__name__} && {host_command}')
         else:
             logger.info(f'Start {self.general_TG_Output.__name__} && {output_text[:100]}')
-        data = self.getHostInfo(command=host_command) if host_command else output_text
-        try:
-            update.message.reply_text(data, reply_markup=self.keyboard_menu_main())
-        except BadRequest as e:
-            max_length = 4096
-            parts = [data[i:i + max_length] for i in range(0, len(data), max_length)]
-            for part in parts[:-1:]:
-                update.message.reply_text(part)
-            update.message.reply_text(parts[-1], reply_markup=self.keyboard_menu_main())
+        if host_command and ttl:
+            # при промахе кэша вывод отправляется по ходу чтения и одновременно сохраняется в кэш
+            streamed = []
+
+            def loader():
+                streamed.append(True)
+                return self.send_lines(update, self.streamHostInfo(host_command), keep=self.result_cache.max_bytes,
+                                       title=host_command
+                                       )
+
+            job = current_job()
+            data = self.result_cache.get_or_load(self.host_cache_key(host_command), ttl, loader,
+                                                 self.is_force_refresh(context),
+                                                 timeout=job.remaining() if job else None,
+                                                 cancel_event=job.cancelled if job else None
+                                                 )
+            if not streamed:
+                # вывод, не поместившийся в кэш, ожидавшие запросы получают заново
+                lines = data.splitlines(keepends=True) if data is not None else self.streamHostInfo(host_command)
+                self.send_lines(update, lines, title=host_command)
+        elif host_command:
+            self.send_lines(update, self.streamHostInfo(host_command), title=host_command)
+        else:
+            self.send_lines(update, output_text.splitlines(keepends=True))
         if host_command:
             logger.info(f'Stop {self.general_TG_Output.__name__} && {host_command}')
         else:
             logger.info(f'Stop {self.general_TG_Output.__name__} && {output_text[:100]}')
 
+    def target_hosts(self, context):
+        """Хосты группы из аргумента @группа или None, если группа не указана."""
+        for arg in getattr(context, 'args', None) or []:
+            if arg.startswith('@'):
+                return self.inventory.group(arg[1:])
+        return None
+
+    def fleet_TG_Output(self, update: Update, context, hosts, host_command, summary):
+        """
+        Выполняет команду параллельно на группе хостов.
+        Сводная таблица обновляется в одном сообщении по мере ответа хостов.
+        """
+        logger.info(f'Start {self.fleet_TG_Output.__name__} && {host_command} && {len(hosts)} хостов')
+        if not hosts:
+            update.message.reply_text('Группа хостов не найдена', reply_markup=self.keyboard_menu_main())
+        else:
+            job = current_job()
+
+            def run(host):
+                # команда на хосте не переживает таймаут всей команды бота
+                timeout = min(self.fleet_host_timeout, job.remaining()) if job and job.remaining() else \
+                    self.fleet_host_timeout
+                output = self.ssh_pool.exec_command(host.host, host.port, host.username, host.password,
+                                                    host_command, timeout=timeout,
+                                                    cancel_event=job.cancelled if job else None
+                                                    )
+                return output.decode('utf-8', errors='replace')
+
+            message = update.message.reply_text(f'Опрос хостов: {len(hosts)}...')
+            rows, pending = {}, [host.name for host in hosts]
+            throttle = fleet.EditThrottle()
+            # общий предел ожидания: хосты опрашиваются волнами по fleet_concurrency штук
+            rounds = -(-len(hosts) // self.fleet_concurrency)
+            deadline = rounds * (self.fleet_host_timeout + self.ssh_pool.connect_timeout)
+            if job and job.remaining():
+                deadline = min(deadline, job.remaining())
+            for host, output, error in fleet.fan_out(self.fleet_pool, hosts, run, deadline):
+                pending.remove(host.name)
+                rows[host.name] = ('err', str(error)[:60]) if error else ('ok', summary(output))
+                if pending and throttle.ready():
+                    message.edit_text(f'<pre>{html.escape(fleet.format_table(rows, pending))}</pre>',
+                                      parse_mode=ParseMode.HTML
+                                      )
+            chunks = list(split_chunks(fleet.format_table(rows).splitlines(keepends=True),
+                                       MAX_MESSAGE_LENGTH - 11))
+            message.edit_text(f'<pre>{html.escape(chunks[0])}</pre>', parse_mode=ParseMode.HTML)
+            for chunk in chunks[1:]:
+                update.message.reply_text(f'<pre>{html.escape(chunk)}</pre>', parse_mode=ParseMode.HTML,
+                                          reply_markup=self.keyboard_menu_main()
+                                          )
+        logger.info(f'Stop {self.fleet_TG_Output.__name__} && {host_command}')
+
     def command_GetRelease(self, update: Update, context):
         logger.info(f'Start {self.command_GetRelease.__name__}')
-        self.general_TG_Output(update, context, "lsb_release -a")
+        self.general_TG_Output(update, context, "lsb_release -a", ttl=self.commands.getRelease.ttl)
         logger.info(f'Stop {self.command_GetRelease.__name__}')
 
     def command_GetUname(self, update: Update, context):
         logger.info(f'Start {self.command_GetUname.__name__}')
-        self.general_TG_Output(update, context, "uname -nmr")
+        self.general_TG_Output(update, context, "uname -nmr", ttl=self.commands.getUname.ttl)
         logger.info(f'Stop {self.command_GetUname.__name__}')
 
     def command_GetUptime(self, update: Update, context):
         logger.info(f'Start {self.command_GetUptime.__name__}')
-        self.general_TG_Output(update, context, "uptime")
+        hosts = self.target_hosts(context)
+        if hosts is not None:
+            self.fleet_TG_Output(update, context, hosts, "uptime", fleet.summary_uptime)
+        else:
+            self.general_TG_Output(update, context, "uptime", ttl=self.commands.getUptime.ttl)
         logger.info(f'Stop {self.command_GetUptime.__name__}')
 
     def command_GetDF(self, update: Update, context):
         logger.info(f'Start {self.command_GetDF.__name__}')
-        self.general_TG_Output(update, context, "df -h")
+        hosts = self.target_hosts(context)
+        if hosts is not None:
+            self.fleet_TG_Output(update, context, hosts, "df -h", fleet.summary_df)
+        else:
+            self.general_TG_Output(update, context, "df -h", ttl=self.commands.getDF.ttl)
         logger.info(f'Stop {self.command_GetDF.__name__}')
 
     def command_GetFree(self, update: Update, context):
         logger.info(f'Start {self.command_GetFree.__name__}')
-        self.general_TG_Output(update, context, "free -h")
+        self.general_TG_Output(update, context, "free -h", ttl=self.commands.getFree.ttl)
         logger.info(f'Stop {self.command_GetFree.__name__}')
 
     def command_GetMpstat(self, update: Update, context):
         logger.info(f'Start {self.command_GetMpstat.__name__}')
-        self.general_TG_Output(update, context, "mpstat -P ALL 1 1")
+        self.general_TG_Output(update, context, "mpstat -P ALL 1 1", ttl=self.commands.getMpstat.ttl)
         logger.info(f'Stop {self.command_GetMpstat.__name__}')
 
     def command_GetW(self, update: Update, context):
         logger.info(f'Start {self.command_GetW.__name__}')
-        self.general_TG_Output(update, context, "w")
+        self.general_TG_Output(update, context, "w", ttl=self.commands.getW.ttl)
         logger.info(f'Stop {self.command_GetW.__name__}')
 
     def command_GetAuths(self, update: Update, context):
         logger.info(f'Start {self.command_GetAuths.__name__}')
-        self.general_TG_Output(update, context, "last -n 10")
+        self.general_TG_Output(update, context, "last -n 10", ttl=self.commands.getAuths.ttl)
         logger.info(f'Stop {self.command_GetAuths.__name__}')
 
     def command_GetCritical(self, update: Update, context):
         logger.info(f'Start {self.command_GetCritical.__name__}')
-        text = self.getHostInfo(command="journalctl -p crit -n 5 | grep -E '^[A-Za-z]{3} [0-9]{2}'")
-        text = re.sub(r'nautilus', r'ptstart', text)
-        self.general_TG_Output(update, context, None, text)
+        # окно времени, приоритет и ключевые слова фильтруются на хосте:
+        # /get_critical since=2024-09-20 until=2024-09-21 p=err слово
+        query = LogQuery.from_args(context.args, priority='crit')
+        command = query.journalctl(*([] if query.keywords else ['-n', '5']))
+        command += " | grep -E '^[A-Za-z]{3} [0-9]{2}'"
+        if query.keywords:
+            command += " | tail -n 5"
+        hosts = self.target_hosts(context)
+        if hosts is not None:
+            self.fleet_TG_Output(update, context, hosts, command, fleet.summary_critical)
+        else:
+            text = self.cachedHostInfo(command, self.commands.getCritical.ttl, self.is_force_refresh(context))
+            # та же фильтрация локально - результат не зависит от наличия grep на хосте
+            text = '\n'.join(line for line in text.split('\n') if query.matches(line))
+            text = extractors.CRITICAL_HOSTNAME.sub(r'ptstart', text)
+            self.general_TG_Output(update, context, None, text)
         logger.info(f'Stop {self.command_GetCritical.__name__}')
 
     def command_GetPS(self, update: Update, context):
         logger.info(f'Start {self.command_GetPS.__name__}')
-        self.general_TG_Output(update, context, "ps aux")
+        self.general_TG_Output(update, context, "ps aux", ttl=self.commands.getPS.ttl)
         logger.info(f'Stop {self.command_GetPS.__name__}')
 
     def command_GetSS(self, update: Update, context):
         logger.info(f'Start {self.command_GetSS.__name__}')
-        self.general_TG_Output(update, context, "ss -tuln")
+        self.general_TG_Output(update, context, "ss -tuln", ttl=self.commands.getSS.ttl)
         logger.info(f'Stop {self.command_GetSS.__name__}')
 
+    @staticmethod
+    def numeric_arg(context, default):
+        """Первый числовой аргумент команды: /top_ps 20"""
+        for arg in getattr(context, 'args', None) or []:
+            if arg.isdigit():
+                return int(arg)
+        return default
+
+    def command_TopPS(self, update: Update, context):
+        logger.info(f'Start {self.command_TopPS.__name__}')
+        count = self.numeric_arg(context, 10)
+        text = self.cachedHostInfo("ps aux", self.commands.getPS.ttl, self.is_force_refresh(context))
+        rows = [f'{process.pid:>7} {host_parsers.format_size(process.rss * 1024):>7} {process.cpu:>5.1f}% '
+                f'{process.user[:10]:<10} {process.command[:60]}'
+                for process in host_parsers.top_processes(host_parsers.parse_ps(text), count)]
+        header = f'{"PID":>7} {"RSS":>7} {"CPU":>6} {"USER":<10} COMMAND'
+        self.general_TG_Output(update, context, None, '\n'.join([header, *rows]) if rows else '')
+        logger.info(f'Stop {self.command_TopPS.__name__}')
+
+    def command_DFFull(self, update: Update, context):
+        logger.info(f'Start {self.command_DFFull.__name__}')
+        threshold = self.numeric_arg(context, 90)
+        text = self.cachedHostInfo("df -h", self.commands.getDF.ttl, self.is_force_refresh(context))
+        disks = host_parsers.full_filesystems(host_parsers.parse_df(text), threshold)
+        rows = [f'{disk.use_percent:>3}% {host_parsers.format_size(disk.available):>7} свободно  '
+                f'{disk.mount} ({disk.filesystem})'
+                for disk in sorted(disks, key=lambda disk: disk.use_percent, reverse=True)]
+        self.general_TG_Output(update, context, None,
+                               '\n'.join(rows) or f'Нет файловых систем, заполненных на {threshold}% и более'
+                               )
+        logger.info(f'Stop {self.command_DFFull.__name__}')
+
+    def command_SSNew(self, update: Update, context):
+        logger.info(f'Start {self.command_SSNew.__name__}')
+        text = self.cachedHostInfo("ss -tuln", self.commands.getSS.ttl, self.is_force_refresh(context))
+        sockets = host_parsers.new_listening_ports(host_parsers.parse_ss(text), self.ss_baseline)
+        rows = sorted({f'{socket.netid}/{socket.local_port} {socket.local_address}' for socket in sockets})
+        self.general_TG_Output(update, context, None,
+                               '\n'.join(rows) or 'Все прослушиваемые порты есть в SS_BASELINE'
+                               )
+        logger.info(f'Stop {self.command_SSNew.__name__}')
+
     def command_GetAptList(self, update: Update, context):
         logger.info(f'Start {self.command_GetAptList.__name__}')
         update.message.reply_text('Выберите опцию:', reply_markup=self.keyboard_apt_packages())
         logger.info(f'Stop {self.command_GetAptList.__name__}')
         return self.commands.getAptList.state_point
 
-    # Команда для получения списка всех установленных пакетов
-    def get_apt_list(self):
-        logger.info(f'Start {self.get_apt_list.__name__}')
-        text = self.getHostInfo(command="dpkg -l | cat")
-        text = re.compile(r'ii\s\s([a-z:.0-9-]+)\s').findall(text)
-        logger.info(f'Stop {self.get_apt_list.__name__}')
-        return ', '.join(text)
+    def default_host(self):
+        """Хост RM_HOST как запись инвентаря."""
+        hosts = self.inventory.group('default')
+        return hosts[0] if hosts else fleet.Host('default', *self.hostCredentials())
+
+    def host_runner(self, host):
+        """run(command) -> bytes для хоста инвентаря с таймаутом и отменой текущей команды бота."""
+        job = current_job()
+
+        def run(command):
+            return self.ssh_pool.exec_command(host.host, host.port, host.username, host.password, command,
+                                              timeout=job.remaining() if job else self.fleet_host_timeout,
+                                              cancel_event=job.cancelled if job else None
+                                              )
+
+        return run
+
+    def package_index(self, host=None, force=False):
+        host = host or self.default_host()
+        return self.packages.get(host.name, self.host_runner(host), force)
+
+    def package_result(self, result_id):
+        """(заголовок, индекс, имена пакетов) результата поиска или None, если он вытеснен."""
+        with self.package_results_lock:
+            return self.package_results.get(result_id)
+
+    def package_page(self, result_id, result, page):
+        """Текст и кнопки страницы результатов: по кнопке на пакет и строка листания."""
+        title, index, names = result
+        pages = max(1, -(-len(names) // self.package_page_size))
+        page = min(max(page, 0), pages - 1)
+        start = page * self.package_page_size
+        buttons = [[InlineKeyboardButton(f'{name} {index.packages[name].version}',
+                                         callback_data=f'pkg:{result_id}:i:{start + offset}')]
+                   for offset, name in enumerate(names[start:start + self.package_page_size])]
+        buttons.append([InlineKeyboardButton('◀', callback_data=f'pkg:{result_id}:{page - 1}'),
+                        InlineKeyboardButton(f'{page + 1}/{pages}', callback_data=f'pkg:{result_id}:{page}'),
+                        InlineKeyboardButton('▶', callback_data=f'pkg:{result_id}:{page + 1}')])
+        return title, InlineKeyboardMarkup(buttons)
+
+    def show_packages(self, update: Update, title, index, names):
+        """Отправляет первую страницу списка пакетов; список хранится для листания."""
+        result = (title, index, names)
+        with self.package_results_lock:
+            result_id = next(self.package_results_ids)
+            self.package_results[result_id] = result
+            while len(self.package_results) > 100:
+                self.package_results.popitem(last=False)
+        text, markup = self.package_page(result_id, result, 0)
+        update.message.reply_text(text, reply_markup=markup)
+
+    def callback_Packages(self, update: Update, context):
+        """Кнопки списка пакетов: pkg:<номер>:<страница> и pkg:<номер>:i:<позиция пакета>."""
+        query = update.callback_query
+        _, result_id, *rest = query.data.split(':')
+        result_id = int(result_id)
+        result = self.package_result(result_id)
+        if result is None:
+            query.answer('Результаты устарели, повторите поиск')
+            return
+        query.answer()
+        if rest[0] == 'i':
+            _, index, names = result
+            query.message.reply_text(index.packages[names[int(rest[1])]].details(),
+                                     reply_markup=self.keyboard_menu_main()
+                                     )
+            return
+        text, markup = self.package_page(result_id, result, int(rest[0]))
+        try:
+            query.edit_message_text(text, reply_markup=markup)
+        except BadRequest:
+            # та же страница (крайняя кнопка листания) - сообщение не изменилось
+            pass
 
     def command_GetAllPackagesList(self, update: Update, context):
         logger.info(f'Start {self.command_GetAllPackagesList.__name__}')
-        self.general_TG_Output(update, context, None, self.get_apt_list())
+        index = self.package_index(force=self.is_force_refresh(context))
+        self.show_packages(update, f'Установлено пакетов: {len(index)}', index, index.names)
         logger.info(f'Stop {self.command_GetAllPackagesList.__name__}')
         return ConversationHandler.END
 
@@ -745,93 +1278,252 @@ class TelegramBot:
 
     def getOnePackageInfo(self, update: Update, context):
         logger.info(f'Start {self.getOnePackageInfo.__name__}')
-        self.general_TG_Output(update, context, f"dpkg -s {update.message.text}")
+        text = update.message.text.strip()
+        index = self.package_index()
+        package = index.get(text)
+        if package is not None:
+            # сведения берутся из индекса без обращения к хосту
+            self.general_TG_Output(update, context, None, package.details())
+        else:
+            mode, names = index.search(text)
+            if names:
+                modes = {'prefix': 'по началу имени', 'substring': 'по подстроке', 'fuzzy': 'похожие имена'}
+                self.show_packages(update, f'Пакет {text} не найден, {modes[mode]}: {len(names)}', index, names)
+            else:
+                update.message.reply_text(f'Пакет {text} не найден', reply_markup=self.keyboard_menu_main())
         logger.info(f'Stop {self.getOnePackageInfo.__name__}')
         return ConversationHandler.END
 
+    def command_PackageDiff(self, update: Update, context):
+        """Различия установленных пакетов двух хостов инвентаря: /package_diff db1 web1"""
+        logger.info(f'Start {self.command_PackageDiff.__name__}')
+        names = [arg.lstrip('@') for arg in context.args or []]
+        hosts = [self.inventory.hosts.get(name) for name in names]
+        if len(hosts) != 2 or None in hosts:
+            update.message.reply_text(f'Укажите два хоста инвентаря: {", ".join(self.inventory.hosts)}',
+                                      reply_markup=self.keyboard_menu_main()
+                                      )
+            return
+        first, second = (self.package_index(host, self.is_force_refresh(context)) for host in hosts)
+        only_first, only_second, changed = first.diff(second)
+        lines = [f'{names[0]}: {len(first)} пакетов, {names[1]}: {len(second)} пакетов',
+                 f'Только на {names[0]} ({len(only_first)}): {", ".join(only_first)}',
+                 f'Только на {names[1]} ({len(only_second)}): {", ".join(only_second)}',
+                 f'Разные версии ({len(changed)}):']
+        lines += [f'{name}: {version} -> {other}' for name, version, other in changed]
+        self.general_TG_Output(update, context, None, '\n'.join(lines))
+        logger.info(f'Stop {self.command_PackageDiff.__name__}')
+
     def command_GetServices(self, update: Update, context):
         logger.info(f'Start {self.command_GetServices.__name__}')
-        self.general_TG_Output(update, context, "systemctl list-units --type=service --state=running")
+        self.general_TG_Output(update, context, "systemctl list-units --type=service --state=running", ttl=self.commands.getServices.ttl)
         logger.info(f'Stop {self.command_GetServices.__name__}')
 
+    def ingest_repl_log(self, force=False, run=None):
+        """
+        Забирает с хоста новые строки лога репликации и сохраняет события в self.repl_events.
+        Возвращает список новых событий (ReplEvent).
+        """
+        host = os.getenv('RM_HOST')
+        path = self.repl_log_path
+        if force:
+            # полное перечитывание лога с начала
+            self.log_tail.reset(host, path)
+            self.repl_events.clear(host, path)
+
+        # с хоста забираются только строки, появившиеся после прошлого запроса,
+        # и из них - только строки с событиями репликации (отбор выполняет awk на хосте)
+        transferred = []
+        run = run or self.execHostCommand
+
+        def counted(command):
+            output = run(command)
+            transferred.append(len(output))
+            return output
+
+        data = self.log_tail.read_new(counted, host, path, self.repl_log_query)
+        logger.info(f'Передано с хоста: {sum(transferred)} байт')
+        events = list(repl_log_parser.parse_lines(data.decode('utf-8', errors='replace').split('\n')))
+        added = self.repl_events.append(host, path, (event.as_tuple() for event in events))
+        logger.info(f'Новых событий репликации: {added}')
+        return events
+
     def command_GetReplLogs(self, update: Update, context):
         logger.info(f'Start {self.command_GetReplLogs.__name__}')
-        command = "cat /var/log/postgresql/postgresql-15-main.log"
-        data = self.getHostInfo(command=command).split('\n')
+        host = os.getenv('RM_HOST')
+        path = self.repl_log_path
+        self.ingest_repl_log(self.is_force_refresh(context))
 
         date = datetime.datetime.now().strftime("%Y-%m-%d")
-        main_info = set()
-
-        for line in data:
-            line = line.strip()
-            try:
-                groups = re.compile(fr'^({date})\s([0-9:.]+)(.*)').search(line).groups()
-                info, line = list(groups[0:-1:1]), groups[-1]
-                # logger.info(info)
-                # logger.info(line)
-                if re.compile(r'connection received').search(line):
-                    # logger.info(info)
-                    # logger.info(line)
-                    host, port = re.compile(r'host=([0-9:.]+)\sport=([0-9]+)').search(line).groups()
-                    if host and port:
-                        info.append('received'.upper())
-                        info.append(host)
-                        info.append(port)
-                        logger.info(info)
-                elif re.compile(r'connection authenticated').search(line):
-                    # logger.info(info)
-                    # logger.info(line)
-                    identity, method = re.compile(
-                            r'identity="([0-9a-zA-Z_-]+)"\smethod=([0-9a-zA-Z_-]+)'
-                            ).search(line).groups()
-                    if identity and method:
-                        info.append('authenticated'.upper())
-                        info.append(identity)
-                        info.append(method)
-                        logger.info(info)
-                elif re.compile(r'connection authorized').search(line):
-                    # logger.info(info)
-                    # logger.info(line)
-                    user, application_name = re.compile(
-                            r'user=([0-9a-zA-Z_-]+)\sapplication_name=([/0-9a-zA-Z_-]+)'
-                            ).search(line).groups()
-                    if user and application_name:
-                        info.append('authorized'.upper())
-                        info.append(user)
-                        info.append(application_name)
-                        logger.info(info)
-                elif re.compile(r'received replication command').search(line):
-                    # logger.info(info)
-                    # logger.info(line)
-                    command = re.compile(r'received replication command:\s(.*)').search(line).groups()[0]
-                    if command:
-                        info.append('command'.upper())
-                        info.append(command)
-                        logger.info(info)
-                elif re.compile(r'disconnection').search(line):
-                    # logger.info(info)
-                    # logger.info(line)
-                    time, user, host, port = re.compile(
-                            r'time:\s([0-9:.]+)\suser=([0-9a-zA-Z_-]+)\s.*\shost=([0-9:.]+)\sport=([0-9]+)'
-                            ).search(line).groups()
-                    if time and user and host and port:
-                        info.append('disconnection'.upper())
-                        info.append(time)
-                        info.append(user)
-                        info.append(host)
-                        info.append(port)
-                        # logger.info(info)
-                tpl = tuple(info)
-                if len(tpl) > 2 and tpl not in main_info:
-                    main_info.add(tpl)
-            except AttributeError:
-                continue
-
-        main_info = list('\t'.join(tpl) for tpl in sorted(main_info, key=lambda tpl: (tpl[1], tpl[2])))
+        if self.repl_events_pruned != date:
+            self.repl_events.prune(host, path)
+            self.repl_events_pruned = date
+
+        # события за окно дат (по умолчанию - за сегодня) без повторов:
+        # /get_repl_logs since=2024-09-19 until=2024-09-20 слово
+        query = LogQuery.from_args(context.args)
+        since, until = (query.since or date)[:10], (query.until or date)[:10]
+        events = self.repl_events.load(host, path, date if since == until == date else None)
+        main_info = {tpl for tpl in events if since <= tpl[0] <= until and query.matches('\t'.join(tpl))}
+
+        main_info = list('\t'.join(tpl) for tpl in sorted(main_info, key=lambda tpl: (tpl[0], tpl[1], tpl[2])))
         # logger.info(main_info)
         self.general_TG_Output(update, context, None, '\n'.join(main_info))
         logger.info(f'Stop {self.command_GetReplLogs.__name__}')
 
+    @staticmethod
+    def parse_period(arg):
+        """'30m', '6h', '2d' -> секунды; '0' -> 0; None, если аргумент не длительность."""
+        if arg == '0':
+            return 0
+        if arg[:-1].isdigit() and arg[-1] in 'mhd':
+            return int(arg[:-1]) * {'m': 60, 'h': 3600, 'd': 86400}[arg[-1]]
+        return None
+
+    def command_History(self, update: Update, context):
+        """
+        Графики метрик за период: /history [метрика ...] [6h|2d|30m] [@хост]
+        По умолчанию - основные метрики хоста default за 6 часов.
+        """
+        logger.info(f'Start {self.command_History.__name__}')
+        host, period, period_text, names = None, 6 * 3600, '6h', []
+        for arg in context.args or []:
+            if arg.startswith('@'):
+                host = arg[1:]
+            elif self.parse_period(arg) is not None:
+                period, period_text = self.parse_period(arg), arg
+            else:
+                names.append(arg)
+        if host is None:
+            hosts = self.inventory.group('default') or self.inventory.group('all')
+            host = hosts[0].name if hosts else 'default'
+        names = names or [name for name in ('cpu', 'mem', 'disk', 'load1', 'conns')
+                          if name in self.metrics_store.metrics(host)]
+        until = time.time()
+        since = until - period
+        lines = [f'{host}, {period_text}']
+        width = max([len(name) for name in names] + [4])
+        for name in names:
+            points = self.metrics_store.series(host, name, since, until)
+            if not points:
+                lines.append(f'{name:<{width}} нет данных')
+                continue
+            low = min(point[1] for point in points)
+            high = max(point[3] for point in points)
+            lines.append(f'{name:<{width}} {sparkline(resample(points, since, until, 24))} '
+                         f'min {low:.1f} max {high:.1f} now {points[-1][2]:.1f}')
+        if not names:
+            lines.append('Замеров ещё нет')
+        update.message.reply_text(f'<pre>{html.escape(chr(10).join(lines))}</pre>', parse_mode=ParseMode.HTML,
+                                  reply_markup=self.keyboard_menu_main()
+                                  )
+        logger.info(f'Stop {self.command_History.__name__}')
+
+    def send_alert(self, text):
+        """Отправка оповещения в чат CHAT_ID (до запуска бота оповещения только пишутся в лог)."""
+        logger.warning(f'Оповещение: {text.strip()}')
+        if self.alert_bot is not None and self.__chat_id:
+            self.alert_bot.send_message(chat_id=self.__chat_id, text=text)
+
+    def watch_host_logs(self, host):
+        """Новые записи журнала хоста -> события для правил оповещений."""
+        alerts = []
+
+        def run(command):
+            return self.ssh_pool.exec_command(host.host, host.port, host.username, host.password, command,
+                                              timeout=self.fleet_host_timeout
+                                              )
+
+        for line in self.journal_tail.read_new(run, host.name, LogQuery(priority='crit')):
+            # повторы одного и того же сообщения (без времени и pid) объединяются
+            message = line.partition(']: ')[2] or line.partition(': ')[2] or line
+            alerts += self.alerts.on_event(host.name, 'journal_crit', message, line)
+
+        if self.ssh_known_ips:
+            for line in self.journal_tail.read_new(run, host.name, LogQuery(keywords=('Accepted',)),
+                                                   ('-u', 'ssh', '-u', 'sshd')):
+                match = extractors.SSH_ACCEPTED.search(line)
+                if match and match[2] not in self.ssh_known_ips:
+                    alerts += self.alerts.on_event(host.name, 'ssh_unknown_ip', match[2],
+                                                   f'вход {match[1]} с {match[2]}:{match[3]}'
+                                                   )
+
+        if host.host == os.getenv('RM_HOST'):
+            for event in self.ingest_repl_log(run=run):
+                if event.kind == 'disconnection':
+                    _, user, address, port = event.fields
+                    alerts += self.alerts.on_event(host.name, 'repl_disconnection', f'{user}@{address}',
+                                                   f'реплика {user}@{address}:{port} отключилась в {event.time}'
+                                                   )
+        return alerts
+
+    def watch_logs(self, context=None):
+        """Периодическая проверка журналов всех хостов инвентаря (JobQueue.run_repeating)."""
+        logger.info(f'Start {self.watch_logs.__name__}')
+        hosts = self.inventory.group('all')
+        deadline = -(-len(hosts) // self.fleet_concurrency) * self.fleet_host_timeout * 3
+        alerts = []
+        for host, found, error in fleet.fan_out(self.fleet_pool, hosts, self.watch_host_logs, deadline):
+            if error is not None:
+                logger.warning(f'Журналы {host.name} не проверены: {error}')
+            else:
+                alerts += found
+        self.notifier.push(alerts)
+        logger.info(f'Stop {self.watch_logs.__name__}: оповещений {len(alerts)}')
+
+    def command_Silence(self, update: Update, context):
+        """
+        /silence - активные тревоги и заглушки;
+        /silence цель [2h] - заглушить правило, хост или всё (*), по умолчанию на час;
+        /silence цель 0 - снять заглушку.
+        """
+        logger.info(f'Start {self.command_Silence.__name__}')
+        args = context.args or []
+        if args:
+            seconds = self.parse_period(args[1]) if len(args) > 1 else 3600
+            if seconds is None:
+                update.message.reply_text('Длительность: 30m, 2h, 1d или 0', reply_markup=self.keyboard_menu_main())
+                return
+            self.alerts.silence(args[0], seconds)
+        lines = [f'Правил: {self.alerts.rules_count}, отправлено сообщений: {self.notifier.sent}']
+        lines += [f'тревога {host} {rule}: {metric} = {value:.1f}' for rule, host, metric, value in self.alerts.firing()]
+        lines += [f'заглушено {target} до {datetime.datetime.fromtimestamp(until):%d.%m %H:%M}'
+                  for target, until in self.alerts.silences().items()]
+        update.message.reply_text('\n'.join(lines), reply_markup=self.keyboard_menu_main())
+        logger.info(f'Stop {self.command_Silence.__name__}')
+
+    def command_GetSSHStats(self, update: Update, context):
+        logger.info(f'Start {self.command_GetSSHStats.__name__}')
+        stats = self.ssh_pool.stats()
+        text = '\n'.join(f'{name}: {value}' for name, value in stats.items())
+        update.message.reply_text(text, reply_markup=self.keyboard_menu_main())
+        logger.info(f'Stop {self.command_GetSSHStats.__name__}')
+
+    def command_GetQueueStats(self, update: Update, context):
+        logger.info(f'Start {self.command_GetQueueStats.__name__}')
+        text = ''
+        for title, stats in (('Очередь команд', self.executor.stats()),
+                             ('Очередь отправки', self.send_queue.stats())):
+            text += f'{title}:\n' + '\n'.join(
+                    f'{name}: {value:.3f}' if isinstance(value, float) else f'{name}: {value}'
+                    for name, value in stats.items()
+                    ) + '\n\n'
+        update.message.reply_text(text, reply_markup=self.keyboard_menu_main())
+        logger.info(f'Stop {self.command_GetQueueStats.__name__}')
+
+    def command_GetCacheStats(self, update: Update, context):
+        logger.info(f'Start {self.command_GetCacheStats.__name__}')
+        stats = self.result_cache.stats()
+        text = '\n'.join(f'{name}: {value}' for name, value in stats.items())
+        text += '\n\nЛистаемые результаты:\n' + '\n'.join(f'{name}: {value}' for name, value in self.pager.stats().items())
+        update.message.reply_text(text, reply_markup=self.keyboard_menu_main())
+        logger.info(f'Stop {self.command_GetCacheStats.__name__}')
+
+    def host_callback(self, name, returns=None):
+        """Обработчик команды, выполняемый в очереди чата с таймаутом из self.commands."""
+        entry = self.commands[name]
+        return self.executor.wrap(entry.callback, entry.timeout, returns)
+
     def command_Echo(self, update: Update, context):
         logger.info(f'Start {self.command_Echo.__name__}')
         update.message.reply_text(update.message.text, reply_markup=self.keyboard_menu_main())
@@ -839,7 +1531,11 @@ class TelegramBot:
 
     def main(self):
         logger.info(f'Start {self.main.__name__}')
-        updater = Updater(self.__tm_token, use_context=True)
+        # пул соединений: потоки диспетчера (+4 служебных) и потоки очереди отправки
+        con_pool_size = self.dispatcher_workers + 4 + self.send_queue.workers
+        bot = QueuedBot(self.__tm_token, request=Request(con_pool_size=con_pool_size), send_queue=self.send_queue)
+        updater = Updater(bot=bot, use_context=True, workers=self.dispatcher_workers)
+        self.send_queue.start()
         # Получаем диспетчер для регистрации обработчиков
         dp = updater.dispatcher
 
@@ -925,37 +1621,42 @@ class TelegramBot:
                 )
 
         # Обработчик команды /get_release
-        dp.add_handler(CommandHandler(self.commands.getRelease.command, self.commands.getRelease.callback))
+        dp.add_handler(CommandHandler(self.commands.getRelease.command, self.host_callback('getRelease')))
 
         # Обработчик команды /get_uname
-        dp.add_handler(CommandHandler(self.commands.getUname.command, self.commands.getUname.callback))
+        dp.add_handler(CommandHandler(self.commands.getUname.command, self.host_callback('getUname')))
 
         # Обработчик команды /get_uptime
-        dp.add_handler(CommandHandler(self.commands.getUptime.command, self.commands.getUptime.callback))
+        dp.add_handler(CommandHandler(self.commands.getUptime.command, self.host_callback('getUptime')))
 
         # Обработчик команды /get_df
-        dp.add_handler(CommandHandler(self.commands.getDF.command, self.commands.getDF.callback))
+        dp.add_handler(CommandHandler(self.commands.getDF.command, self.host_callback('getDF')))
 
         # Обработчик команды /get_free
-        dp.add_handler(CommandHandler(self.commands.getFree.command, self.commands.getFree.callback))
+        dp.add_handler(CommandHandler(self.commands.getFree.command, self.host_callback('getFree')))
 
         # Обработчик команды /get_mpstat
-        dp.add_handler(CommandHandler(self.commands.getMpstat.command, self.commands.getMpstat.callback))
+        dp.add_handler(CommandHandler(self.commands.getMpstat.command, self.host_callback('getMpstat')))
 
         # Обработчик команды /get_w
-        dp.add_handler(CommandHandler(self.commands.getW.command, self.commands.getW.callback))
+        dp.add_handler(CommandHandler(self.commands.getW.command, self.host_callback('getW')))
 
         # Обработчик команды /get_auths
-        dp.add_handler(CommandHandler(self.commands.getAuths.command, self.commands.getAuths.callback))
+        dp.add_handler(CommandHandler(self.commands.getAuths.command, self.host_callback('getAuths')))
 
         # Обработчик команды /get_critical
-        dp.add_handler(CommandHandler(self.commands.getCritical.command, self.commands.getCritical.callback))
+        dp.add_handler(CommandHandler(self.commands.getCritical.command, self.host_callback('getCritical')))
 
         # Обработчик команды /get_ps
-        dp.add_handler(CommandHandler(self.commands.getPS.command, self.commands.getPS.callback))
+        dp.add_handler(CommandHandler(self.commands.getPS.command, self.host_callback('getPS')))
 
         # Обработчик команды /get_SS
-        dp.add_handler(CommandHandler(self.commands.getSS.command, self.commands.getSS.callback))
+        dp.add_handler(CommandHandler(self.commands.getSS.command, self.host_callback('getSS')))
+
+        # Обработчики команд /top_ps, /df_full, /ss_new
+        dp.add_handler(CommandHandler(self.commands.topPS.command, self.host_callback('topPS')))
+        dp.add_handler(CommandHandler(self.commands.dfFull.command, self.host_callback('dfFull')))
+        dp.add_handler(CommandHandler(self.commands.ssNew.command, self.host_callback('ssNew')))
 
         # Обработчик команды /get_apt_list
         dp.add_handler(ConversationHandler(
@@ -966,11 +1667,16 @@ class TelegramBot:
                         ],
                 states={
                         self.commands.getOnePackageInfo.state_point: [
-                                MessageHandler(Filters.text & ~Filters.command, self.getOnePackageInfo)]
+                                MessageHandler(Filters.text & ~Filters.command,
+                                               self.executor.wrap(self.getOnePackageInfo,
+                                                                  self.commands.getOnePackageInfo.timeout,
+                                                                  ConversationHandler.END
+                                                                  )
+                                               )]
                         },
                 fallbacks=[
                         CommandHandler(self.commands.getAllPackagesList.command,
-                                       self.commands.getAllPackagesList.callback
+                                       self.host_callback('getAllPackagesList', ConversationHandler.END)
                                        ),
                         CommandHandler(self.commands.getOnePackageInfo.command,
                                        self.commands.getOnePackageInfo.callback
@@ -981,17 +1687,64 @@ class TelegramBot:
                 )
                 )
 
+        # Кнопки листания больших результатов
+        dp.add_handler(CallbackQueryHandler(self.callback_Pager, pattern=r'^pg:'))
+
+        # Кнопки листания списка пакетов
+        dp.add_handler(CallbackQueryHandler(self.callback_Packages, pattern=r'^pkg:'))
+
+        # Обработчик команды /package_diff
+        dp.add_handler(CommandHandler(self.commands.packageDiff.command, self.host_callback('packageDiff')))
+
         # Обработчик команды /get_services
-        dp.add_handler(CommandHandler(self.commands.getServices.command, self.commands.getServices.callback))
+        dp.add_handler(CommandHandler(self.commands.getServices.command, self.host_callback('getServices')))
 
         # Обработчик команды /get_rep_logs
-        dp.add_handler(CommandHandler(self.commands.getReplLogs.command, self.commands.getReplLogs.callback))
+        dp.add_handler(CommandHandler(self.commands.getReplLogs.command, self.host_callback('getReplLogs')))
+
+        # Обработчик команды /history
+        dp.add_handler(CommandHandler(self.commands.history.command, self.commands.history.callback))
+
+        # Обработчик команды /silence
+        dp.add_handler(CommandHandler(self.commands.silence.command, self.commands.silence.callback))
+
+        # Обработчик команды /get_ssh_stats
+        dp.add_handler(CommandHandler(self.commands.getSSHStats.command, self.commands.getSSHStats.callback))
+
+        # Обработчик команды /get_queue_stats
+        dp.add_handler(CommandHandler(self.commands.getQueueStats.command, self.commands.getQueueStats.callback))
+
+        # Обработчик команды /get_cache_stats
+        dp.add_handler(CommandHandler(self.commands.getCacheStats.command, self.commands.getCacheStats.callback))
+
+        # Обработчик команды /cancel вне диалогов - отменяет команды в очереди чата
+        dp.add_handler(CommandHandler(self.commands.cancel.command, self.commands.cancel.callback))
 
         # Обработчик текстовых сообщений /echo
         dp.add_handler(MessageHandler(Filters.text & ~Filters.command, self.commands.echo.callback))
 
+        # Периодический сбор метрик
+        if self.metrics_interval:
+            updater.job_queue.run_repeating(self.metrics_collector.collect, self.metrics_interval, first=1)
+
+        # Проверка журналов хостов и отправка оповещений в CHAT_ID
+        self.alert_bot = updater.bot
+        if self.alert_interval:
+            updater.job_queue.run_repeating(self.watch_logs, self.alert_interval, first=5)
+
         # Запускаем бота
-        updater.start_polling()
+        if self.bot_mode == 'webhook':
+            # Telegram присылает обновления на WEBHOOK_URL, за которым (через прокси) слушает локальный сервер
+            self.webhook = WebhookServer(updater.update_queue, updater.bot,
+                                         listen=os.getenv('WEBHOOK_LISTEN', '127.0.0.1'),
+                                         port=int(os.getenv('WEBHOOK_PORT', 8443)),
+                                         url_path=os.getenv('WEBHOOK_PATH', '/telegram'),
+                                         secret_token=os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32),
+                                         workers=int(os.getenv('WEBHOOK_WORKERS', 4))
+                                         )
+            start_webhook(updater, self.webhook, self.webhook_url)
+        else:
+            updater.start_polling()
 
         # Отправляем кнопку /start автоматически при запуске бота
         self.command_Start(context=updater)
@@ -999,6 +1752,16 @@ class TelegramBot:
         # Останавливаем бота при нажатии Ctrl+C
         updater.idle()
 
+        # Останавливаем очередь команд и закрываем SSH-соединения пула
+        if self.webhook is not None:
+            self.webhook.stop()
+        self.executor.shutdown()
+        self.send_queue.stop()
+        self.fleet_pool.shutdown(wait=False, cancel_futures=True)
+        self.ssh_pool.close_all()
+        self.db.close()
+        self.metrics_store.close()
+
         logger.info(f'Stop {self.main.__name__}')
 
 
@@ -0,0 +1,76 @@
+"""
+Бенчмарк получения обновлений: long polling против webhook.
+Бот с обработчиком-эхом работает с локальным fake_telegram_api; измеряется время
+от появления обновления в API до ответа бота и число запросов к API во время простоя.
+
+Запуск:
+    python webhook_benchmark.py
+    python webhook_benchmark.py --messages 500 --idle 30
+"""
+import time
+import secrets
+import argparse
+import statistics
+
+from telegram import Bot
+from telegram.utils.request import Request
+from telegram.ext import Updater, MessageHandler, Filters
+
+from fake_telegram_api import FakeTelegramAPI
+from webhook_server import WebhookServer, start_webhook
+
+
+def echo(update, context):
+    update.message.reply_text(update.message.text)
+
+
+def measure(mode, messages, idle, workers):
+    api = FakeTelegramAPI()
+    api.start()
+    bot = Bot(api.token, base_url=api.base_url, request=Request(con_pool_size=workers + 4))
+    updater = Updater(bot=bot, use_context=True, workers=workers)
+    updater.dispatcher.add_handler(MessageHandler(Filters.text, echo))
+    webhook = None
+    if mode == 'webhook':
+        webhook = WebhookServer(updater.update_queue, updater.bot, port=0, secret_token=secrets.token_urlsafe(32),
+                                workers=workers)
+        start_webhook(updater, webhook, f'http://127.0.0.1:{webhook.port}{webhook.url_path}')
+    else:
+        updater.start_polling(poll_interval=0, timeout=10)
+    try:
+        time.sleep(0.5)
+        latencies = []
+        for number in range(messages):
+            text = f'{mode} {number}'
+            sent = api.push_update(text)
+            replied = api.wait_message(1, text)
+            if replied is None:
+                raise RuntimeError(f'{mode}: нет ответа на {text}')
+            latencies.append((replied - sent) * 1000)
+        before = sum(api.requests.values())
+        time.sleep(idle)
+        idle_requests = sum(api.requests.values()) - before
+    finally:
+        updater.stop()
+        if webhook is not None:
+            webhook.stop()
+        api.stop()
+    latencies.sort()
+    print(f'{mode:8} среднее {statistics.mean(latencies):7.2f} мс  '
+          f'p50 {latencies[len(latencies) // 2]:7.2f} мс  '
+          f'p99 {latencies[int(len(latencies) * 0.99)]:7.2f} мс  '
+          f'запросов к API за {idle} с простоя: {idle_requests}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=200, help='число сообщений в каждом режиме')
+    parser.add_argument('--idle', type=int, default=12, help='длительность простоя, с')
+    parser.add_argument('--workers', type=int, default=4, help='потоки диспетчера и webhook-сервера')
+    args = parser.parse_args()
+    for mode in ('polling', 'webhook'):
+        measure(mode, args.messages, args.idle, args.workers)
+
+
+if __name__ == '__main__':
+    main()
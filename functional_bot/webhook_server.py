@@ -0,0 +1,140 @@
+"""
+Приём обновлений Telegram через webhook на локальном HTTP-сервере.
+Telegram передаёт секрет, указанный в setWebhook, в заголовке X-Telegram-Bot-Api-Secret-Token;
+запросы без него отклоняются. Принятые обновления кладутся в update_queue диспетчера,
+дальше они обрабатываются так же, как при long polling.
+"""
+import hmac
+import json
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+MAX_BODY = 1024 * 1024
+
+
+class _PooledHTTPServer(HTTPServer):
+    """HTTPServer, обрабатывающий соединения в пуле из workers потоков."""
+
+    def __init__(self, address, handler, workers):
+        super().__init__(address, handler)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='webhook')
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.__process, request, client_address)
+
+    def __process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = 'webhook'
+
+    def do_POST(self):
+        webhook = self.server.webhook
+        if self.path != webhook.url_path:
+            return self.__reply(404, 'rejected')
+        secret = self.headers.get(SECRET_HEADER, '')
+        if webhook.secret_token and not hmac.compare_digest(secret.encode(), webhook.secret_token.encode()):
+            logger.warning(f'Webhook: неверный секрет от {self.client_address[0]}')
+            return self.__reply(403, 'rejected')
+        length = int(self.headers.get('Content-Length') or 0)
+        if not 0 < length <= MAX_BODY:
+            return self.__reply(413 if length else 400, 'rejected')
+        try:
+            update = Update.de_json(json.loads(self.rfile.read(length)), webhook.bot)
+        except ValueError as error:
+            logger.warning(f'Webhook: некорректное обновление: {error}')
+            return self.__reply(400, 'errors')
+        webhook.update_queue.put(update)
+        self.__reply(200, 'received')
+
+    def do_GET(self):
+        self.__reply(405, 'rejected')
+
+    def __reply(self, code, counter):
+        self.server.webhook.count(counter)
+        self.send_response(code)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        logger.debug(f'Webhook {self.client_address[0]}: {format % args}')
+
+
+class WebhookServer:
+    """
+    HTTP-сервер webhook: POST url_path с JSON обновления -> update_queue.
+    workers - число потоков, обрабатывающих запросы Telegram.
+    """
+
+    def __init__(self, update_queue, bot, listen='127.0.0.1', port=8443, url_path='/telegram', secret_token=None,
+                 workers=4):
+        self.update_queue = update_queue
+        self.bot = bot
+        self.url_path = url_path
+        self.secret_token = secret_token
+        self.__server = _PooledHTTPServer((listen, port), _Handler, workers)
+        self.__server.webhook = self
+        self.__thread = None
+        self.__lock = threading.Lock()
+        self.__stats = {'received': 0, 'rejected': 0, 'errors': 0}
+
+    @property
+    def port(self):
+        return self.__server.server_address[1]
+
+    def count(self, counter):
+        with self.__lock:
+            self.__stats[counter] += 1
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.__server.serve_forever, name='webhook', daemon=True)
+        self.__thread.start()
+        logger.info(f'Webhook слушает {self.__server.server_address[0]}:{self.port}{self.url_path}')
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__server.pool.shutdown(wait=True)
+        if self.__thread is not None:
+            self.__thread.join()
+
+    def stats(self):
+        with self.__lock:
+            return dict(self.__stats)
+
+
+def start_webhook(updater, webhook, url, drop_pending_updates=False):
+    """
+    Запускает диспетчер и очередь заданий updater, HTTP-сервер webhook и регистрирует
+    url в Telegram. Updater.idle() и Updater.stop() после этого работают как при polling.
+    """
+    if not url:
+        raise ValueError('Не задан адрес webhook')
+    updater.running = True
+    updater.job_queue.start()
+    ready = threading.Event()
+    threading.Thread(target=updater.dispatcher.start, kwargs={'ready': ready}, name='dispatcher').start()
+    ready.wait()
+    webhook.start()
+    try:
+        updater.bot.set_webhook(url=url, secret_token=webhook.secret_token,
+                                drop_pending_updates=drop_pending_updates)
+    except Exception:
+        # незарегистрированный webhook не получит обновлений: запущенное останавливается
+        webhook.stop()
+        updater.stop()
+        raise
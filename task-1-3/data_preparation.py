@@ -1,8 +1,16 @@
 import os
-import random
-import re
+import mmap
+import time
+import itertools
+import functools
+import argparse
 import datetime
 import logging
+from typing import NamedTuple
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 
 # logging.disable(logging.CRITICAL)
 
@@ -13,53 +21,320 @@ if logging.getLogger().isEnabledFor(logging.CRITICAL):
                         )
 
 
-def create_err_file(filename: str, separators: list):
+@functools.lru_cache(maxsize=4)
+def _err_table(separators, low, high):
+    """
+    Все варианты записи числа с разделителями: строка таблицы - байты варианта (дополненные нулями),
+    номер варианта ((край * S + до) * S + после) * V + (число - low), где край: 1 - первое число записи
+    (пробельные символы в начале сняты), 2 - последнее (сняты в конце, добавлен перевод строки)
+    """
+    texts = [((before.lstrip() if edge & 1 else before) + str(number)
+              + (after.rstrip() + "\n" if edge & 2 else after)).encode()
+             for edge in range(4) for before in separators for after in separators
+             for number in range(low, high + 1)]
+    sizes = np.array([len(text) for text in texts], dtype=np.int64)
+    table = np.zeros((len(texts), sizes.max()), dtype=np.uint8)
+    for row, text in enumerate(texts):
+        table[row, :len(text)] = np.frombuffer(text, dtype=np.uint8)
+    return table, sizes
+
+
+def _err_chunk(seed, number, lines, separators, min_length, max_length, low, high, std):
+    """number-я порция из lines записей; зависит только от seed и number, а не от числа процессов"""
+    rng = np.random.default_rng([seed, number])
+    lengths = rng.integers(min_length, max_length + 1, lines)
+    total = int(lengths.sum())
+    if std is None:
+        numbers = rng.integers(low, high + 1, total)
+    else:
+        numbers = np.clip(np.rint(rng.normal((low + high) / 2, std, total)), low, high).astype(np.int64)
+    count = len(separators)
+    before = rng.integers(0, count, total)
+    after = rng.integers(0, count, total)
+    ends = np.cumsum(lengths)
+    edge = np.zeros(total, dtype=np.int64)
+    edge[ends - lengths] |= 1
+    edge[ends - 1] |= 2
+    table, sizes = _err_table(separators, low, high)
+    index = ((edge * count + before) * count + after) * (high - low + 1) + (numbers - low)
+    # строки вариантов подряд, лишние нули в конце каждой строки отбрасываются маской
+    mask = np.arange(table.shape[1]) < sizes[index][:, None]
+    return table[index][mask].tobytes()
+
+
+def create_err_file(filename: str, separators: list, lines: int = 10000, size: int = None, seed: int = None,
+                    min_length: int = 1, max_length: int = 100, low: int = -100, high: int = 100, std: float = None,
+                    workers: int = 1, chunk_lines: int = 10000):
     """
-    Создаёт файл с записями, в которых числа разделены символами из списка separators
+    Создаёт файл с записями, в которых числа разделены символами из списка separators.
+    Записи генерируются порциями по chunk_lines векторно (NumPy) в workers процессах:
+        - lines записей или, если задан size, записи до достижения size байт;
+        - длина записи - от min_length до max_length чисел;
+        - числа от low до high: равномерно или, если задано std, нормально со средним (low + high) / 2;
+        - каждое число предваряется и оканчивается случайным разделителем, пробельные символы
+          в начале и конце записи отбрасываются.
+    Одинаковый seed даёт одинаковый файл при любом числе процессов.
+    Возвращает число записанных байт
     """
     logging.debug(f"Начало {create_err_file.__name__}()")
-    with open(filename, "w") as f:
-        # создадим файл на 10000 записей
-        for _ in range(10000):
-            # длина каждой записи - от 1 до 100 чисел
-            line_length = random.randint(1, 100)
-            line = ""
-            for _ in range(line_length):
-                # числа в диапазоне от -100 до 100
-                char = str(random.randint(-100, 100))
-                # каждое число может предваряться и оканчиваться каким-либо разделителем
-                line += random.choice(separators) + char + random.choice(separators)
-            line = line.strip()
-            f.write(line + "\n")
-    logging.debug(f"Конец {create_err_file.__name__}()")
-
-
-def check_lines(read_file, write_file):
-    """
-    Проверяет и исправляет строки на валидные
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+        logging.debug(f"seed = {seed}")
+    started = time.perf_counter()
+    options = (tuple(separators), min_length, max_length, low, high, std)
+    if size is None:
+        tasks = ((seed, number, min(chunk_lines, lines - start)) + options
+                 for number, start in enumerate(range(0, lines, chunk_lines)))
+    else:
+        tasks = ((seed, number, chunk_lines) + options for number in itertools.count())
+    written = 0
+    with open(filename, "wb") as f:
+        chunks = _ordered_map(_err_chunk, tasks, workers)
+        for data in chunks:
+            if size is not None and written + len(data) >= size:
+                # последняя запись - та, на которой достигнут размер
+                data = data[:data.index(b"\n", max(size - written - 1, 0)) + 1]
+            f.write(data)
+            written += len(data)
+            if size is not None and written >= size:
+                chunks.close()
+                break
+    elapsed = time.perf_counter() - started
+    logging.debug(f"Конец {create_err_file.__name__}(): {written} байт, {written / elapsed / 1024 / 1024:.1f} МБ/с")
+    return written
+
+
+# байты, отличные от цифр, '-' и перевода строки, заменяются пробелом: разделителем для bytes.split()
+DATASET_TRANSLATION = bytes(b if b in b'0123456789-\n' else ord(' ') for b in range(256))
+
+# размер блока, обрабатываемого одним процессом
+BLOCK_SIZE = 16 * 1024 * 1024
+
+
+def clean_block(data: bytes) -> bytes:
+    """
+    Исправляет блок из целых строк. Результат совпадает с построчной обработкой
+    DATASET_NON_SEPARATOR, DATASET_REPEATED_SEPARATORS и DATASET_EDGE_SEPARATORS:
+    split() без аргументов сразу схлопывает подряд идущие разделители и отбрасывает крайние
+    """
+    data = b"\n".join([b",".join(line.split()) for line in data.translate(DATASET_TRANSLATION).split(b"\n")])
+    if data and not data.endswith(b"\n"):
+        data += b"\n"
+    return data
+
+
+def split_blocks(read_file, block_size=BLOCK_SIZE):
+    """
+    Границы блоков файла (start, end): каждый блок около block_size байт и заканчивается переводом строки
+    """
+    size = os.path.getsize(read_file)
+    if not size:
+        return []
+    bounds = []
+    with open(read_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        start = 0
+        while start < size:
+            end = data.find(b"\n", min(start + block_size, size) - 1)
+            end = size if end < 0 else end + 1
+            bounds.append((start, end))
+            start = end
+    return bounds
+
+
+def _clean_range(read_file, start, end):
+    with open(read_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return clean_block(data[start:end])
+
+
+def _ordered_map(function, tasks, workers=None):
+    """
+    Результаты function(*args) для args из tasks в исходном порядке.
+    Задания выполняются в пуле из workers процессов, одновременно в работе не больше 2 * workers заданий;
+    tasks читается по мере выполнения и может быть бесконечным
+    """
+    workers = workers or os.cpu_count()
+    if workers == 1:
+        for args in tasks:
+            yield function(*args)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        try:
+            for args in tasks:
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+                pending.append(pool.submit(function, *args))
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # при досрочном завершении не ждём уже не нужных заданий
+            for future in pending:
+                future.cancel()
+
+
+def _map_blocks(function, read_file, bounds, workers=None):
+    """Результаты function(read_file, start, end) для блоков bounds в исходном порядке"""
+    # один блок быстрее обработать на месте, чем передавать в другой процесс
+    return _ordered_map(function, [(read_file, start, end) for start, end in bounds],
+                        1 if len(bounds) <= 1 else workers)
+
+
+def check_lines(read_file, write_file, block_size=BLOCK_SIZE, workers=None):
+    """
+    Проверяет и исправляет строки на валидные.
+    Файл читается через mmap блоками по границам строк, блоки обрабатываются в пуле из workers процессов
+    и записываются в исходном порядке.
+    Возвращает число обработанных байт
     """
     logging.debug(f"Начало {check_lines.__name__}()")
-    with open(read_file, "r") as read_f:
-        with open(write_file, 'w') as write_f:
-            for _, line in enumerate(read_f, start=1):
-                line = line.strip()
-                logging.debug(line)
-                # заменяем в строке line все вхождения символов, отличных от 0-9,
-                # символа '-' для отрицательных чисел,
-                # а также разрешённого разделителя ',' (если он есть)
-                # на разделитель ','
-                line = re.compile(r'[^0-9-,]').sub(",", line)
-                logging.debug(line)
-                # возможно образовались подпоследовательности разделителей ', ...,'
-                # заменим их на одно вхождение ','
-                line = re.compile(r'(,+)').sub(",", line)
-                logging.debug(line)
-                # уберём ',' в начале и в конце строки
-                line = re.compile(r'(^,)|(,$)').sub("", line)
-                logging.debug(line)
-                logging.debug("---")
-                write_f.write(line + "\n")
-    logging.debug(f"Конец {check_lines.__name__}()")
+    bounds = split_blocks(read_file, block_size)
+    with open(write_file, "wb") as write_f:
+        for data in _map_blocks(_clean_range, read_file, bounds, workers):
+            write_f.write(data)
+    size = bounds[-1][1] if bounds else 0
+    logging.debug(f"Конец {check_lines.__name__}(): {len(bounds)} блоков, {size} байт")
+    return size
+
+
+# причины ошибок в исправленном датасете
+EMPTY_VALUE, BAD_CHARACTER, NO_DIGITS, OUT_OF_RANGE = range(4)
+ERROR_REASONS = ("пустое значение", "недопустимый символ", "нет цифр", "вне диапазона [-100, 100]")
+
+VALUE_RANGE = 100
+
+
+class DatasetReport(NamedTuple):
+    lines: int
+    values: int
+    errors: int  # всего ошибочных значений
+    first_errors: list  # не больше max_errors: (номер строки, значение, причина)
+
+
+def parse_block(data: bytes):
+    """
+    Разбирает блок из целых строк исправленного датасета векторно, без цикла по значениям.
+    Возвращает (значения int8, число значений в каждой строке, ошибки [(номер строки с 0, начало, конец, причина)]).
+    Ошибочные значения в результат не попадают
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    newlines = np.flatnonzero(buf == ord("\n"))
+    lines = len(newlines) + (1 if buf.size and buf[-1] != ord("\n") else 0)
+    separator = (buf == ord(",")) | (buf == ord("\n"))
+
+    # границы значений - переходы между разделителями и остальными символами
+    padded = np.concatenate(([True], separator, [True]))
+    change = np.diff(padded.view(np.int8))
+    starts = np.flatnonzero(change == -1)
+    ends = np.flatnonzero(change == 1)
+    previous_separator = padded[:-2]
+
+    # значения в диапазоне занимают не больше 3 значащих цифр: собираем их с конца значения
+    negative = buf[starts] == ord("-")
+    digits = ends - starts - negative
+    value = np.zeros(starts.size, dtype=np.int16)
+    for position in range(3):
+        digit = buf[np.maximum(ends - 1 - position, 0)].astype(np.int16) - ord("0")
+        digit[digits <= position] = 0
+        value += digit * 10 ** position
+    np.negative(value, out=value, where=negative)
+
+    # ведущие нули не значимы (0059 - это 59): значащие цифры начинаются с первого символа, отличного от '0'
+    not_zero = np.append(np.flatnonzero(buf != ord("0")), buf.size)
+    significant = ends - not_zero[np.searchsorted(not_zero, starts + negative)]
+
+    reason = np.full(starts.size, -1, dtype=np.int8)
+    reason[(significant > 3) | (np.abs(value) > VALUE_RANGE)] = OUT_OF_RANGE
+    reason[digits == 0] = NO_DIGITS
+    # '-' допустим только первым символом значения; ошибок обычно нет, поэтому ищутся позиции, а не значения
+    bad_char = ~separator & ((buf < ord("0")) | (buf > ord("9"))) & ~((buf == ord("-")) & previous_separator)
+    reason[np.searchsorted(starts, np.flatnonzero(bad_char), side="right") - 1] = BAD_CHARACTER
+    invalid = np.flatnonzero(reason >= 0)
+
+    # число значений в строке - число начал значений до её перевода строки
+    counts = np.diff(np.searchsorted(starts, np.append(newlines, buf.size)), prepend=0)[:lines]
+    invalid_lines = np.searchsorted(newlines, starts[invalid])
+    counts -= np.bincount(invalid_lines, minlength=lines)[:lines]
+
+    # ',' после разделителя или в начале строки, а также ',' в конце строки - пропущенное значение
+    comma = np.flatnonzero(buf == ord(","))
+    following = np.minimum(comma + 1, max(buf.size - 1, 0))
+    empty = comma[previous_separator[comma] | (comma + 1 == buf.size) | (buf[following] == ord("\n"))]
+
+    errors = [(int(line), int(starts[index]), int(ends[index]), int(reason[index]))
+              for line, index in zip(invalid_lines, invalid)]
+    errors += [(int(line), int(position), int(position) + 1, EMPTY_VALUE)
+               for line, position in zip(np.searchsorted(newlines, empty), empty)]
+    values = np.delete(value, invalid) if invalid.size else value
+    return values.astype(np.int8), counts, errors
+
+
+def _parse_range(read_file, start, end):
+    with open(read_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        block = data[start:end]
+    values, counts, errors = parse_block(block)
+    # позиции ошибок заменяются текстом значения - блок в родительский процесс не возвращается
+    errors = [(line, block[begin:finish].decode("latin-1"), code) for line, begin, finish, code in sorted(errors)]
+    return values, counts, errors
+
+
+def _write_npy_header(f, count):
+    np.lib.format.write_array_header_1_0(f, {"descr": np.lib.format.dtype_to_descr(np.dtype(np.int8)),
+                                             "fortran_order": False, "shape": (count,)})
+
+
+def export_dataset(read_file, prefix, block_size=BLOCK_SIZE, workers=None, max_errors=100):
+    """
+    Проверяет исправленный датасет и сохраняет его в двоичном виде:
+    prefix.values.npy - все значения подряд (int8), prefix.offsets.npy - начало каждой строки (int64, строк + 1).
+    Значения пишутся в файл по мере разбора блоков; ошибочные значения пропускаются и попадают в отчёт
+    """
+    logging.debug(f"Начало {export_dataset.__name__}()")
+    bounds = split_blocks(read_file, block_size)
+    counts = []
+    first_line = 0
+    total = errors = 0
+    first_errors = []
+    with open(prefix + ".values.npy", "wb") as values_f:
+        # размер заголовка .npy не зависит от числа значений - после записи данных он перезаписывается
+        _write_npy_header(values_f, 0)
+        for values, line_counts, block_errors in _map_blocks(_parse_range, read_file, bounds, workers):
+            values_f.write(values.tobytes())
+            total += values.size
+            counts.append(line_counts)
+            errors += len(block_errors)
+            for line, token, code in block_errors[:max_errors - len(first_errors)]:
+                first_errors.append((first_line + line + 1, token, ERROR_REASONS[code]))
+            first_line += line_counts.size
+        values_f.seek(0)
+        _write_npy_header(values_f, total)
+    offsets = np.zeros(first_line + 1, dtype=np.int64)
+    if counts:
+        np.cumsum(np.concatenate(counts), out=offsets[1:])
+    np.save(prefix + ".offsets.npy", offsets)
+    for line, token, reason in first_errors:
+        logging.debug(f"Строка {line}: {token!r} - {reason}")
+    logging.debug(f"Конец {export_dataset.__name__}(): {first_line} строк, {total} значений, {errors} ошибок")
+    return DatasetReport(first_line, total, errors, first_errors)
+
+
+class Dataset:
+    """
+    Датасет, сохранённый export_dataset. Файлы отображаются в память (mmap),
+    dataset[i] - i-я последовательность как срез без копирования
+    """
+
+    def __init__(self, prefix):
+        self.values = np.load(prefix + ".values.npy", mmap_mode="r")
+        self.offsets = np.load(prefix + ".offsets.npy", mmap_mode="r")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+        index %= len(self)
+        return self.values[self.offsets[index]:self.offsets[index + 1]]
 
 
 def main():
@@ -74,13 +349,24 @@ def main():
         Воспользуемся регулярными выражениями, чтобы очистить датасеты.
     """
     logging.debug(f"Начало {main.__name__}()")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=10000, help="число записей")
+    parser.add_argument("--size-mb", type=int, help="размер файла вместо числа записей, МБ")
+    parser.add_argument("--seed", type=int, help="seed генератора для воспроизводимого файла")
+    parser.add_argument("--workers", type=int, default=1, help="число процессов")
+    args = parser.parse_args()
 
     err_file = "err_datasets.txt"
     separators = [",", ";", "."]
-    create_err_file(err_file, separators)
+    create_err_file(err_file, separators, lines=args.lines, seed=args.seed, workers=args.workers,
+                    size=args.size_mb * 1024 * 1024 if args.size_mb else None)
 
     norm_datasets = "norm_datasets.txt"
-    check_lines(err_file, norm_datasets)
+    check_lines(err_file, norm_datasets, workers=args.workers)
+
+    # двоичный вид для загрузки без разбора текста: Dataset("norm_datasets")[i]
+    report = export_dataset(norm_datasets, "norm_datasets", workers=args.workers)
+    logging.debug(f"Строк: {report.lines}, значений: {report.values}, ошибок: {report.errors}")
 
     logging.debug(f"Конец {main.__name__}()")
 
@@ -0,0 +1,91 @@
+"""
+Бенчмарк очистки датасета (МБ/с): прежняя построчная check_lines против блочной
+обработки через mmap в пуле процессов. Результаты сравниваются побайтно.
+
+Запуск:
+    python data_preparation_benchmark.py datasets.txt
+    python data_preparation_benchmark.py --size-mb 500 --workers 8
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import filecmp
+
+# построчный вариант писал logging.debug на каждый шаг - в замере отключено, иначе он ещё медленнее
+logging.disable(logging.DEBUG)
+
+import data_preparation
+from data_preparation import check_lines, create_err_file
+
+# регулярные выражения прежней построчной обработки
+import patterns
+
+# разделители синтетического датасета: кроме create_err_file из main() - пробельные и повторы
+SEPARATORS = [",", ";", ".", " ", ",,", "\t"]
+
+
+def check_lines_by_line(read_file, write_file):
+    """Прежняя check_lines: три регулярных выражения на каждую строку"""
+    with open(read_file, "r") as read_f:
+        with open(write_file, 'w') as write_f:
+            for _, line in enumerate(read_f, start=1):
+                line = line.strip()
+                logging.debug(line)
+                line = patterns.DATASET_NON_SEPARATOR.sub(",", line)
+                logging.debug(line)
+                line = patterns.DATASET_REPEATED_SEPARATORS.sub(",", line)
+                logging.debug(line)
+                line = patterns.DATASET_EDGE_SEPARATORS.sub("", line)
+                logging.debug(line)
+                logging.debug("---")
+                write_f.write(line + "\n")
+
+
+def measure(name, function, read_file, write_file):
+    start = time.perf_counter()
+    function(read_file, write_file)
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(read_file or write_file)
+    print(f"{name:32} {size / elapsed / 1024 / 1024:10.1f} МБ/с  ({elapsed:.2f} с на {size / 1024 / 1024:.0f} МБ)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dataset", nargs="?", help="путь к датасету")
+    parser.add_argument("--size-mb", type=int, default=200, help="размер синтетического датасета, МБ")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="число процессов")
+    parser.add_argument("--block-mb", type=int, default=data_preparation.BLOCK_SIZE // 1024 // 1024,
+                        help="размер блока, МБ")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    read_file = args.dataset
+    if read_file is None:
+        read_file = os.path.join(directory, "err_datasets.txt")
+        measure(f"генерация {args.size_mb} МБ",
+                lambda _, w: create_err_file(w, SEPARATORS, size=args.size_mb * 1024 * 1024, seed=1,
+                                             workers=args.workers),
+                None, read_file)
+    old_file, new_file, single_file = (os.path.join(directory, name) for name in ("old.txt", "new.txt", "single.txt"))
+    block_size = args.block_mb * 1024 * 1024
+    try:
+        measure("построчно (было)", check_lines_by_line, read_file, old_file)
+        measure("блоки, 1 процесс", lambda r, w: check_lines(r, w, block_size, workers=1), read_file, single_file)
+        measure(f"блоки, {args.workers} процессов", lambda r, w: check_lines(r, w, block_size, args.workers),
+                read_file, new_file)
+        for file in (single_file, new_file):
+            if not filecmp.cmp(old_file, file, shallow=False):
+                sys.exit(f"Результат {file} отличается от построчной обработки")
+        print("Результаты совпадают")
+    finally:
+        for file in (old_file, new_file, single_file) + ((read_file,) if args.dataset is None else ()):
+            if os.path.exists(file):
+                os.remove(file)
+        os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    main()
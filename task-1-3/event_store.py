@@ -0,0 +1,220 @@
+"""
+Локальное хранилище разобранных событий журнала (SQLite) для get_ssh_ip_list и get_usb_list.
+События хранятся с индексом по времени, поэтому повторная проверка окна - выборка по диапазону
+без чтения и разбора текста журнала. Журнал дочитывается с курсора journalctl (--after-cursor),
+сохранённого при прошлой загрузке; окно раньше уже загруженного догружается отдельно.
+"""
+import datetime
+import sqlite3
+import threading
+import logging
+from typing import NamedTuple
+
+from journal_sources import LogQuery
+
+# journalctl --show-cursor печатает курсор последней записи последней строкой вывода
+CURSOR_PREFIX = "-- cursor: "
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ssh_events (
+    host     TEXT    NOT NULL,
+    ts       REAL    NOT NULL,
+    time     TEXT    NOT NULL,
+    user     TEXT    NOT NULL,
+    ip       TEXT    NOT NULL,
+    port     INTEGER NOT NULL,
+    accepted INTEGER NOT NULL,
+    failed   INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ssh_events_host_ts ON ssh_events (host, ts);
+CREATE TABLE IF NOT EXISTS usb_events (
+    host         TEXT NOT NULL,
+    ts           REAL NOT NULL,
+    time         TEXT NOT NULL,
+    action       TEXT NOT NULL,
+    port         TEXT NOT NULL,
+    idVendor     TEXT NOT NULL,
+    idProduct    TEXT NOT NULL,
+    product      TEXT NOT NULL,
+    manufacturer TEXT NOT NULL,
+    serial       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS usb_events_host_ts ON usb_events (host, ts);
+CREATE TABLE IF NOT EXISTS cursors (
+    host   TEXT NOT NULL,
+    kind   TEXT NOT NULL,
+    cursor TEXT,
+    since  REAL,
+    PRIMARY KEY (host, kind)
+) WITHOUT ROWID;
+"""
+
+# столбцы строк событий (без host) для каждого вида
+COLUMNS = {
+        "ssh": ("ts", "time", "user", "ip", "port", "accepted", "failed"),
+        "usb": ("ts", "time", "action", "port", "idVendor", "idProduct", "product", "manufacturer", "serial"),
+        }
+
+# подключение на том же порту, после которого до отключения u не было других отключений
+USB_ATTACH_OF_DETACH = """
+FROM usb_events AS a
+WHERE a.host = u.host AND a.port = u.port AND a.action = 'attach' AND (a.ts, a.rowid) < (u.ts, u.rowid)
+  AND NOT EXISTS (SELECT 1 FROM usb_events AS d
+                  WHERE d.host = u.host AND d.port = u.port AND d.action = 'detach'
+                    AND (d.ts, d.rowid) > (a.ts, a.rowid) AND (d.ts, d.rowid) < (u.ts, u.rowid))
+ORDER BY a.ts DESC, a.rowid DESC LIMIT 1
+"""
+
+
+class Coverage(NamedTuple):
+    cursor: str  # курсор последней загруженной записи; None - записей ещё не было
+    since: float  # начало загруженного окна (секунды эпохи); None - журнал загружен с начала
+
+
+class EventStore:
+    """
+    События (хост, время, поля события) видов ssh и usb и курсор загрузки для каждой пары (хост, вид).
+    Время - секунды эпохи (ts) и исходный текст (time)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        self.__connection.executescript(SCHEMA)
+
+    def coverage(self, host, kind):
+        """Загруженная часть журнала или None, если журнал хоста ещё не загружался"""
+        with self.__lock:
+            row = self.__connection.execute('SELECT cursor, since FROM cursors WHERE host = ? AND kind = ?',
+                                            (host, kind)).fetchone()
+        return Coverage(*row) if row else None
+
+    def add(self, host, kind, rows, coverage=None, replace=False):
+        """
+        Записывает строки событий (кортежи по COLUMNS[kind]) и новое состояние загрузки одной транзакцией.
+        replace - сначала удалить события хоста в диапазоне времени rows (повторная загрузка того же окна)
+        """
+        columns = COLUMNS[kind]
+        with self.__lock, self.__connection:
+            if replace and rows:
+                self.__connection.execute(f'DELETE FROM {kind}_events WHERE host = ? AND ts BETWEEN ? AND ?',
+                                          (host, min(row[0] for row in rows), max(row[0] for row in rows)))
+            last_rowid = self.__connection.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM {kind}_events'
+                                                   ).fetchone()[0]
+            self.__connection.executemany(
+                    f'INSERT INTO {kind}_events (host, {", ".join(columns)}) '
+                    f'VALUES (?, {", ".join("?" * len(columns))})',
+                    [(host, *row) for row in rows]
+                    )
+            if kind == "usb":
+                # только что записанное отключение, подключение к которому было загружено раньше,
+                # дополняется сведениями об устройстве - если между ними не было другого отключения
+                self.__connection.execute(
+                        f'UPDATE usb_events AS u SET (idVendor, idProduct, product, manufacturer, serial) = '
+                        f'(SELECT a.idVendor, a.idProduct, a.product, a.manufacturer, a.serial '
+                        f'{USB_ATTACH_OF_DETACH}) '
+                        f"WHERE host = ? AND rowid > ? AND action = 'detach' AND idVendor = '' "
+                        f'AND EXISTS (SELECT 1 {USB_ATTACH_OF_DETACH})',
+                        (host, last_rowid)
+                        )
+            if coverage is not None:
+                self.__connection.execute('INSERT OR REPLACE INTO cursors VALUES (?, ?, ?, ?)',
+                                          (host, kind, *coverage))
+
+    def ssh_stats(self, host, since=None, until=None):
+        """
+        Статистика входов по SSH за окно [since, until] (секунды эпохи) в виде audit_lines:
+        {(пользователь, ip-адрес): [успешных, неудачных, первое появление, последнее появление]}
+        """
+        with self.__lock:
+            rows = self.__connection.execute(
+                    'SELECT user, ip, SUM(accepted), SUM(failed), MIN(time), MAX(time) FROM ssh_events '
+                    'WHERE host = ? AND ts BETWEEN ? AND ? GROUP BY user, ip',
+                    (host, *_bounds(since, until))
+                    ).fetchall()
+        return {(user, ip): list(entry) for user, ip, *entry in rows}
+
+    def usb_events(self, host, since=None, until=None):
+        """Строки событий USB за окно [since, until] (секунды эпохи) по COLUMNS['usb'] без ts, по времени"""
+        with self.__lock:
+            return self.__connection.execute(
+                    f'SELECT {", ".join(COLUMNS["usb"][1:])} FROM usb_events '
+                    'WHERE host = ? AND ts BETWEEN ? AND ? ORDER BY ts',
+                    (host, *_bounds(since, until))
+                    ).fetchall()
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _bounds(since, until):
+    return (float("-inf") if since is None else since), (float("inf") if until is None else until)
+
+
+def _journal_time(ts):
+    return None if ts is None else datetime.datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def track_cursor(lines, found):
+    """Отдаёт строки журнала без строки курсора; курсор записывается в found['cursor']"""
+    for line in lines:
+        if line.startswith(CURSOR_PREFIX):
+            found["cursor"] = line[len(CURSOR_PREFIX):].strip()
+            continue
+        yield line
+
+
+def ingest(store, source, kind, parse, keywords, options, since=None):
+    """
+    Дозагружает в store журнал источника journal_sources и возвращает число новых событий.
+    parse(lines) - строки событий вида kind, keywords и options - запрос к journalctl, since - начало окна
+    (секунды эпохи), которое должно оказаться в хранилище. Источник, который сам не применяет окно
+    (файл, архив, stdin), загружается целиком и замещает события того же диапазона времени.
+    Подключение USB, строки описания которого разделены границей загрузки, сохраняется без них
+    """
+    logging.debug(f"Начало {ingest.__name__}(): {source.name}, {kind}")
+    if not source.windowed:
+        rows = list(parse(source.lines(LogQuery(keywords=keywords), *options)))
+        store.add(source.name, kind, rows, replace=True)
+        logging.debug(f"Конец {ingest.__name__}(): {len(rows)} событий")
+        return len(rows)
+
+    def read(query_since, query_until, cursor):
+        found = {"cursor": cursor}
+        query = LogQuery(since=_journal_time(query_since), until=_journal_time(query_until),
+                         keywords=keywords + (CURSOR_PREFIX,))
+        cursor_options = ("--show-cursor",) + (("--after-cursor", cursor) if cursor else ())
+        rows = list(parse(track_cursor(source.lines(query, *options, *cursor_options), found)))
+        return rows, found["cursor"]
+
+    coverage = store.coverage(source.name, kind)
+    added = 0
+    if coverage is None:
+        rows, cursor = read(since, None, None)
+        store.add(source.name, kind, rows, Coverage(cursor, since))
+        added += len(rows)
+    else:
+        if coverage.since is not None and (since is None or since < coverage.since):
+            # окно начинается раньше загруженного: догружается промежуток до его начала
+            rows, _ = read(since, coverage.since, None)
+            coverage = Coverage(coverage.cursor, since)
+            store.add(source.name, kind, rows, coverage, replace=True)
+            added += len(rows)
+        if coverage.cursor is None:
+            # прошлые загрузки не нашли записей: окно читается заново
+            rows, cursor = read(coverage.since, None, None)
+        else:
+            rows, cursor = read(None, None, coverage.cursor)
+        store.add(source.name, kind, rows, Coverage(cursor, coverage.since), replace=coverage.cursor is None)
+        added += len(rows)
+    logging.debug(f"Конец {ingest.__name__}(): {added} событий")
+    return added
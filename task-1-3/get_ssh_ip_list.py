@@ -1,6 +1,9 @@
-import paramiko
 import os
-import re
+import sys
+import csv
+import json
+import argparse
+import contextlib
 import datetime
 import logging
 
@@ -12,82 +15,165 @@ if logging.getLogger().isEnabledFor(logging.CRITICAL):
                         format=' %(asctime)s - %(levelname)s - %(message)s'
                         )
 
-from dotenv import load_dotenv
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
+import patterns
+from journal_sources import LogQuery, open_source
+from event_store import EventStore, ingest
 
-def create_journalctl_file(filename: str, command: str):
-    """
-    Сохраняет необходимую часть логов из journalctl в файл
-    """
-    logging.debug(f"Начало {create_journalctl_file.__name__}()")
-
-    dotenv_path = Path('.env')
-    load_dotenv(dotenv_path=dotenv_path)
-
-    host = os.getenv('HOST')
-    port = os.getenv('PORT')
-    username = os.getenv('USER')
-    password = os.getenv('PASSWORD')
-
-    client = paramiko.SSHClient()
-    logging.debug("SSH соединение установлено")
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    client.connect(hostname=host, username=username, password=password, port=int(port))
 
-    stdin, stdout, stderr = client.exec_command(command)
-    data = stdout.read() + stderr.read()
-    client.close()
-    logging.debug("SSH соединение закрыто")
-    data = str(data).replace('\\n', '\n').replace('\\t', '\t')[2:-1]
+# разбиение окна на части для параллельного чтения журнала задаётся с точностью до секунды
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
 
-    with open(filename, "w") as f:
-        f.write(data)
+FIELDS = ("user", "ip", "accepted", "failed", "first_seen", "last_seen")
 
-    logging.debug(f"Конец {create_journalctl_file.__name__}()")
 
-
-def check_ip_via_ssh(read_file, write_file):
+def ssh_logins(lines):
+    """
+    Входы по SSH из строк journalctl -o short-iso:
+    (время, Accepted или Failed, пользователь, ip-адрес, порт, число попыток)
+    """
+    search = patterns.SSH_AUTH.search
+    for line in lines:
+        # строки без входа отбрасываются без регулярного выражения
+        if "Accepted " not in line and "Failed " not in line:
+            continue
+        match = search(line)
+        if match is None:
+            continue
+        repeated, result, user, ip, port = match.groups()
+        yield line[:line.find(" ")], result, user, ip, port, int(repeated) if repeated else 1
+
+
+def audit_lines(lines, stats=None, until=None, since=None):
+    """
+    Собирает статистику входов по SSH из строк journalctl -o short-iso:
+    {(пользователь, ip-адрес): [успешных, неудачных, первое появление, последнее появление]}.
+    until (YYYY-MM-DDTHH:MM:SS) - записи с этой секунды и позже пропускаются,
+    since - записи раньше этой секунды пропускаются
     """
-    Из сохранённых логов получает:
-    - дату подключения
-    - время подключения
-    - имя пользователя
-    - ip-адрес подключения
-    - порт подключения
+    stats = {} if stats is None else stats
+    for timestamp, result, user, ip, _, count in ssh_logins(lines):
+        if until is not None and timestamp[:19] >= until or since is not None and timestamp[:19] < since:
+            continue
+        entry = stats.get((user, ip))
+        if entry is None:
+            entry = stats[(user, ip)] = [0, 0, timestamp, timestamp]
+        entry[0 if result == "Accepted" else 1] += count
+        if timestamp < entry[2]:
+            entry[2] = timestamp
+        if timestamp > entry[3]:
+            entry[3] = timestamp
+    return stats
+
+
+def ssh_rows(lines):
     """
-    logging.debug(f"Начало {check_ip_via_ssh.__name__}()")
-
-    dt = datetime.datetime.now()
-    month, day = dt.strftime("%b"), dt.day
-
-    main_info = set()
-
-    with open(read_file, "r") as read_f:
-        with open(write_file, 'w') as write_f:
-            for _, line in enumerate(read_f, start=1):
-                line = line.strip()
-                try:
-                    # найдём в лог-файле строки, которые содержат дату текущего месяца,
-                    # а также текущий день, время подключения, имя пользователя,
-                    # ip-адрес и порт.
-                    template = re.compile(
-                            fr'^({month})\s({day})\s([0-9:]+)\s.*\sfor\s([a-z0-9-_]+)\sfrom\s([0-9:.]+)\sport\s([0-9]+)\s'
-                            )
-                    line = template.search(line)
-                    # print(line.groups())
-                    logging.debug(line.groups())
-                    tpl = tuple([e for e in line.groups()])
-                    if tpl not in main_info:
-                        main_info.add(tpl)
-                except AttributeError:
-                    continue
-
-            if main_info:
-                for tpl in sorted(main_info, key=lambda tpl: (tpl[1], tpl[2])):
-                    write_f.write(f"{tpl[0]}-{tpl[1]}-{tpl[2]}, {tpl[3]}@{tpl[4]}:{tpl[5]}\n")
-
-    logging.debug(f"Конец {check_ip_via_ssh.__name__}()")
+    Входы по SSH из строк journalctl -o short-iso для event_store:
+    (секунды эпохи, время, пользователь, ip-адрес, порт, успешных, неудачных)
+    """
+    for timestamp, result, user, ip, port, count in ssh_logins(lines):
+        accepted = result == "Accepted"
+        yield (datetime.datetime.fromisoformat(timestamp).timestamp(), timestamp, user, ip, int(port),
+               count if accepted else 0, 0 if accepted else count)
+
+
+def merge_stats(target, stats):
+    """Добавляет статистику stats, собранную по другой части окна, к target"""
+    for key, (accepted, failed, first_seen, last_seen) in stats.items():
+        entry = target.get(key)
+        if entry is None:
+            target[key] = [accepted, failed, first_seen, last_seen]
+            continue
+        entry[0] += accepted
+        entry[1] += failed
+        entry[2] = min(entry[2], first_seen)
+        entry[3] = max(entry[3], last_seen)
+    return target
+
+
+def split_window(since, until, parts):
+    """
+    Делит окно [since, until] на parts частей [(since, until, граница для audit_lines)].
+    journalctl включает обе границы, поэтому записи граничной секунды достаются следующей части.
+    Окно, заданное не датами (например, 'yesterday'), не делится
+    """
+    try:
+        start = datetime.datetime.fromisoformat(since)
+        end = datetime.datetime.fromisoformat(until)
+    except (TypeError, ValueError):
+        return [(since, until, None)]
+    parts = max(1, min(parts, int((end - start).total_seconds())))
+    step = (end - start) / parts
+    bounds = [(start + step * number).replace(microsecond=0) for number in range(parts)] + [end]
+    return [(bounds[number].strftime(TIMESTAMP_FORMAT).replace("T", " "),
+             bounds[number + 1].strftime(TIMESTAMP_FORMAT).replace("T", " "),
+             bounds[number + 1].strftime(TIMESTAMP_FORMAT) if number + 1 < parts else None)
+            for number in range(parts)]
+
+
+def window_border(value):
+    """Граница окна в формате journalctl как YYYY-MM-DDTHH:MM:SS; None - не задана или не дата"""
+    try:
+        return datetime.datetime.fromisoformat(value).strftime(TIMESTAMP_FORMAT)
+    except (TypeError, ValueError):
+        if value is not None:
+            logging.warning(f"Граница окна {value} не дата и не проверяется при разборе")
+        return None
+
+
+def audit_source(source, since=None, until=None, parallel=1):
+    """
+    Читает журнал sshd из источника journal_sources построчно, без промежуточного файла.
+    Если источник поддерживает окно времени и parallel > 1, окно делится на части,
+    которые читаются одновременно; окно сохранённого журнала проверяется при разборе
+    """
+    logging.debug(f"Начало {audit_source.__name__}()")
+    if not source.windowed:
+        lines = source.lines(LogQuery(keywords=('sshd',)), '-o', 'short-iso')
+        stats = audit_lines(lines, until=window_border(until), since=window_border(since))
+        logging.debug(f"Конец {audit_source.__name__}(): {len(stats)} пар (пользователь, ip)")
+        return stats
+
+    windows = split_window(since, until, parallel if source.parallel else 1)
+
+    def audit_window(window):
+        part_since, part_until, border = window
+        # окно времени и отбор строк sshd выполняются источником
+        query = LogQuery(since=part_since, until=part_until, keywords=('sshd',))
+        return audit_lines(source.lines(query, '-o', 'short-iso'), until=border)
+
+    with ThreadPoolExecutor(max_workers=len(windows)) as executor:
+        stats = {}
+        for part in executor.map(audit_window, windows):
+            merge_stats(stats, part)
+    logging.debug(f"Конец {audit_source.__name__}(): {len(stats)} пар (пользователь, ip)")
+    return stats
+
+
+def audit_store(store, source, since=None, until=None):
+    """
+    Дозагружает журнал sshd источника в event_store и считает статистику окна [since, until]
+    (секунды эпохи) выборкой по индексу времени
+    """
+    logging.debug(f"Начало {audit_store.__name__}()")
+    added = ingest(store, source, "ssh", ssh_rows, ('sshd',), ('-o', 'short-iso'), since)
+    stats = store.ssh_stats(source.name, since, until)
+    logging.debug(f"Конец {audit_store.__name__}(): загружено {added} событий, {len(stats)} пар (пользователь, ip)")
+    return stats
+
+
+def write_stats(stats, output, output_format="csv"):
+    """Сохраняет статистику в CSV или JSON; строки упорядочены по времени первого появления"""
+    rows = [dict(zip(FIELDS, key + tuple(entry))) for key, entry in sorted(stats.items(), key=lambda item: item[1][2])]
+    with (open(output, "w", newline="") if output != "-" else contextlib.nullcontext(sys.stdout)) as f:
+        if output_format == "json":
+            json.dump(rows, f, ensure_ascii=False, indent=1)
+            f.write("\n")
+        else:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
 
 
 def main():
@@ -96,14 +182,39 @@ def main():
     требованиям политик безопасности реализуем скрипт, который будет вытягивать
     необходимую информацию из journalctl и сохранять полученные данные для дальнейшей
     проверки через white list или black list.
+    Для каждой пары (пользователь, ip-адрес) за окно --since/--until считаются успешные
+    и неудачные входы, время первого и последнего появления.
     """
     logging.debug(f"Начало {main.__name__}()")
-    log_file = "journalctl-ssh.txt"
-
-    create_journalctl_file(log_file, "journalctl | grep sshd")
-
-    usd_devs = "ssh_ip_list.txt"
-    check_ip_via_ssh(log_file, usd_devs)
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--since", help="начало окна в формате journalctl, например 2023-12-30 или "
+                                        "'2023-12-30 18:00:00' (для ssh и local по умолчанию - сегодня)")
+    parser.add_argument("--until", help="конец окна в формате journalctl")
+    parser.add_argument("--format", choices=("csv", "json"), default="csv")
+    parser.add_argument("--output", help="файл результата, '-' - стандартный вывод (по умолчанию ssh_ip_list.csv)")
+    parser.add_argument("--source", default="ssh",
+                        help="откуда читать журнал: ssh - хост из .env, local - journalctl этого хоста, "
+                             "путь к сохранённому выводу journalctl -o short-iso (в том числе .gz), '-' - stdin")
+    parser.add_argument("--parallel", type=int, default=1, help="число одновременно читаемых частей окна")
+    parser.add_argument("--store", help="база SQLite разобранных событий: журнал дочитывается с прошлого курсора, "
+                                        "окно выбирается по индексу времени (--since/--until - даты ISO 8601)")
+    args = parser.parse_args()
+
+    with open_source(args.source, max_channels=args.parallel) as source:
+        since = args.since
+        if since is None and source.windowed:
+            since = datetime.date.today().isoformat()
+        if args.store:
+            try:
+                since, until = (None if border is None else datetime.datetime.fromisoformat(border).timestamp()
+                                for border in (since, args.until))
+            except ValueError:
+                parser.error("с --store границы окна задаются датами ISO 8601")
+            with EventStore(args.store) as store:
+                stats = audit_store(store, source, since, until)
+        else:
+            stats = audit_source(source, since, args.until, args.parallel)
+    write_stats(stats, args.output or f"ssh_ip_list.{args.format}", args.format)
 
     logging.debug(f"Конец {main.__name__}()")
 
@@ -1,9 +1,12 @@
-import paramiko
 import os
-import re
+import sys
+import csv
+import json
+import argparse
+import contextlib
 import datetime
-import calendar
 import logging
+from typing import NamedTuple
 
 # logging.disable(logging.CRITICAL)
 
@@ -13,118 +16,139 @@ if logging.getLogger().isEnabledFor(logging.CRITICAL):
                         format=' %(asctime)s - %(levelname)s - %(message)s'
                         )
 
-from dotenv import load_dotenv
-from pathlib import Path
 
+import patterns
+from journal_sources import LogQuery, open_source
+from event_store import EventStore, ingest
 
-def create_journalctl_file(filename: str, command: str):
-    """
-    Сохраняет необходимую часть логов из journalctl в файл
-    """
-    logging.debug(f"Начало {create_journalctl_file.__name__}()")
-
-    dotenv_path = Path('.env')
-    load_dotenv(dotenv_path=dotenv_path)
-
-    host = os.getenv('HOST')
-    port = os.getenv('PORT')
-    username = os.getenv('USER')
-    password = os.getenv('PASSWORD')
 
-    client = paramiko.SSHClient()
-    logging.debug("SSH соединение установлено")
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    client.connect(hostname=host, username=username, password=password, port=int(port))
+class UsbEvent(NamedTuple):
+    time: datetime.datetime
+    action: str  # attach или detach
+    port: str  # порт ядра, например 1-1.2
+    idVendor: str
+    idProduct: str
+    product: str
+    manufacturer: str
+    serial: str
 
-    stdin, stdout, stderr = client.exec_command(command)
-    data = stdout.read() + stderr.read()
-    client.close()
-    logging.debug("SSH соединение закрыто")
-    data = str(data).replace('\\n', '\n').replace('\\t', '\t')[2:-1]
 
-    with open(filename, "w") as f:
-        f.write(data)
+FIELDS = UsbEvent._fields
 
-    logging.debug(f"Конец {create_journalctl_file.__name__}()")
+# строки описания нового устройства -> поле события
+DESCRIPTION_FIELDS = {"Product": "product", "Manufacturer": "manufacturer", "SerialNumber": "serial"}
 
 
-def get_days_in_month(month_name):
+def _parse_line(line):
     """
-    Возвращает количество дней в месяце
+    (сообщение, время) строки journalctl -o short-iso или -o json; None - строка не о USB.
+    Время пока не разобрано: текст ISO 8601 или секунды эпохи
     """
-    month_days = {
-            "Jan": 31,
-            "Feb": None,
-            "Mar": 31,
-            "Apr": 30,
-            "May": 31,
-            "Jun": 30,
-            "Jul": 31,
-            "Aug": 31,
-            "Sep": 30,
-            "Oct": 31,
-            "Nov": 30,
-            "Dec": 31
-            }
-
-    year = datetime.datetime.now().year
-
-    month_days["Feb"] = 29 if calendar.isleap(year) else 28
-
-    return month_days[month_name]
-
-
-def check_usb_devs(read_file, write_file):
+    if line.startswith("{"):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return None
+        message = entry.get("MESSAGE")
+        if not isinstance(message, str) or "usb " not in message:
+            return None
+        return message, int(entry.get("__REALTIME_TIMESTAMP", 0)) / 1e6
+    if "usb " not in line:
+        return None
+    return line, line[:line.find(" ")]
+
+
+def _parse_time(value):
+    if isinstance(value, str):
+        return datetime.datetime.fromisoformat(value)
+    return datetime.datetime.fromtimestamp(value).astimezone()
+
+
+def usb_events(lines, since=None, until=None):
+    """
+    События подключения и отключения USB-устройств из строк журнала ядра
+    (journalctl -o short-iso или -o json, форматы можно смешивать).
+    Каждая строка разбирается одним регулярным выражением, время - только у строк о USB.
+    Подключение отдаётся, когда собраны строки описания устройства (Product, Manufacturer, SerialNumber),
+    отключение дополняется сведениями о подключённом на этом порту устройстве.
+    since, until - окно времени (datetime с часовым поясом)
     """
-    Из сохранённых логов получает:
-    - дату подключения
-    - время подключения
-    - idVendor устройства
-    - idProduct устройства
+    pending = {}  # порт -> поля подключения, для которого ещё могут прийти строки описания
+    attached = {}  # порт -> поля подключённого устройства
+    search = patterns.USB_EVENT.search
+    for line in lines:
+        parsed = _parse_line(line)
+        if parsed is None:
+            continue
+        message, time = parsed
+        match = search(message)
+        if match is None:
+            continue
+        time = _parse_time(time)
+        if since is not None and time < since or until is not None and time > until:
+            continue
+        port, vendor, product_id, field, value, _ = match.groups()
+        if field is not None:
+            if port in pending:
+                pending[port][DESCRIPTION_FIELDS[field]] = value.strip()
+            continue
+        if port in pending:
+            attached[port] = pending.pop(port)
+            yield UsbEvent(action="attach", **attached[port])
+        if vendor is not None:
+            pending[port] = dict(time=time, port=port, idVendor=vendor.lower(), idProduct=product_id.lower(),
+                                 product="", manufacturer="", serial="")
+        else:
+            device = attached.pop(port, None) or dict(port=port, idVendor="", idProduct="", product="",
+                                                        manufacturer="", serial="")
+            yield UsbEvent(action="detach", **dict(device, time=time))
+    for device in pending.values():
+        yield UsbEvent(action="attach", **device)
+
+
+def events_from_source(source, since=None, until=None, journal_format="short-iso"):
     """
-    logging.debug(f"Начало {check_usb_devs.__name__}()")
-
-    dt = datetime.datetime.now()
-    month, day = dt.strftime("%b"), dt.day
-
-    main_info = set()
-
-    with open(read_file, "r") as read_f:
-        with open(write_file, 'w') as write_f:
-            for _, line in enumerate(read_f, start=1):
-                line = line.strip()
-                try:
-                    # найдём строки, которые содержат дату текущего месяца,
-                    # а также текущий день, 1 день назад и 2 дня назад;
-                    # сделаем обрезание дня по модулю числа дней в месяце;
-                    # в предпоследней группе сохраним время,
-                    # в последней пустой группе сохраним строку без указания даты
-                    mod = get_days_in_month(month)
-
-                    template = re.compile(
-                            fr'^({month})\s(({day})|({(day - 1) % mod})|({(day - 2) % mod}))\s([0-9:]+)\s(.*)'
-                            )
-                    line = template.search(line)
-                    logging.debug(line.groups())
-                    gps = line.groups()
-                    month_, day_, time_, line = gps[0], gps[1], gps[-2], gps[-1]
-
-                    # найдём строки, которые содержат idVendor и idProduct
-                    template = re.compile(r'.*(idVendor)=([0-9a-z]{4}),\s(idProduct)=([0-9a-z]{4})')
-                    _, idVendor_, _, idProduct_ = template.search(line).groups()
-                    tpl = (month_, day_, time_, idVendor_, idProduct_)
-                    logging.debug(tpl)
-
-                    if tpl not in main_info:
-                        main_info.add(tpl)
-                except AttributeError:
-                    continue
-
-            if main_info:
-                for tpl in sorted(main_info, key=lambda tpl: (tpl[1], tpl[2])):
-                    write_f.write(f"{tpl[0]}-{tpl[1]}-{tpl[2]}, {tpl[3]}:{tpl[4]}\n")
-
-    logging.debug(f"Конец {check_usb_devs.__name__}()")
+    Читает журнал ядра из источника journal_sources построчно, без промежуточного файла.
+    journal_format - формат вывода journalctl для источников, которые его запускают
+    """
+    logging.debug(f"Начало {events_from_source.__name__}()")
+    # окно времени и отбор строк usb выполняются источником, если он это умеет
+    query = LogQuery(since=since.strftime("%Y-%m-%d %H:%M:%S") if since else None,
+                     until=until.strftime("%Y-%m-%d %H:%M:%S") if until else None, keywords=('usb',))
+    events = list(usb_events(source.lines(query, '-t', 'kernel', '-o', journal_format), since, until))
+    logging.debug(f"Конец {events_from_source.__name__}(): {len(events)} событий")
+    return events
+
+
+def usb_rows(lines):
+    """События USB из строк журнала ядра для event_store: секунды эпохи, затем поля UsbEvent"""
+    for event in usb_events(lines):
+        yield (event.time.timestamp(), event.time.isoformat(), *event[1:])
+
+
+def events_from_store(store, source, since=None, until=None, journal_format="short-iso"):
+    """Дозагружает журнал ядра источника в event_store и выбирает события окна по индексу времени"""
+    logging.debug(f"Начало {events_from_store.__name__}()")
+    added = ingest(store, source, "usb", usb_rows, ('usb',), ('-t', 'kernel', '-o', journal_format),
+                   since.timestamp() if since else None)
+    events = [UsbEvent(datetime.datetime.fromisoformat(time), *fields)
+              for time, *fields in store.usb_events(source.name, since.timestamp() if since else None,
+                                                    until.timestamp() if until else None)]
+    logging.debug(f"Конец {events_from_store.__name__}(): загружено {added}, в окне {len(events)} событий")
+    return events
+
+
+def write_events(events, output, output_format="csv"):
+    """Сохраняет события в CSV или JSON в порядке времени"""
+    rows = [dict(event._asdict(), time=event.time.isoformat()) for event in sorted(events, key=lambda e: e.time)]
+    with (open(output, "w", newline="") if output != "-" else contextlib.nullcontext(sys.stdout)) as f:
+        if output_format == "json":
+            json.dump(rows, f, ensure_ascii=False, indent=1)
+            f.write("\n")
+        else:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
 
 
 def main():
@@ -133,14 +157,38 @@ def main():
     требованиям политик безопасности реализуем скрипт, который будет вытягивать
     необходимую информацию из journalctl и сохранять полученные данные для дальнейшей
     проверки через white list или black list.
+    Окно времени - последние --hours часов (для ssh и local по умолчанию трое суток) или --since/--until;
+    сохранённый журнал без заданного окна разбирается целиком.
     """
     logging.debug(f"Начало {main.__name__}()")
-    journal = "journalctl.txt"
-
-    create_journalctl_file(journal, "journalctl -t kernel | grep usb")
-
-    usd_devs = "usb_devs.txt"
-    check_usb_devs(journal, usd_devs)
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--hours", type=float, help="длина окна до текущего момента, ч")
+    parser.add_argument("--since", type=datetime.datetime.fromisoformat, help="начало окна, ISO 8601")
+    parser.add_argument("--until", type=datetime.datetime.fromisoformat, help="конец окна, ISO 8601")
+    parser.add_argument("--journal-format", choices=("short-iso", "json"), default="short-iso",
+                        help="формат вывода journalctl для источников ssh и local")
+    parser.add_argument("--format", choices=("csv", "json"), default="csv")
+    parser.add_argument("--output", help="файл результата, '-' - стандартный вывод (по умолчанию usb_devs.csv)")
+    parser.add_argument("--source", default="ssh",
+                        help="откуда читать журнал: ssh - хост из .env, local - journalctl этого хоста, "
+                             "путь к сохранённому выводу journalctl -o short-iso/json (в том числе .gz), '-' - stdin")
+    parser.add_argument("--store", help="база SQLite разобранных событий: журнал дочитывается с прошлого курсора, "
+                                        "окно выбирается по индексу времени")
+    args = parser.parse_args()
+
+    with open_source(args.source) as source:
+        # границы без часового пояса считаются местным временем
+        until = args.until.astimezone() if args.until else None
+        since = args.since.astimezone() if args.since else None
+        hours = args.hours if args.hours is not None or not source.windowed else 72
+        if since is None and hours is not None:
+            since = (until or datetime.datetime.now().astimezone()) - datetime.timedelta(hours=hours)
+        if args.store:
+            with EventStore(args.store) as store:
+                events = events_from_store(store, source, since, until, args.journal_format)
+        else:
+            events = events_from_source(source, since, until, args.journal_format)
+    write_events(events, args.output or f"usb_devs.{args.format}", args.format)
 
     logging.debug(f"Конец {main.__name__}()")
 
@@ -0,0 +1,145 @@
+"""
+Источники строк журнала для get_ssh_ip_list и get_usb_list: journalctl на удалённом хосте по SSH,
+локальный journalctl, сохранённый вывод journalctl (файл или архив gzip) и стандартный ввод.
+Каждый источник отдаёт строки по запросу LogQuery, поэтому разбор журнала не зависит от источника.
+Источники с windowed = True сами применяют окно времени запроса (journalctl --since/--until),
+остальные отдают все строки с ключевыми словами запроса - окно проверяется при разборе.
+"""
+import io
+import os
+import sys
+import abc
+import gzip
+import socket
+import logging
+import subprocess
+
+from dotenv import load_dotenv
+from pathlib import Path
+
+# запрос к журналу (LogQuery) и пул SSH-соединений - общие с ботом; это единственное место,
+# где task-1-3 обращается к каталогу бота, остальные модули импортируют их отсюда
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'functional_bot'))
+from log_query import LogQuery
+
+GZIP_MAGIC = b"\x1f\x8b"
+# размер буфера чтения вывода локального journalctl
+READ_BUFFER = 1 << 16
+
+
+class JournalSource(abc.ABC):
+    """
+    Источник строк журнала. lines(query, *options) - итератор строк с завершающим '\\n',
+    options - параметры journalctl (например, '-o', 'short-iso').
+    Источник закрывается через close() или как контекстный менеджер; name - имя хоста
+    или файла, под которым события источника хранятся в event_store
+    """
+    name = None
+    windowed = True
+    # можно ли читать несколько частей окна одновременно
+    parallel = True
+
+    @abc.abstractmethod
+    def lines(self, query, *options):
+        """Строки журнала по запросу LogQuery"""
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SSHJournal(JournalSource):
+    """journalctl на удалённом хосте; части окна читаются по каналам одного SSH-соединения"""
+
+    def __init__(self, host, port, username, password, max_channels=4):
+        # paramiko нужен только этому источнику: локальный разбор работает и без него
+        from ssh_pool import SSHPool
+        self.name = host
+        self.credentials = (host, port, username, password)
+        self.pool = SSHPool(max_channels=max_channels)
+
+    @classmethod
+    def from_env(cls, max_channels=4):
+        """Хост из .env (HOST, PORT, USER, PASSWORD)"""
+        dotenv_path = Path('.env')
+        load_dotenv(dotenv_path=dotenv_path)
+        return cls(os.getenv('HOST'), int(os.getenv('PORT')), os.getenv('USER'), os.getenv('PASSWORD'),
+                   max_channels)
+
+    def lines(self, query, *options):
+        command = query.journalctl(*options)
+        logging.debug(f"{self.credentials[0]}: {command}")
+        return self.pool.iter_lines(*self.credentials, command)
+
+    def close(self):
+        self.pool.close_all()
+
+
+class LocalJournal(JournalSource):
+    """journalctl на этом хосте: вывод читается из канала процесса по мере появления"""
+
+    def __init__(self):
+        self.name = socket.gethostname()
+
+    def lines(self, query, *options):
+        # команда с фильтром grep - конвейер, поэтому запускается через shell
+        command = query.journalctl(*options)
+        logging.debug(command)
+        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, bufsize=READ_BUFFER,
+                                   encoding="utf-8", errors="replace")
+        try:
+            yield from process.stdout
+        finally:
+            if process.poll() is None:
+                process.kill()
+            process.stdout.close()
+            process.wait()
+
+
+class FileJournal(JournalSource):
+    """
+    Сохранённый вывод journalctl (-o short-iso или -o json): файл, архив gzip
+    (определяется по сигнатуре, а не по расширению) или стандартный ввод ('-').
+    Файл открывается заново при каждом вызове lines(), стандартный ввод читается один раз
+    """
+    windowed = False
+    parallel = False
+
+    def __init__(self, path):
+        self.name = "stdin" if path == "-" else os.path.abspath(path)
+        self.path = path
+
+    def lines(self, query, *options):
+        logging.debug(f"{self.path}: {query}")
+        raw = sys.stdin.buffer if self.path == "-" else open(self.path, "rb")
+        text = None
+        try:
+            stream = raw
+            if raw.peek(len(GZIP_MAGIC))[:len(GZIP_MAGIC)] == GZIP_MAGIC:
+                stream = gzip.GzipFile(fileobj=raw)
+            text = io.TextIOWrapper(stream, encoding="utf-8", errors="replace")
+            # ключевые слова проверяются так же, как grep на хосте
+            yield from filter(query.matches, text) if query.keywords else text
+        finally:
+            if self.path != "-":
+                raw.close()
+            elif text is not None:
+                # стандартный ввод остаётся открытым
+                text.detach()
+
+
+def open_source(spec, max_channels=4):
+    """
+    Источник по описанию из командной строки:
+    ssh - хост из .env, local - journalctl этого хоста, '-' - стандартный ввод, иначе путь к файлу или архиву
+    """
+    if spec == "ssh":
+        return SSHJournal.from_env(max_channels)
+    if spec == "local":
+        return LocalJournal()
+    return FileJournal(spec)
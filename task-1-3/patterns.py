@@ -0,0 +1,39 @@
+"""
+Регулярные выражения скриптов task-1-3: разбор журналов для аудита SSH и USB
+и прежняя построчная очистка датасетов (для бенчмарков).
+Все шаблоны компилируются один раз при импорте модуля.
+"""
+import re
+from functools import lru_cache
+
+### Подготовка датасетов.
+
+# символы, отличные от цифр, '-' и разрешённого разделителя ','
+DATASET_NON_SEPARATOR = re.compile(r'[^0-9-,]')
+# подпоследовательности разделителей ', ...,'
+DATASET_REPEATED_SEPARATORS = re.compile(r'(,+)')
+# ',' в начале и в конце строки
+DATASET_EDGE_SEPARATORS = re.compile(r'(^,)|(,$)')
+
+
+### Аудит SSH-подключений и USB-устройств.
+
+# вход по SSH, успешный или нет (в том числе свёрнутый journald 'message repeated N times: [ ... ]'):
+# число повторов, Accepted/Failed, пользователь, ip-адрес, порт
+SSH_AUTH = re.compile(r'(?:repeated\s([0-9]+)\stimes:\s\[\s)?(Accepted|Failed)\s\S+\sfor\s(?:invalid\suser\s)?(\S+)'
+                      r'\sfrom\s([0-9a-fA-F:.]+)\sport\s([0-9]+)')
+
+
+@lru_cache(maxsize=32)
+def usb_days(month, days):
+    """Строка journalctl за один из дней days: месяц, день, ..., время, строка без даты."""
+    alternatives = '|'.join(f'({day})' for day in days)
+    return re.compile(fr'^({month})\s({alternatives})\s([0-9:]+)\s(.*)')
+
+
+USB_IDS = re.compile(r'.*(idVendor)=([0-9a-z]{4}),\s(idProduct)=([0-9a-z]{4})')
+
+# сообщение ядра о USB-устройстве: порт, затем idVendor и idProduct нового устройства,
+# или строка описания (Product, Manufacturer, SerialNumber) и её значение, или номер отключённого устройства
+USB_EVENT = re.compile(r'usb\s(\S+):\s(?:New\sUSB\sdevice\sfound,\sidVendor=([0-9a-fA-F]{4}),\sidProduct=([0-9a-fA-F]{4})'
+                       r'|(Product|Manufacturer|SerialNumber):\s(.*)|USB\sdisconnect,\sdevice\snumber\s([0-9]+))')
@@ -0,0 +1,272 @@
+import os
+import csv
+import json
+import socket
+import argparse
+import datetime
+import ipaddress
+import threading
+import time
+import logging
+from typing import NamedTuple
+
+# logging.disable(logging.CRITICAL)
+
+if logging.getLogger().isEnabledFor(logging.CRITICAL):
+    logging.basicConfig(filename=f'log-task-1-3-{os.path.basename(__file__)}-{datetime.datetime.now()}.txt',
+                        level=logging.DEBUG,
+                        format=' %(asctime)s - %(levelname)s - %(message)s'
+                        )
+
+ALLOW, DENY = "allow", "deny"
+
+
+class Rule(NamedTuple):
+    action: str  # allow - из белого списка, deny - из чёрного
+    text: str  # запись списка: 10.0.0.0/8, 1d6b:0002, 0781:*
+    source: str  # файл:строка
+
+
+class Violation(NamedTuple):
+    kind: str  # ssh или usb
+    subject: str  # ip-адрес или idVendor:idProduct
+    reason: str  # blacklisted или not_whitelisted
+    rule: str  # сработавшая запись чёрного списка ('' - адреса нет в белом списке)
+    source: str
+    details: dict  # строка проверяемого отчёта
+
+
+class PrefixTrie:
+    """
+    Многобитное префиксное дерево с шагом 8 бит для поиска наиболее длинного совпадающего префикса.
+    Узел - словарь: байт адреса -> [дочерний узел, правило, длина его префикса];
+    префикс, длина которого не кратна 8, раскрывается в 2^(8 - остаток) записей последнего узла.
+    Поиск - не больше 4 (IPv4) или 16 (IPv6) обращений к словарю при любом числе правил
+    """
+
+    def __init__(self):
+        self.roots = {4: {}, 16: {}}  # длина адреса в байтах -> корень
+        self.defaults = {}  # правила /0
+        self.size = 0
+
+    def add(self, network, value):
+        packed = network.network_address.packed
+        length = network.prefixlen
+        self.size += 1
+        if length == 0:
+            self.defaults[len(packed)] = value
+            return
+        full, rest = divmod(length, 8)
+        if rest == 0:
+            full, rest = full - 1, 8
+        node = self.roots[len(packed)]
+        for byte in packed[:full]:
+            entry = node.get(byte)
+            if entry is None:
+                entry = node[byte] = [None, None, -1]
+            if entry[0] is None:
+                entry[0] = {}
+            node = entry[0]
+        first = packed[full]
+        for byte in range(first, first + (1 << (8 - rest))):
+            entry = node.get(byte)
+            if entry is None:
+                entry = node[byte] = [None, None, -1]
+            # более длинный префикс, добавленный раньше, не перезаписывается
+            if entry[2] <= length:
+                entry[1], entry[2] = value, length
+
+    def lookup(self, packed):
+        """Правило наиболее длинного префикса, содержащего адрес (packed - 4 или 16 байт), или None"""
+        found = self.defaults.get(len(packed))
+        node = self.roots[len(packed)]
+        for byte in packed:
+            entry = node.get(byte)
+            if entry is None:
+                break
+            # записи следующего уровня всегда длиннее
+            if entry[1] is not None:
+                found = entry[1]
+            node = entry[0]
+            if node is None:
+                break
+        return found
+
+
+def pack_ip(ip):
+    """ip-адрес в виде 4 или 16 байт; None - не адрес"""
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            return socket.inet_pton(family, ip)
+        except OSError:
+            continue
+    return None
+
+
+def read_list(path):
+    """Непустые строки файла списка без комментариев '#': [(запись, номер строки)]"""
+    entries = []
+    with open(path) as f:
+        for number, line in enumerate(f, start=1):
+            line = line.split("#", 1)[0].strip()
+            if line:
+                entries.append((line, number))
+    return entries
+
+
+class _Index(NamedTuple):
+    ips: PrefixTrie
+    ip_whitelist: bool  # задан ли белый список адресов
+    usb: dict  # (idVendor, idProduct) или (idVendor, '*') -> Rule
+    usb_whitelist: bool
+
+
+class Policy:
+    """
+    Белые и чёрные списки ip-адресов (адреса и сети CIDR) и USB-устройств (idVendor:idProduct,
+    idVendor:* - все устройства производителя), загружаемые из файлов.
+    Решение принимает наиболее точная запись: наиболее длинный префикс сети, пара раньше производителя.
+    Если запись не найдена, а белый список задан, - нарушение not_whitelisted.
+    Файлы перечитываются, если изменилось время их изменения (не чаще check_interval секунд);
+    новый индекс строится целиком и подменяет прежний, проверки при этом не блокируются
+    """
+
+    def __init__(self, ip_whitelist=None, ip_blacklist=None, usb_whitelist=None, usb_blacklist=None,
+                 check_interval=5):
+        self.files = {(ALLOW, "ip"): ip_whitelist, (DENY, "ip"): ip_blacklist,
+                      (ALLOW, "usb"): usb_whitelist, (DENY, "usb"): usb_blacklist}
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.__mtimes = None
+        self.__checked = 0.0
+        self.__index = None
+        self.reload(force=True)
+
+    def __stat(self):
+        return {path: os.stat(path).st_mtime_ns for path in self.files.values() if path}
+
+    def reload(self, force=False):
+        """Перестраивает индекс, если файлы списков изменились; возвращает True при перестройке"""
+        now = time.monotonic()
+        if not force and now - self.__checked < self.check_interval:
+            return False
+        with self.lock:
+            self.__checked = now
+            mtimes = self.__stat()
+            if not force and mtimes == self.__mtimes:
+                return False
+            self.__index = self.__build()
+            self.__mtimes = mtimes
+        return True
+
+    def __build(self):
+        logging.debug(f"Начало {self.reload.__name__}()")
+        ips = PrefixTrie()
+        usb = {}
+        # чёрный список загружается последним: запись, попавшая в оба списка, запрещает
+        for action in (ALLOW, DENY):
+            path = self.files[(action, "ip")]
+            for entry, number in read_list(path) if path else ():
+                try:
+                    ips.add(ipaddress.ip_network(entry, strict=False), Rule(action, entry, f"{path}:{number}"))
+                except ValueError:
+                    logging.warning(f"{path}:{number}: не адрес и не сеть: {entry}")
+            path = self.files[(action, "usb")]
+            for entry, number in read_list(path) if path else ():
+                vendor, _, product = entry.lower().partition(":")
+                if not vendor or not product:
+                    logging.warning(f"{path}:{number}: ожидается idVendor:idProduct: {entry}")
+                    continue
+                usb[(vendor, product)] = Rule(action, entry, f"{path}:{number}")
+        index = _Index(ips, bool(self.files[(ALLOW, "ip")]), usb, bool(self.files[(ALLOW, "usb")]))
+        logging.debug(f"Конец {self.reload.__name__}(): {ips.size} сетей, {len(usb)} USB-устройств")
+        return index
+
+    @staticmethod
+    def __verdict(rule, whitelist):
+        if rule is None:
+            return ("not_whitelisted", "", "") if whitelist else None
+        if rule.action == DENY:
+            return "blacklisted", rule.text, rule.source
+        return None
+
+    def check_ip(self, ip):
+        """(причина, запись, источник) для запрещённого адреса или None"""
+        index = self.__index
+        packed = pack_ip(ip)
+        if packed is None:
+            return "not_an_address", "", ""
+        return self.__verdict(index.ips.lookup(packed), index.ip_whitelist)
+
+    def check_usb(self, vendor, product):
+        index = self.__index
+        vendor, product = vendor.lower(), product.lower()
+        rule = index.usb.get((vendor, product)) or index.usb.get((vendor, "*"))
+        return self.__verdict(rule, index.usb_whitelist)
+
+    def audit_ssh(self, rows):
+        """Нарушения по строкам отчёта get_ssh_ip_list (словари с ключом ip)"""
+        self.reload()
+        for row in rows:
+            verdict = self.check_ip(row["ip"])
+            if verdict is not None:
+                yield Violation("ssh", row["ip"], *verdict, row)
+
+    def audit_usb(self, rows):
+        """
+        Нарушения по строкам отчёта get_usb_list (словари с ключами idVendor, idProduct).
+        Проверяются только подключения: отключение того же устройства - не второе нарушение,
+        а у отключения без подключения в окне отчёта устройство неизвестно
+        """
+        self.reload()
+        for row in rows:
+            if row.get("action", "attach") != "attach" or not row["idVendor"] or not row["idProduct"]:
+                continue
+            verdict = self.check_usb(row["idVendor"], row["idProduct"])
+            if verdict is not None:
+                yield Violation("usb", f"{row['idVendor']}:{row['idProduct']}", *verdict, row)
+
+
+def read_report(path):
+    """Отчёт get_ssh_ip_list или get_usb_list в формате CSV или JSON (по расширению файла)"""
+    with open(path, newline="") as f:
+        if path.endswith(".json"):
+            return json.load(f)
+        return list(csv.DictReader(f))
+
+
+def main():
+    """
+    Проверка отчётов get_ssh_ip_list и get_usb_list по белым и чёрным спискам.
+    Нарушения выводятся по одному JSON-объекту в строке.
+    """
+    logging.debug(f"Начало {main.__name__}()")
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--ip-whitelist", help="файл разрешённых адресов и сетей CIDR")
+    parser.add_argument("--ip-blacklist", help="файл запрещённых адресов и сетей CIDR")
+    parser.add_argument("--usb-whitelist", help="файл разрешённых устройств idVendor:idProduct")
+    parser.add_argument("--usb-blacklist", help="файл запрещённых устройств idVendor:idProduct")
+    parser.add_argument("--ssh", help="отчёт get_ssh_ip_list (ssh_ip_list.csv или .json)")
+    parser.add_argument("--usb", help="отчёт get_usb_list (usb_devs.csv или .json)")
+    parser.add_argument("--output", default="violations.jsonl", help="файл нарушений, '-' - стандартный вывод")
+    args = parser.parse_args()
+
+    policy = Policy(args.ip_whitelist, args.ip_blacklist, args.usb_whitelist, args.usb_blacklist)
+    violations = []
+    if args.ssh:
+        violations += policy.audit_ssh(read_report(args.ssh))
+    if args.usb:
+        violations += policy.audit_usb(read_report(args.usb))
+    lines = [json.dumps(violation._asdict(), ensure_ascii=False) + "\n" for violation in violations]
+    if args.output == "-":
+        print("".join(lines), end="")
+    else:
+        with open(args.output, "w") as f:
+            f.writelines(lines)
+    logging.debug(f"Конец {main.__name__}(): нарушений {len(violations)}")
+
+
+if __name__ == "__main__":
+    logging.debug(f"Начало работы скрипта {os.path.basename(__file__)}")
+    main()
+    logging.debug(f"Конец работы скрипта {os.path.basename(__file__)}")
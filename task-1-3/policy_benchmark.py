@@ -0,0 +1,65 @@
+"""
+Бенчмарк проверки по спискам: поиск адреса в PrefixTrie и USB-устройства в словаре
+при разном числе правил против перебора сетей ipaddress.
+
+Запуск:
+    python policy_benchmark.py
+    python policy_benchmark.py --rules 1000 10000 100000 1000000 --lookups 500000
+"""
+import time
+import random
+import argparse
+import ipaddress
+
+from policy import PrefixTrie, Rule, pack_ip, DENY
+
+
+def random_networks(count, rnd):
+    networks = []
+    for _ in range(count):
+        length = rnd.choice((8, 12, 16, 20, 22, 24, 24, 24, 28, 32, 32))
+        address = ipaddress.IPv4Address(rnd.getrandbits(32))
+        networks.append(ipaddress.ip_network(f"{address}/{length}", strict=False))
+    return networks
+
+
+def measure(name, function, items):
+    start = time.perf_counter()
+    found = sum(1 for item in items if function(item) is not None)
+    elapsed = time.perf_counter() - start
+    print(f"{name:40} {len(items) / elapsed:12,.0f} проверок/с  ({elapsed * 1e6 / len(items):.2f} мкс, "
+          f"совпадений {found})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rules", type=int, nargs="+", default=[1000, 10000, 100000, 300000])
+    parser.add_argument("--lookups", type=int, default=200000)
+    parser.add_argument("--linear-lookups", type=int, default=200, help="проверок для перебора сетей")
+    args = parser.parse_args()
+
+    rnd = random.Random(1)
+    addresses = [str(ipaddress.IPv4Address(rnd.getrandbits(32))) for _ in range(args.lookups)]
+    packed = [pack_ip(address) for address in addresses]
+    for count in args.rules:
+        networks = random_networks(count, rnd)
+        start = time.perf_counter()
+        trie = PrefixTrie()
+        for network in networks:
+            trie.add(network, Rule(DENY, str(network), ""))
+        print(f"{count:,} сетей: построение {time.perf_counter() - start:.2f} с")
+        measure("  PrefixTrie (адрес в байтах)", trie.lookup, packed)
+        measure("  PrefixTrie + разбор адреса", lambda address: trie.lookup(pack_ip(address)), addresses)
+        sample = [ipaddress.ip_address(address) for address in addresses[:args.linear_lookups]]
+        measure("  перебор сетей ipaddress",
+                lambda address: next((network for network in networks if address in network), None), sample)
+
+        devices = {(f"{rnd.getrandbits(16):04x}", f"{rnd.getrandbits(16):04x}"): Rule(DENY, "", "")
+                   for _ in range(count)}
+        queries = [(f"{rnd.getrandbits(16):04x}", f"{rnd.getrandbits(16):04x}") for _ in range(args.lookups)]
+        measure(f"  USB, {len(devices):,} устройств",
+                lambda ids: devices.get(ids) or devices.get((ids[0], "*")), queries)
+
+
+if __name__ == "__main__":
+    main()
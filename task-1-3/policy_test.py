@@ -0,0 +1,114 @@
+"""
+Тесты проверки по белым и чёрным спискам: наиболее длинный префикс (в том числе не кратный 8 битам,
+/0 и IPv6), приоритет чёрного списка, шаблоны производителя USB и перечитывание изменённых файлов.
+
+Запуск:
+    python -m pytest policy_test.py
+"""
+import os
+
+from policy import Policy
+
+
+def write(path, *lines):
+    path.write_text("".join(line + "\n" for line in lines))
+    return str(path)
+
+
+def test_longest_prefix_wins(tmp_path):
+    policy = Policy(
+            ip_whitelist=write(tmp_path / "ip_allow", "10.0.0.0/8", "192.168.1.0/26", "2001:db8::/32"),
+            ip_blacklist=write(tmp_path / "ip_deny", "10.1.0.0/16", "192.168.1.32/27  # гостевые",
+                               "2001:db8:dead::/48", "10.1.2.3"),
+            )
+    assert policy.check_ip("10.2.3.4") is None
+    assert policy.check_ip("10.1.3.4")[:2] == ("blacklisted", "10.1.0.0/16")
+    # адрес /32 внутри запрещённой /16
+    assert policy.check_ip("10.1.2.3")[:2] == ("blacklisted", "10.1.2.3")
+    # /26 и /27 не кратны 8 битам: граница проходит внутри последнего байта
+    assert policy.check_ip("192.168.1.31") is None
+    assert policy.check_ip("192.168.1.32")[:2] == ("blacklisted", "192.168.1.32/27")
+    assert policy.check_ip("192.168.1.63")[0] == "blacklisted"
+    assert policy.check_ip("192.168.1.64") == ("not_whitelisted", "", "")
+    assert policy.check_ip("2001:db8:1::5") is None
+    assert policy.check_ip("2001:db8:dead::5")[:2] == ("blacklisted", "2001:db8:dead::/48")
+    assert policy.check_ip("2001:db9::1") == ("not_whitelisted", "", "")
+    assert policy.check_ip("example.com") == ("not_an_address", "", "")
+
+
+def test_longer_prefix_added_first_is_kept(tmp_path):
+    policy = Policy(ip_blacklist=write(tmp_path / "ip_deny", "172.16.5.0/24"),
+                    ip_whitelist=write(tmp_path / "ip_allow", "172.16.5.128/25", "172.16.0.0/12"))
+    assert policy.check_ip("172.16.5.200") is None
+    assert policy.check_ip("172.16.5.10")[0] == "blacklisted"
+    assert policy.check_ip("172.17.0.1") is None
+
+
+def test_default_route_and_blacklist_precedence(tmp_path):
+    policy = Policy(ip_whitelist=write(tmp_path / "ip_allow", "0.0.0.0/0", "203.0.113.7", "::/0"),
+                    ip_blacklist=write(tmp_path / "ip_deny", "203.0.113.7", "198.51.100.0/24"))
+    assert policy.check_ip("8.8.8.8") is None
+    assert policy.check_ip("2a00::1") is None
+    # адрес в обоих списках запрещён
+    assert policy.check_ip("203.0.113.7")[:2] == ("blacklisted", "203.0.113.7")
+    assert policy.check_ip("198.51.100.9")[0] == "blacklisted"
+
+    policy = Policy(ip_blacklist=write(tmp_path / "ip_deny_all", "0.0.0.0/0"),
+                    ip_whitelist=write(tmp_path / "ip_allow_one", "10.0.0.1"))
+    assert policy.check_ip("10.0.0.1") is None
+    assert policy.check_ip("10.0.0.2")[0] == "blacklisted"
+    # без белого списка адрес, не попавший в чёрный, разрешён
+    assert Policy(ip_blacklist=str(tmp_path / "ip_deny")).check_ip("2001:db8::1") is None
+
+
+def test_usb_vendor_wildcard(tmp_path):
+    policy = Policy(usb_whitelist=write(tmp_path / "usb_allow", "1d6b:0002", "0781:*", "046D:C52B"),
+                    usb_blacklist=write(tmp_path / "usb_deny", "0781:5567", "1d6b:0002", "bad"))
+    assert policy.check_usb("0781", "5581") is None
+    assert policy.check_usb("0781", "5567")[:2] == ("blacklisted", "0781:5567")
+    assert policy.check_usb("1d6b", "0002")[0] == "blacklisted"
+    assert policy.check_usb("046d", "c52b") is None
+    assert policy.check_usb("05ac", "12a8") == ("not_whitelisted", "", "")
+
+    policy = Policy(usb_blacklist=write(tmp_path / "usb_deny_vendor", "05ac:*"),
+                    usb_whitelist=write(tmp_path / "usb_allow_one", "05ac:12a8"))
+    # пара точнее производителя
+    assert policy.check_usb("05AC", "12A8") is None
+    assert policy.check_usb("05ac", "0001")[:2] == ("blacklisted", "05ac:*")
+
+
+def test_audit_rows(tmp_path):
+    policy = Policy(ip_blacklist=write(tmp_path / "ip_deny", "10.0.0.0/8"),
+                    usb_whitelist=write(tmp_path / "usb_allow", "0781:*"))
+    ssh = list(policy.audit_ssh([{"ip": "10.1.1.1"}, {"ip": "192.168.0.1"}]))
+    assert [(violation.kind, violation.subject, violation.reason) for violation in ssh] == [
+        ("ssh", "10.1.1.1", "blacklisted")]
+    usb = list(policy.audit_usb([
+            {"action": "attach", "idVendor": "0781", "idProduct": "5567"},
+            {"action": "attach", "idVendor": "05ac", "idProduct": "12a8"},
+            {"action": "detach", "idVendor": "05ac", "idProduct": "12a8"},
+            {"action": "detach", "idVendor": "", "idProduct": ""},
+            ]))
+    assert [(violation.subject, violation.reason) for violation in usb] == [("05ac:12a8", "not_whitelisted")]
+
+
+def test_reload_on_mtime(tmp_path):
+    path = write(tmp_path / "ip_deny", "10.0.0.0/8")
+    policy = Policy(ip_blacklist=path, check_interval=0)
+    assert policy.check_ip("10.0.0.1")[0] == "blacklisted"
+    assert not policy.reload()
+
+    write(tmp_path / "ip_deny", "192.168.0.0/16")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert list(policy.audit_ssh([{"ip": "10.0.0.1"}])) == []
+    assert policy.check_ip("192.168.3.3")[0] == "blacklisted"
+
+    # до истечения check_interval файлы не проверяются
+    policy.check_interval = 3600
+    write(tmp_path / "ip_deny", "10.0.0.0/8")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2_000_000_000))
+    assert not policy.reload()
+    assert policy.check_ip("10.0.0.1") is None
+    assert policy.reload(force=True)
+    assert policy.check_ip("10.0.0.1")[0] == "blacklisted"
@@ -0,0 +1,140 @@
+"""
+Бенчмарк разбора журнала ядра (строк в секунду): прежняя check_usb_devs
+(регулярное выражение окна дат и поиск idVendor/idProduct на каждую строку)
+против однопроходного usb_events. Журнал генерируется за сегодняшний день
+в формате short (для прежней функции) и short-iso.
+
+Запуск:
+    python usb_benchmark.py
+    python usb_benchmark.py --lines 3000000 --usb-ratio 0.01
+"""
+import os
+import time
+import random
+import logging
+import argparse
+import calendar
+import datetime
+import tempfile
+
+# прежняя функция писала logging.debug на каждую найденную строку - в замере отключено
+logging.disable(logging.DEBUG)
+
+from get_usb_list import usb_events, patterns
+
+NOISE = [
+        "audit: type=1400 audit(1726816860.512:77): apparmor=\"STATUS\" operation=\"profile_replace\"",
+        "EXT4-fs (sda1): re-mounted. Opts: errors=remount-ro. Quota mode: none.",
+        "IPv6: ADDRCONF(NETDEV_CHANGE): eth0: link becomes ready",
+        "[UFW BLOCK] IN=eth0 OUT= MAC=00:00 SRC=10.0.0.5 DST=10.0.0.1 LEN=40 PROTO=TCP SPT=443 DPT=5353",
+        ]
+
+DEVICE = [
+        "usb {port}: new high-speed USB device number {number} using xhci_hcd",
+        "usb {port}: New USB device found, idVendor={vendor}, idProduct={product}, bcdDevice= 1.00",
+        "usb {port}: New USB device strings: Mfr=1, Product=2, SerialNumber=3",
+        "usb {port}: Product: Flash Disk",
+        "usb {port}: Manufacturer: Generic",
+        "usb {port}: SerialNumber: {serial}",
+        "usb {port}: USB disconnect, device number {number}",
+        ]
+
+
+def get_days_in_month(month_name):
+    """Прежняя get_days_in_month"""
+    month_days = {"Jan": 31, "Feb": None, "Mar": 31, "Apr": 30, "May": 31, "Jun": 30,
+                  "Jul": 31, "Aug": 31, "Sep": 30, "Oct": 31, "Nov": 30, "Dec": 31}
+    year = datetime.datetime.now().year
+    month_days["Feb"] = 29 if calendar.isleap(year) else 28
+    return month_days[month_name]
+
+
+def check_usb_devs(read_file, write_file):
+    """Прежняя check_usb_devs"""
+    dt = datetime.datetime.now()
+    month, day = dt.strftime("%b"), dt.day
+    main_info = set()
+    mod = get_days_in_month(month)
+    template = patterns.usb_days(month, (day, (day - 1) % mod, (day - 2) % mod))
+    with open(read_file, "r") as read_f:
+        with open(write_file, 'w') as write_f:
+            for _, line in enumerate(read_f, start=1):
+                line = line.strip()
+                try:
+                    line = template.search(line)
+                    logging.debug(line.groups())
+                    gps = line.groups()
+                    month_, day_, time_, line = gps[0], gps[1], gps[-2], gps[-1]
+                    _, idVendor_, _, idProduct_ = patterns.USB_IDS.search(line).groups()
+                    tpl = (month_, day_, time_, idVendor_, idProduct_)
+                    logging.debug(tpl)
+                    if tpl not in main_info:
+                        main_info.add(tpl)
+                except AttributeError:
+                    continue
+            if main_info:
+                for tpl in sorted(main_info, key=lambda tpl: (tpl[1], tpl[2])):
+                    write_f.write(f"{tpl[0]}-{tpl[1]}-{tpl[2]}, {tpl[3]}:{tpl[4]}\n")
+
+
+def generate(short_path, iso_path, lines, usb_ratio, seed=1):
+    """Один и тот же журнал ядра за сегодня в форматах short и short-iso"""
+    rnd = random.Random(seed)
+    start = datetime.datetime.now().astimezone().replace(hour=0, minute=0, second=0, microsecond=0)
+    step = (datetime.datetime.now().astimezone() - start) / lines
+    with open(short_path, "w") as short_f, open(iso_path, "w") as iso_f:
+        written = 0
+        number = 0
+        while written < lines:
+            moment = start + step * written
+            if rnd.random() < usb_ratio / len(DEVICE):
+                number += 1
+                fields = dict(port=f"{rnd.randint(1, 4)}-{rnd.randint(1, 4)}", number=number,
+                              vendor=f"{rnd.getrandbits(16):04x}", product=f"{rnd.getrandbits(16):04x}",
+                              serial=f"{rnd.getrandbits(48):012X}")
+                messages = [template.format(**fields) for template in DEVICE]
+            else:
+                messages = [rnd.choice(NOISE)]
+            for message in messages:
+                # day без дополнения пробелом - иначе прежнее выражение не находит строки 1-9 числа
+                short_f.write(f"{moment:%b} {moment.day} {moment:%H:%M:%S} host kernel: {message}\n")
+                iso_f.write(f"{moment:%Y-%m-%dT%H:%M:%S%z} host kernel: {message}\n")
+            written += len(messages)
+    return written
+
+
+def measure(name, function, path, lines):
+    start = time.perf_counter()
+    result = function(path)
+    elapsed = time.perf_counter() - start
+    print(f"{name:32} {lines / elapsed:12,.0f} строк/с  ({elapsed:.2f} с){result}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=1000000, help="число строк журнала")
+    parser.add_argument("--usb-ratio", type=float, default=0.05, help="доля строк о USB-устройствах")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    short_path, iso_path, output = (os.path.join(directory, name) for name in ("short.log", "iso.log", "out.txt"))
+    try:
+        lines = generate(short_path, iso_path, args.lines, args.usb_ratio)
+        since = datetime.datetime.now().astimezone() - datetime.timedelta(days=3)
+
+        def new(path):
+            with open(path) as f:
+                events = list(usb_events(f, since))
+            return f", событий {len(events)}"
+
+        measure("check_usb_devs (было)", lambda path: check_usb_devs(path, output) or "", short_path, lines)
+        measure("usb_events", new, iso_path, lines)
+    finally:
+        for path in (short_path, iso_path, output):
+            if os.path.exists(path):
+                os.remove(path)
+        os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    main()